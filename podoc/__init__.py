@@ -11,17 +11,11 @@
 import logging
 import os
 import os.path as op
-import subprocess
 import sys
 
-import pytest
-
 from .core import Podoc  # noqa
 from .plugin import (IPlugin, discover_plugins,
                      get_plugin, get_plugins)  # noqa
-from .ast import ASTPlugin
-from .markdown import MarkdownPlugin
-from .notebook import NotebookPlugin
 
 
 #------------------------------------------------------------------------------
@@ -29,30 +23,70 @@ from .notebook import NotebookPlugin
 #------------------------------------------------------------------------------
 
 def _git_version():
-    curdir = os.getcwd()
+    import subprocess
     filedir, _ = op.split(__file__)
-    os.chdir(filedir)
     try:
-        fnull = open(os.devnull, 'w')
-        version = ('-git-' + subprocess.check_output(
-                   ['git', 'describe', '--abbrev=8', '--dirty',
-                    '--always', '--tags'],
-                   stderr=fnull).strip().decode('ascii'))
+        with open(os.devnull, 'w') as fnull:
+            version = ('-git-' + subprocess.check_output(
+                       ['git', 'describe', '--abbrev=8', '--dirty',
+                        '--always', '--tags'],
+                       cwd=filedir, stderr=fnull).strip().decode('ascii'))
         return version
     except (OSError, subprocess.CalledProcessError):  # pragma: no cover
         return ""
-    finally:
-        os.chdir(curdir)
 
 
 __author__ = 'Cyrille Rossant'
 __email__ = 'cyrille.rossant at gmail.com'
 __version__ = '0.1.0.dev0'
-__version_git__ = __version__ + _git_version()
 
 
-# Set a null handler on the root logger
-logger = logging.getLogger()
+_version_git = []
+
+
+def get_version_git():
+    """Return the version of podoc with the git revision, running git the
+    first time only."""
+    if not _version_git:
+        _version_git.append(__version__ + _git_version())
+    return _version_git[0]
+
+
+# Plugin classes exported by the package, with their module. They are only
+# imported when they are first accessed, since their modules import heavy
+# dependencies.
+_PLUGIN_MODULES = {
+    'ASTPlugin': '.ast',
+    'MarkdownPlugin': '.markdown',
+    'NotebookPlugin': '.notebook',
+}
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # NOTE: git only runs when `podoc.__version_git__` is first
+        # accessed, not at import time.
+        if name == '__version_git__':
+            version = globals()['__version_git__'] = get_version_git()
+            return version
+        if name in _PLUGIN_MODULES:
+            from importlib import import_module
+            module = import_module(_PLUGIN_MODULES[name], __name__)
+            plugin = globals()[name] = getattr(module, name)
+            return plugin
+        raise AttributeError("module {!r} has no attribute {!r}".format(
+                             __name__, name))
+else:  # pragma: no cover
+    # NOTE: module-level `__getattr__()` requires Python 3.7+.
+    __version_git__ = get_version_git()
+    from .ast import ASTPlugin
+    from .markdown import MarkdownPlugin
+    from .notebook import NotebookPlugin
+
+
+# Set a null handler on the podoc logger, the parent of the loggers of all
+# podoc modules.
+logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 logger.addHandler(logging.NullHandler())
 
@@ -92,4 +126,5 @@ add_default_handler('DEBUG' if DEBUG else 'INFO')
 
 def test():  # pragma: no cover
     """Run the full testing suite of podoc."""
+    import pytest
     pytest.main()
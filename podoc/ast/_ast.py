@@ -14,9 +14,10 @@ import re
 
 from six import string_types
 
-from podoc.tree import Node, TreeTransformer
-from podoc.plugin import IPlugin
-from podoc.utils import (has_pandoc, pandoc, get_pandoc_formats,
+from podoc.pandoc_server import pandoc_convert
+from podoc.tree import CompactNode, TreeTransformer, build_tree
+from podoc.plugin import IPlugin, ast_plugin
+from podoc.utils import (get_pandoc_info,
                          _merge_str, _get_file, assert_equal,)
 
 logger = logging.getLogger(__name__)
@@ -83,7 +84,17 @@ NATIVE_NAMES = BLOCK_NAMES + INLINE_NAMES + (
 )
 
 
-class ASTNode(Node):
+class ASTNode(CompactNode):
+    """Node of the podoc AST.
+
+    The fields of the native node types have their own slot, so that large
+    documents take as little memory as possible.
+
+    """
+    _fields = ('level', 'url', 'lang', 'start', 'bullet_char', 'delimiter',
+               'style')
+    __slots__ = _fields
+
     def is_block(self):
         return self.name in BLOCK_NAMES
 
@@ -152,6 +163,8 @@ def _split_spaces(text):
 
 
 class PodocToPandocPreProcessor(TreeTransformer):
+    iterative = True
+
     def transform_Node(self, node):
         """Call the transformation methods recursively."""
         children = self.transform_children(node)
@@ -160,6 +173,9 @@ class PodocToPandocPreProcessor(TreeTransformer):
 
 
 class PodocToPandoc(TreeTransformer):
+    iterative = True
+    leaves = ('MathBlock', 'CodeBlock', 'Code', 'Math')
+
     def transform_Node(self, node):
         if node.is_native():
             return _node_dict(node,
@@ -235,6 +251,19 @@ class PodocToPandoc(TreeTransformer):
         blocks = self.transform(ast)['c']
         return [{'unMeta': {}}, blocks]
 
+    def iter_blocks(self, blocks):
+        """Convert a stream of top-level podoc blocks into a stream of
+        pandoc blocks."""
+        pre = PodocToPandocPreProcessor()
+        for block in blocks:
+            out = self.transform(pre.transform(block))
+            # NOTE: unknown nodes are replaced by the list of their children.
+            if isinstance(out, list):
+                for _ in out:
+                    yield _
+            else:
+                yield out
+
 
 #------------------------------------------------------------------------------
 # pandoc -> AST
@@ -244,7 +273,15 @@ def ast_from_pandoc(d, **kwargs):
     return PandocToPodoc(**kwargs).transform_main(d)
 
 
+def _check_pandoc(d):
+    assert isinstance(d, list)
+    assert len(d) == 2
+    assert 'unMeta' in d[0]
+
+
 class PandocToPodocPostProcessor(TreeTransformer):
+    iterative = True
+
     def transform_Node(self, node):
         """Call the transformation methods recursively."""
         children = self.transform_children(node)
@@ -253,6 +290,8 @@ class PandocToPodocPostProcessor(TreeTransformer):
 
 
 class PandocToPodoc(TreeTransformer):
+    iterative = True
+
     def __init__(self, bullet_char=None):
         super(TreeTransformer, self).__init__()
         self.bullet_char = bullet_char or '*'
@@ -263,35 +302,53 @@ class PandocToPodoc(TreeTransformer):
     def get_node_children(self, node):
         return node['c']
 
-    def set_next_child(self, child, next_child):
-        pass
-
     def transform_main(self, obj):
-        assert isinstance(obj, list)
         # Check that this is really the root.
-        assert len(obj) == 2
-        assert 'unMeta' in obj[0]
+        _check_pandoc(obj)
         # Special case: the root.
         # Process the root: obj is a list, and the second item
         # is a list of blocks to process.
-        children = [self.transform(block) for block in obj[1]]
-        out = ASTNode('root', children=children)
-        out = PandocToPodocPostProcessor().transform(out)
-        return out
-
-    def transform(self, d):
+        # NOTE: `iter_blocks()` consumes the list, so we pass a copy.
+        return ASTNode('root', children=list(self.iter_blocks(list(obj[1]))))
+
+    def iter_blocks(self, blocks):
+        """Convert a list of pandoc blocks into a stream of top-level podoc
+        blocks.
+
+        NOTE: the list is consumed, so that the pandoc blocks can be
+        garbage-collected as soon as they have been converted.
+
+        """
+        post = PandocToPodocPostProcessor()
+        blocks.reverse()
+        while blocks:
+            yield post.transform(self.transform(blocks.pop()))
+
+    def _expand(self, d):
+        """Create the node of a pandoc node, and return it with the list of
+        its non-processed children, or with None if the output is
+        complete."""
         if isinstance(d, string_types):
-            return d
+            return d, None
         c = self.get_node_children(d)
         node = ASTNode(self.get_node_name(d))
         children = self.get_transform_func(d)(c, node)
         if isinstance(children, string_types):
-            return children
+            return children, None
         assert isinstance(children, list)
-        # Recursively transform all children and assign them to the node.
-        node.children = [self.transform(child) for child in children]
+        return node, children
+
+    def _finish(self, node, children):
         # Merge consecutive strings in the list of children.
-        node.children = _merge_str(node.children)
+        node.children = _merge_str(children)
+
+    def transform(self, d):
+        if self.iterative:
+            return build_tree(d, self._expand, self._finish)
+        node, children = self._expand(d)
+        if children is not None:
+            # Recursively transform all children and assign them to the node.
+            self._finish(node, [self.transform(child) for child in children])
         return node
 
     def transform_Node(self, c, node):
@@ -362,20 +419,41 @@ class PandocToPodoc(TreeTransformer):
 # pandoc plugin
 #------------------------------------------------------------------------------
 
+# Declared cost of the pandoc conversion functions, relative to the native
+# ones: every conversion starts a pandoc subprocess.
+PANDOC_COST = 10.
+
+
 class PandocPlugin(IPlugin):
+    @property
+    def pandoc_info(self):
+        """Version and formats of pandoc, looked up once per plugin
+        instance."""
+        if '_pandoc_info' not in self.__dict__:
+            self._pandoc_info = get_pandoc_info()
+        return self._pandoc_info
+
+    @property
+    def version(self):
+        info = self.pandoc_info
+        return info.version if info else None
+
     def attach(self, podoc):
-        if not has_pandoc():  # pragma: no cover
+        # NOTE: the pandoc formats are cached on disk, so that pandoc only
+        # runs when one of its conversion functions is used.
+        info = self.pandoc_info
+        if info is None:  # pragma: no cover
             logger.debug("pandoc is not available.")
             return
 
-        source_langs, target_langs = get_pandoc_formats()
+        source_langs, target_langs = info.input_formats, info.output_formats
 
         # From pandoc source formats to AST.
         def _make_source_func(lang):
             def conv(doc):
                 """Convert a document from `lang` to the podoc AST, via
                 pandoc."""
-                d = pandoc(doc, 'json', format=lang)
+                d = pandoc_convert(doc, 'json', format=lang)
                 # Convert the
                 ast = ast_from_pandoc(json.loads(d))
                 return ast
@@ -387,7 +465,8 @@ class PandocPlugin(IPlugin):
             #     continue
             func = _make_source_func(source)
             podoc.register_lang(source, pandoc=True)
-            podoc.register_func(source=source, target='ast', func=func)
+            podoc.register_func(source=source, target='ast', func=func,
+                                cost=PANDOC_COST)
 
         # From AST to pandoc target formats.
         def _make_target_func(lang):
@@ -395,7 +474,7 @@ class PandocPlugin(IPlugin):
                 """Convert a document from the podoc AST to `lang`, via
                 pandoc."""
                 d = json.dumps(ast.to_pandoc())
-                out = pandoc(d, lang, format='json')
+                out = pandoc_convert(d, lang, format='json')
                 return out
             return conv
 
@@ -405,7 +484,8 @@ class PandocPlugin(IPlugin):
             #     continue
             func = _make_target_func(target)
             podoc.register_lang(target, pandoc=True)
-            podoc.register_func(source='ast', target=target, func=func)
+            podoc.register_func(source='ast', target=target, func=func,
+                                cost=PANDOC_COST)
 
 
 #------------------------------------------------------------------------------
@@ -415,12 +495,7 @@ class PandocPlugin(IPlugin):
 class ASTPlugin(IPlugin):
     """The file format is JSON, same as the pandoc json format."""
     def attach(self, podoc):
-        # An object in the language 'ast' is an instance of AST.
-        podoc.register_lang('ast', file_ext='.json',
-                            load_func=self.load, dump_func=self.dump,
-                            loads_func=self.loads, dumps_func=self.dumps,
-                            assert_equal_func=self.assert_equal,
-                            )
+        ast_plugin.attach(podoc, plugin=self)
 
     def load(self, file_or_path):
         """Load a JSON file and return an AST instance."""
@@ -462,3 +537,44 @@ class ASTPlugin(IPlugin):
 
     def assert_equal(self, ast0, ast1):
         return assert_equal(ast0, ast1, to_remove=('_visit_meta',))
+
+    # Streaming methods
+    # -------------------------------------------------------------------------
+
+    def iter_blocks(self, ast):
+        """Return the stream of top-level blocks of an AST."""
+        assert isinstance(ast, ASTNode)
+        return iter(ast.children)
+
+    def join_blocks(self, blocks):
+        """Build an AST from a stream of top-level blocks."""
+        return ASTNode('root', children=list(blocks))
+
+    def load_blocks(self, file_or_path):
+        """Load a JSON file and yield its top-level blocks one by one."""
+        with _get_file(file_or_path, 'r') as f:
+            d = json.load(f)
+        _check_pandoc(d)
+        blocks = d[1]
+        del d
+        for block in PandocToPodoc().iter_blocks(blocks):
+            yield block
+
+    def dump_blocks(self, blocks, file_or_path):
+        """Write a stream of top-level blocks to a JSON file, one by one.
+
+        The output is identical to the output of `dump()`.
+
+        """
+        kwargs = dict(sort_keys=True, indent=2, separators=(',', ': '))
+        # NOTE: the blocks are in a list nested in the root list.
+        indent = ' ' * 4
+        with _get_file(file_or_path, 'w') as f:
+            f.write('[\n  {\n    "unMeta": {}\n  },\n  [')
+            n = 0
+            for d in PodocToPandoc().iter_blocks(blocks):
+                f.write(',\n' if n else '\n')
+                f.write('\n'.join(indent + line for line in
+                                  json.dumps(d, **kwargs).splitlines()))
+                n += 1
+            f.write('\n  ]\n]\n' if n else ']\n]\n')
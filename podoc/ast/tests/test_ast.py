@@ -8,12 +8,15 @@
 #------------------------------------------------------------------------------
 
 import json
+import sys
 
 from pytest import fixture
 
-from .._ast import (ASTNode, ast_from_pandoc,
-                    _merge_str, _split_spaces)
+from .. import _ast
+from .._ast import (ASTNode, ast_from_pandoc, PodocToPandoc, PandocToPodoc,
+                    PandocPlugin, _merge_str, _split_spaces)
 from podoc.core import Podoc
+from podoc.tree import Node
 from podoc.utils import has_pandoc, pandoc, PANDOC_MARKDOWN_FORMAT
 
 
@@ -72,6 +75,20 @@ def test_repr_ast():
     assert str(ASTNode('Para')) == '[{"unMeta":{}},[]]'
 
 
+def test_ast_node_compact():
+    node = ASTNode('Header', children=['hello'], level=2)
+    assert node.display() == 'Header 2'
+    assert node == Node('Header', children=['hello'], level=2)
+    # The fields of the native node types have their own slot.
+    assert not hasattr(node, '__dict__')
+    assert node._extra is None
+    node = ASTNode('Image', url='a.png')
+    assert node.display() == 'Image <a.png>'
+    assert node._extra is None
+    assert (node.size_info().memory <
+            Node('Image', url='a.png').size_info().memory)
+
+
 def test_merge_str():
     assert _merge_str(['a', 'b', None, 'c']) == ['ab', None, 'c']
 
@@ -89,6 +106,29 @@ def test_from_pandoc(ast, ast_pandoc):
     assert ast_from_pandoc(ast_pandoc) == ast
 
 
+def test_pandoc_iterative(ast, ast_pandoc):
+    to_pandoc = PodocToPandoc()
+    to_pandoc.iterative = False
+    assert PodocToPandoc().transform_main(ast) == to_pandoc.transform_main(ast)
+    from_pandoc = PandocToPodoc()
+    from_pandoc.iterative = False
+    assert (PandocToPodoc().transform_main(ast_pandoc) ==
+            from_pandoc.transform_main(ast_pandoc))
+
+
+def test_pandoc_deep():
+    depth = 2 * sys.getrecursionlimit()
+    node = ASTNode('Para', children=['hello'])
+    for _ in range(depth):
+        node = ASTNode('BlockQuote', children=[node])
+    d = PodocToPandoc().transform_main(ASTNode('root', children=[node]))
+    node = PandocToPodoc().transform_main(d).children[0]
+    for _ in range(depth):
+        assert node.name == 'BlockQuote'
+        node = node.children[0]
+    assert node == ASTNode('Para', children=['hello'])
+
+
 def test_unknown_node():
     ast = ASTNode('root')
     ast.add_child(ASTNode('Para'))
@@ -179,3 +219,16 @@ def test_pandoc_math():
     _test_pandoc_ast('$x=y$')
     _test_pandoc_ast('$$x=y$$')
     _test_pandoc_ast(r'$$\begin{eqnarray}\nx &= y\n\end{eqnarray}$$')
+
+
+def test_pandoc_plugin_info(monkeypatch):
+    calls = []
+
+    def get_pandoc_info():
+        calls.append(None)
+
+    monkeypatch.setattr(_ast, 'get_pandoc_info', get_pandoc_info)
+    plugin = PandocPlugin()
+    assert plugin.version is None
+    plugin.attach(Podoc(plugins=[], with_pandoc=False))
+    assert len(calls) == 1
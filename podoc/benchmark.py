@@ -0,0 +1,522 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of the conversion functions on synthetic documents."""
+
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+
+from collections import OrderedDict
+import json
+import logging
+import math
+import os.path as op
+import random
+import subprocess
+import sys
+from timeit import default_timer
+
+import click
+
+from .cache import _copy
+from .core import Podoc, _graph_from_edges, _shortest_routes
+from .profiling import get_size
+from .tree import show_tree
+from .utils import Bunch, get_cache_dir, load_text, _write_atomic, _merge_str
+
+logger = logging.getLogger(__name__)
+
+
+#------------------------------------------------------------------------------
+# Synthetic corpus
+#------------------------------------------------------------------------------
+
+# Shapes of the synthetic documents: keyword arguments of
+# `generate_markdown()`.
+SHAPES = {
+    'mixed': dict(),
+    'lists': dict(list_depth=6, list_items=4, code_lines=0, n_images=0,
+                  n_math=0),
+    'code': dict(list_depth=0, code_lines=200, n_images=0, n_math=0),
+    'images': dict(list_depth=0, code_lines=0, n_images=20, n_math=0),
+    'math': dict(list_depth=0, code_lines=0, n_images=0, n_math=20),
+}
+
+_WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+          'eiusmod tempor incididunt ut labore et dolore magna aliqua').split()
+
+
+def _sentence(rng, n_words=12):
+    words = [rng.choice(_WORDS) for _ in range(n_words)]
+    # Add some inline formatting.
+    i = rng.randrange(n_words)
+    words[i] = '*{}*'.format(words[i])
+    j = rng.randrange(n_words)
+    if j != i:
+        words[j] = '**{}**'.format(words[j])
+    return ' '.join(words).capitalize() + '.'
+
+
+def _list(rng, depth, n_items, level=0):
+    lines = []
+    for i in range(n_items):
+        bullet = '*' if (level % 2 == 0) else '{}.'.format(i + 1)
+        lines.append('   ' * level + bullet + ' ' + _sentence(rng, 6))
+        if level + 1 < depth and i == 0:
+            lines.extend(_list(rng, depth, n_items, level + 1))
+    return lines
+
+
+def _code(rng, n_lines):
+    lines = ['x{} = {} * {}'.format(i, rng.randrange(100), rng.randrange(100))
+             for i in range(n_lines)]
+    return '```python\n{}\n```'.format('\n'.join(lines))
+
+
+def _math(rng):
+    a, b = rng.randrange(10), rng.randrange(10)
+    return ('Inline math ${}_{} x^{} + \\alpha$ in a sentence.\n\n'
+            '$$\\int_{}^{} f(x) dx = \\sum_i x_i^2$$'.format(a, b, a, a, b))
+
+
+def generate_markdown(n_sections=10, paragraphs=3, list_depth=3,
+                      list_items=3, code_lines=20, n_images=2, n_math=2,
+                      seed=0):
+    """Generate a synthetic Markdown document.
+
+    Parameters
+    ----------
+
+    n_sections : int
+        Number of sections, each starting with a header.
+    paragraphs : int
+        Number of paragraphs per section.
+    list_depth : int
+        Depth of the nested list in every section, or 0 for no list.
+    list_items : int
+        Number of items per list level.
+    code_lines : int
+        Number of lines of the code block in every section, or 0 for none.
+    n_images : int
+        Number of images per section.
+    n_math : int
+        Number of inline and display equations per section.
+    seed : int
+        Seed of the random generator: the same arguments always generate
+        the same document.
+
+    """
+    rng = random.Random(seed)
+    blocks = []
+    for s in range(n_sections):
+        blocks.append('## Section {}'.format(s + 1))
+        for _ in range(paragraphs):
+            blocks.append(' '.join(_sentence(rng) for _ in range(4)))
+        if list_depth:
+            blocks.append('\n'.join(_list(rng, list_depth, list_items)))
+        if code_lines:
+            blocks.append(_code(rng, code_lines))
+            # NOTE: images right after a Python code block would become the
+            # outputs of a notebook code cell.
+            blocks.append(_sentence(rng))
+        for i in range(n_images):
+            blocks.append('![Figure {}](image_{}_{}.png)'.format(i, s, i))
+        for _ in range(n_math):
+            blocks.append(_math(rng))
+    return '\n\n'.join(blocks) + '\n'
+
+
+def generate_corpus(podoc=None, shape='mixed', size=1, seed=0, **kwargs):
+    """Generate a synthetic document in all languages that can be reached
+    from Markdown.
+
+    The size is the number of sections, in multiples of 10. The other
+    keyword arguments of `generate_markdown()` override the shape. The
+    languages whose conversion from the AST fails are skipped.
+
+    Returns
+    -------
+
+    corpus : dict
+        Mapping `lang => document`.
+
+    """
+    podoc = podoc or Podoc(with_pandoc=False)
+    kwargs = dict(SHAPES[shape], **kwargs)
+    kwargs['n_sections'] = 10 * size
+    md = generate_markdown(seed=seed, **kwargs)
+    corpus = {'markdown': md}
+    ast = corpus['ast'] = podoc.convert(md, source='markdown', target='ast')
+    for lang in podoc.get_target_languages('ast'):
+        if lang in corpus:
+            continue
+        try:
+            corpus[lang] = podoc.convert(_copy(ast), source='ast',
+                                         target=lang)
+        except Exception as e:
+            logger.warning("Conversion `ast -> %s` failed: %s %s.",
+                           lang, e.__class__.__name__, e)
+    return corpus
+
+
+#------------------------------------------------------------------------------
+# Benchmarks
+#------------------------------------------------------------------------------
+
+def _n_blocks(corpus):
+    return len(corpus['ast'].children)
+
+
+def _time(func, obj, repeat):
+    """Return the best time of several calls of a function on copies of an
+    object."""
+    best = None
+    for _ in range(repeat):
+        # NOTE: a conversion function may modify its input.
+        arg = _copy(obj)
+        t = default_timer()
+        func(arg)
+        elapsed = default_timer() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_edges(podoc=None, corpus=None, repeat=3, pairs=None):
+    """Time every conversion function on a synthetic corpus.
+
+    Edges whose source language is not in the corpus, and failing
+    conversions, are skipped.
+
+    Returns
+    -------
+
+    results : dict
+        Mapping `source->target => Bunch(size, blocks, time, mb_per_s,
+        blocks_per_s)`. The time is the best of `repeat` runs, in seconds.
+
+    """
+    podoc = podoc or Podoc(with_pandoc=False)
+    corpus = corpus or generate_corpus(podoc)
+    n_blocks = _n_blocks(corpus)
+    results = {}
+    for source, target in (pairs or podoc.conversion_pairs):
+        if source not in corpus:
+            logger.debug("Skip `%s -> %s`.", source, target)
+            continue
+        obj = corpus[source]
+        pipeline = podoc.compile(lang_list=(source, target))
+        try:
+            t = _time(pipeline, obj, repeat)
+        except Exception as e:
+            logger.warning("Conversion `%s -> %s` failed: %s %s.",
+                           source, target, e.__class__.__name__, e)
+            continue
+        size = get_size(obj)
+        # NOTE: avoid divisions by zero with very small documents.
+        t = max(t, 1e-9)
+        results['{}->{}'.format(source, target)] = Bunch(
+            size=size,
+            blocks=n_blocks,
+            time=t,
+            mb_per_s=size / t / 1e6,
+            blocks_per_s=n_blocks / t,
+        )
+    return results
+
+
+def format_results(results, baseline=None):
+    """Return a table of benchmark results, with the change of the time
+    relative to a baseline."""
+    lines = ['{:<24} {:>10} {:>10} {:>10} {:>12} {:>8}'.format(
+             'edge', 'size', 'time (ms)', 'MB/s', 'blocks/s', 'change')]
+    for edge, r in sorted(results.items()):
+        change = ''
+        if baseline and edge in baseline:
+            change = '{:+.0%}'.format(r.time / baseline[edge]['time'] - 1)
+        lines.append('{:<24} {:>10d} {:>10.2f} {:>10.2f} {:>12.0f} {:>8}'.
+                     format(edge, r.size, r.time * 1000, r.mb_per_s,
+                            r.blocks_per_s, change))
+    return '\n'.join(lines)
+
+
+#------------------------------------------------------------------------------
+# Baselines
+#------------------------------------------------------------------------------
+
+def get_baseline_path(name='baseline'):
+    return op.join(get_cache_dir('benchmarks'), name + '.json')
+
+
+def save_baseline(results, path=None):
+    path = path or get_baseline_path()
+    _write_atomic(json.dumps(results, sort_keys=True, indent=1), path)
+    return path
+
+
+def load_baseline(path=None):
+    """Load saved benchmark results, or return None if there are none."""
+    path = path or get_baseline_path()
+    if not op.exists(path):
+        return
+    return {edge: Bunch(r) for edge, r in json.loads(load_text(path)).items()}
+
+
+def find_regressions(results, baseline, tolerance=.25):
+    """Return the edges that are slower than in the baseline by more than a
+    relative tolerance, as a dict `edge => relative slowdown`."""
+    out = {}
+    for edge, r in results.items():
+        if edge not in baseline:
+            continue
+        slowdown = r.time / baseline[edge]['time'] - 1
+        if slowdown > tolerance:
+            out[edge] = slowdown
+    return out
+
+
+#------------------------------------------------------------------------------
+# Scaling
+#------------------------------------------------------------------------------
+
+# Exponents above this value are reported as superlinear: `n log n` gives
+# exponents around 1.1 on the sizes used here, and quadratic code around 2.
+MAX_EXPONENT = 1.4
+
+# Accepted superlinear measurements, with the reason.
+KNOWN_SUPERLINEAR = {
+    # NOTE: the conversion from the CommonMark tree to the AST is linear.
+    'markdown->ast (depth)': "the CommonMark parser checks all open "
+                             "containers on every line",
+    # NOTE: the size is the size of the input, and these outputs indent
+    # every line by its depth.
+    'ast->markdown (depth)': "the indentation of nested list items makes "
+                             "the output quadratic in the depth",
+    'ast->notebook (depth)': "the indentation of nested list items makes "
+                             "the output quadratic in the depth",
+    'show_tree (depth)': "the prefixes of the lines make the output "
+                         "quadratic in the depth",
+}
+
+
+def fit_exponent(sizes, times):
+    """Return the exponent `k` of the least squares fit of
+    `time = c * size ** k` in log-log scale."""
+    assert len(sizes) == len(times) >= 2
+    xs = [math.log(s) for s in sizes]
+    ys = [math.log(max(t, 1e-9)) for t in times]
+    mx = sum(xs) / len(xs)
+    my = sum(ys) / len(ys)
+    sxx = sum((x - mx) ** 2 for x in xs)
+    assert sxx > 0, "The sizes must not be all equal."
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sxx
+
+
+def measure_scaling(func, inputs, repeat=3, sizes=None):
+    """Time a function on inputs of increasing sizes, and fit its scaling
+    exponent.
+
+    By default, the size of a run is the size of its input.
+
+    Returns
+    -------
+
+    scaling : Bunch
+        With the fields `sizes`, `times` and `exponent`.
+
+    """
+    times = [_time(func, obj, repeat) for obj in inputs]
+    if sizes is None:
+        sizes = [get_size(obj) for obj in inputs]
+    return Bunch(sizes=list(sizes), times=times,
+                 exponent=fit_exponent(sizes, times))
+
+
+def _chain_edges(n):
+    return [('v{}'.format(i), 'v{}'.format(i + 1)) for i in range(n)]
+
+
+def check_scaling(podoc=None, sizes=(1, 2, 4, 8), depths=(4, 8, 16, 32),
+                  repeat=3):
+    """Measure the scaling exponent of all readers and writers of the AST,
+    and of the internal functions used by every conversion.
+
+    The readers and writers run on synthetic documents of increasing size,
+    and on nested lists of increasing depth.
+
+    Returns
+    -------
+
+    scalings : OrderedDict
+        Mapping `name (parameter) => Bunch(sizes, times, exponent)`.
+
+    """
+    podoc = podoc or Podoc(with_pandoc=False)
+    corpora = OrderedDict()
+    corpora['size'] = [generate_corpus(podoc, size=size) for size in sizes]
+    corpora['depth'] = [generate_corpus(podoc, shape='lists', size=1,
+                                        list_depth=depth, list_items=2)
+                        for depth in depths]
+
+    # Functions to measure, as `(name, source language, function)`.
+    funcs = []
+    for source, target in podoc.conversion_pairs:
+        if 'ast' in (source, target):
+            pipeline = podoc.compile(lang_list=(source, target))
+            funcs.append(('{}->{}'.format(source, target), source, pipeline))
+    funcs.append(('show_tree', 'ast', show_tree))
+
+    scalings = OrderedDict()
+    for param, corpus_list in corpora.items():
+        for name, source, func in funcs:
+            if any(source not in corpus for corpus in corpus_list):
+                continue
+            key = '{} ({})'.format(name, param)
+            try:
+                scalings[key] = measure_scaling(
+                    func, [corpus[source] for corpus in corpus_list], repeat)
+            except Exception as e:
+                logger.warning("Scaling of `%s` failed: %s %s.",
+                               key, e.__class__.__name__, e)
+
+    # Internal functions.
+    ns = [1000 * size for size in sizes]
+    scalings['_merge_str'] = measure_scaling(
+        _merge_str, [['abc'] * n for n in ns], repeat, sizes=ns)
+    scalings['_shortest_routes'] = measure_scaling(
+        lambda edges: _shortest_routes(_graph_from_edges(edges), 'v0'),
+        [_chain_edges(n // 10) for n in ns], repeat,
+        sizes=[n // 10 for n in ns])
+    return scalings
+
+
+def find_superlinear(scalings, max_exponent=MAX_EXPONENT,
+                     known=KNOWN_SUPERLINEAR):
+    """Return the functions whose scaling exponent is above a threshold, as
+    a dict `name => exponent`. The known superlinear functions are
+    ignored."""
+    return {name: s.exponent for name, s in scalings.items()
+            if s.exponent > max_exponent and name not in known}
+
+
+def format_scalings(scalings):
+    """Return a table of scaling exponents."""
+    lines = ['{:<40} {:>12} {:>10} {:>10}'.format(
+             'function', 'max size', 'time (ms)', 'exponent')]
+    for name, s in scalings.items():
+        lines.append('{:<40} {:>12d} {:>10.2f} {:>10.2f}'.format(
+                     name, s.sizes[-1], s.times[-1] * 1000, s.exponent))
+    return '\n'.join(lines)
+
+
+#------------------------------------------------------------------------------
+# Startup
+#------------------------------------------------------------------------------
+
+# Modules that must not be imported by `import podoc.cli`: they are only
+# needed by some conversions or by the tests.
+HEAVY_MODULES = ('pytest', 'multiprocessing.pool', 'CommonMark', 'nbformat',
+                 'pypandoc', 'tornado')
+
+_STARTUP_CODE = '''
+import sys
+from timeit import default_timer
+t = default_timer()
+import podoc.cli
+t = default_timer() - t
+import podoc
+print(t)
+print(','.join(sorted(sys.modules)))
+print('__version_git__' in podoc.__dict__)
+'''
+
+
+def measure_startup(repeat=5):
+    """Measure the import time of the podoc CLI in fresh interpreters.
+
+    Returns
+    -------
+
+    startup : Bunch
+        With the fields `time`, the best import time in seconds, `heavy`, the
+        list of heavy modules that were imported, and `git`, whether git was
+        called to get the version.
+
+    """
+    best = None
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', _STARTUP_CODE])
+        t, modules, git = out.decode('ascii').strip().splitlines()
+        best = float(t) if best is None else min(best, float(t))
+    modules = modules.split(',')
+    return Bunch(time=best,
+                 heavy=[m for m in HEAVY_MODULES if m in modules],
+                 git=git == 'True',
+                 )
+
+
+#------------------------------------------------------------------------------
+# CLI
+#------------------------------------------------------------------------------
+
+@click.command()
+@click.option('--shape', default='mixed', type=click.Choice(sorted(SHAPES)),
+              help='Shape of the synthetic documents.')
+@click.option('--size', default=1, type=int,
+              help='Size of the synthetic documents, in tens of sections.')
+@click.option('--repeat', default=3, type=int,
+              help='Number of runs of every conversion.')
+@click.option('--baseline', default=None,
+              help='Path of the baseline file.')
+@click.option('--save', default=False, is_flag=True,
+              help='Save the results as the new baseline.')
+@click.option('--tolerance', default=.25, type=float,
+              help='Relative slowdown reported as a regression.')
+@click.option('--pandoc', default=False, is_flag=True,
+              help='Also benchmark the pandoc conversions.')
+@click.option('--scaling', default=False, is_flag=True,
+              help='Measure the scaling exponents of the readers and writers '
+                   'instead.')
+@click.option('--startup', default=False, is_flag=True,
+              help='Measure the import time of the CLI instead.')
+def benchmark(shape='mixed', size=1, repeat=3, baseline=None, save=False,
+              tolerance=.25, pandoc=False, scaling=False, startup=False):
+    """Benchmark all conversion functions on synthetic documents."""
+    if startup:
+        s = measure_startup(repeat)
+        click.echo('Import time of the CLI: {:.1f} ms.'.format(s.time * 1000))
+        if s.heavy:
+            click.echo('Heavy modules imported: {}.'.format(
+                       ', '.join(s.heavy)))
+        if s.git:
+            click.echo('git was called at import time.')
+        return
+    podoc = Podoc(with_pandoc=pandoc)
+    if scaling:
+        scalings = check_scaling(podoc, repeat=repeat)
+        click.echo(format_scalings(scalings))
+        for name, exponent in sorted(find_superlinear(scalings,
+                                                      known=()).items()):
+            reason = KNOWN_SUPERLINEAR.get(name, None)
+            click.echo('Superlinear: {} scales as n^{:.2f}{}.'.format(
+                       name, exponent,
+                       ' (known: {})'.format(reason) if reason else ''))
+        return
+    corpus = generate_corpus(podoc, shape=shape, size=size)
+    results = benchmark_edges(podoc, corpus, repeat=repeat)
+    # NOTE: the baselines depend on the shape and size of the documents.
+    path = baseline or get_baseline_path('{}-{}'.format(shape, size))
+    previous = load_baseline(path)
+    click.echo(format_results(results, previous))
+    if previous:
+        for edge, slowdown in sorted(find_regressions(
+                results, previous, tolerance).items()):
+            click.echo('Regression: {} is {:.0%} slower.'.format(
+                       edge, slowdown))
+    if save:
+        click.echo('Baseline saved to {}.'.format(save_baseline(results,
+                                                                path)))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    benchmark()
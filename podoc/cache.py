@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+
+"""Conversion caches."""
+
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+
+from collections import OrderedDict
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping  # Python 2
+from contextlib import contextmanager
+from copy import copy, deepcopy
+import hashlib
+import json
+import logging
+import os
+import os.path as op
+import pickle
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # Windows
+
+from six import string_types, binary_type
+
+from .utils import _write_atomic, get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+
+#------------------------------------------------------------------------------
+# Cache keys
+#------------------------------------------------------------------------------
+
+def _dumps_json(obj):
+    """Serialize nested mappings and lists to JSON, with sorted keys and
+    without the private fields.
+
+    The output is the same as `json.dumps(_remove(obj), sort_keys=True,
+    default=repr)`, but the documents are walked with an explicit stack,
+    so that there is no limit on their depth.
+
+    """
+    out = []
+    # Stack of `(is_text, item)`: JSON text to write, or object to
+    # serialize.
+    stack = [(False, obj)]
+    while stack:
+        is_text, item = stack.pop()
+        if is_text:
+            out.append(item)
+        elif isinstance(item, Mapping):
+            keys = sorted(k for k in item if not k.startswith('_'))
+            stack.append((True, '}'))
+            for i in range(len(keys) - 1, -1, -1):
+                stack.append((False, item[keys[i]]))
+                sep = '{' if i == 0 else ', '
+                stack.append((True, sep + json.dumps(keys[i]) + ': '))
+            if not keys:
+                stack.append((True, '{'))
+        elif isinstance(item, (list, tuple)):
+            stack.append((True, ']'))
+            for i in range(len(item) - 1, -1, -1):
+                stack.append((False, item[i]))
+                stack.append((True, '[' if i == 0 else ', '))
+            if not item:
+                stack.append((True, '['))
+        else:
+            out.append(json.dumps(item, default=repr))
+    return ''.join(out)
+
+
+def _serialize(obj):
+    """Serialize a document to bytes."""
+    if isinstance(obj, binary_type):
+        return obj
+    if isinstance(obj, string_types):
+        return obj.encode('utf-8')
+    # NOTE: ASTNode and NotebookNode instances are dictionaries. Private
+    # fields such as `_visit_meta` are not part of the document, and they
+    # hold circular sibling links when a transformer sets `link_siblings`.
+    return _dumps_json(obj).encode('utf-8')
+
+
+def _hash_object(obj):
+    return hashlib.sha1(_serialize(obj)).hexdigest()
+
+
+def cache_key(obj, lang_list, versions=(), resources=None):
+    """Return the cache key of a conversion.
+
+    The key is a hash of the input document, of the route, of the versions of
+    the plugins, and of the resources.
+
+    """
+    return _hash_object([_hash_object(obj), list(lang_list),
+                         sorted(versions),
+                         _hash_object(resources or {})])
+
+
+_ATOMIC_TYPES = string_types + (binary_type, int, float, bool, type(None))
+
+
+def _deepcopy(obj):
+    """Deep copy of nested mappings and lists, walked with an explicit stack
+    so that there is no limit on their depth.
+
+    The mappings are copied with `copy()` before their values are copied,
+    so that they keep their type, and the other objects with `deepcopy()`.
+    Shared and circular references are preserved, like with `deepcopy()`.
+
+    """
+    memo = {}
+    # Stack of the original containers whose items remain to be copied,
+    # with their copy.
+    stack = []
+
+    def _copy_item(x):
+        if type(x) in _ATOMIC_TYPES:
+            return x
+        c = memo.get(id(x), None)
+        if c is not None:
+            return c
+        if isinstance(x, list):
+            c = []
+        elif isinstance(x, Mapping):
+            c = copy(x)
+        else:
+            return deepcopy(x, memo)
+        memo[id(x)] = c
+        stack.append((x, c))
+        return c
+
+    out = _copy_item(obj)
+    while stack:
+        x, c = stack.pop()
+        if isinstance(x, list):
+            c.extend([_copy_item(v) for v in x])
+        else:
+            for k, v in list(x.items()):
+                c[k] = _copy_item(v)
+    return out
+
+
+def _copy(obj):
+    """Copy a cached document, so that it is not modified by the caller."""
+    if isinstance(obj, (string_types, binary_type)):
+        return obj
+    return _deepcopy(obj)
+
+
+#------------------------------------------------------------------------------
+# Memory cache
+#------------------------------------------------------------------------------
+
+# Default size cap of the memory cache of `Podoc(cache=True)`, in bytes.
+DEFAULT_MEMORY_CACHE_SIZE = 64 << 20
+
+
+class MemoryCache(object):
+    """Thread-safe in-memory conversion cache with LRU eviction.
+
+    Parameters
+    ----------
+
+    max_items : int (None)
+        Maximum number of cached conversions.
+    max_bytes : int (None)
+        Maximum total size of the cached documents, in bytes.
+
+    """
+    def __init__(self, max_items=None, max_bytes=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # mapping `key => (obj, size)`
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        """Return a cached document, or `default` if it is not cached."""
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None:
+                self.misses += 1
+                return default
+            # Move the item to the end, as the most recently used.
+            self._items[key] = item
+            self.hits += 1
+        return _copy(item[0])
+
+    def put(self, key, obj):
+        """Cache a document."""
+        size = len(_serialize(obj))
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        obj = _copy(obj)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.n_bytes -= old[1]
+            self._items[key] = (obj, size)
+            self.n_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while ((self.max_items is not None and
+                len(self._items) > self.max_items) or
+               (self.max_bytes is not None and
+                self.n_bytes > self.max_bytes)):
+            key, (_, size) = self._items.popitem(last=False)
+            self.n_bytes -= size
+            logger.debug("Evict %s from the conversion cache.", key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.n_bytes = 0
+
+
+#------------------------------------------------------------------------------
+# Disk cache
+#------------------------------------------------------------------------------
+
+# Default size cap of the disk cache, in bytes.
+DEFAULT_DISK_CACHE_SIZE = 1 << 30
+
+# The garbage collection evicts entries until the cache is below this
+# fraction of its size cap, so that it does not run at every write.
+_GC_RATIO = .75
+
+
+def _read_size(path):
+    try:
+        with open(path, 'r') as f:
+            return int(f.read() or 0)
+    except (IOError, OSError, ValueError):
+        return 0
+
+
+class DiskCache(object):
+    """Conversion cache stored on disk, shared by several processes.
+
+    Every conversion is pickled in a file named after its cache key. The
+    files are written atomically with a rename, so that readers never see a
+    partially-written entry, and the writers hold a lock on the cache
+    directory. The least recently used entries, according to the
+    modification time of the files, are evicted when the total size of the
+    cache exceeds `max_bytes`.
+
+    Parameters
+    ----------
+
+    path : str (None)
+        Cache directory. By default, the `conversions` subdirectory of the
+        podoc cache directory.
+    max_bytes : int (1 GB)
+        Maximum total size of the cached conversions, in bytes.
+
+    """
+    def __init__(self, path=None, max_bytes=DEFAULT_DISK_CACHE_SIZE):
+        self.path = path or get_cache_dir('conversions')
+        if not op.isdir(self.path):
+            os.makedirs(self.path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._lock_path = op.join(self.path, '.lock')
+        # Total size of the entries, shared by all processes.
+        self._size_path = op.join(self.path, '.size')
+
+    def __repr__(self):
+        return '<DiskCache `{}`>'.format(self.path)
+
+    def _entry_path(self, key):
+        return op.join(self.path, key[:2], key[2:])
+
+    def _iter_entries(self):
+        for dirname in os.listdir(self.path):
+            dirpath = op.join(self.path, dirname)
+            if dirname.startswith('.') or not op.isdir(dirpath):
+                continue
+            for filename in os.listdir(dirpath):
+                if not filename.startswith('.'):
+                    yield op.join(dirpath, filename)
+
+    @property
+    def n_bytes(self):
+        return _read_size(self._size_path)
+
+    def __len__(self):
+        return sum(1 for _ in self._iter_entries())
+
+    def __contains__(self, key):
+        return op.exists(self._entry_path(key))
+
+    @contextmanager
+    def _locked(self):
+        """Lock the cache against the other threads and processes."""
+        with self._lock:
+            with open(self._lock_path, 'a') as f:
+                # NOTE: without fcntl, the entries are still written
+                # atomically, but the size of the cache may be inaccurate.
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get(self, key, default=None):
+        """Return a cached document, or `default` if it is not cached."""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                obj = pickle.load(f)
+            # Mark the entry as the most recently used.
+            os.utime(path, None)
+        except (IOError, OSError):
+            # The entry does not exist or has just been evicted.
+            self.misses += 1
+            return default
+        except Exception:  # pragma: no cover
+            logger.debug("Invalid cache entry %s.", path)
+            self.misses += 1
+            return default
+        self.hits += 1
+        return obj
+
+    def put(self, key, obj):
+        """Cache a document.
+
+        Documents nested too deeply to be pickled are not cached.
+
+        """
+        try:
+            contents = pickle.dumps(obj, protocol=2)
+        except RuntimeError as e:
+            # NOTE: RecursionError is a RuntimeError, and pickle has a
+            # depth limit.
+            logger.debug("Could not cache the document: %s.", e)
+            return
+        size = len(contents)
+        if size > self.max_bytes:
+            return
+        path = self._entry_path(key)
+        dirname = op.dirname(path)
+        with self._locked():
+            if not op.isdir(dirname):
+                os.makedirs(dirname)
+            old_size = op.getsize(path) if op.exists(path) else 0
+            _write_atomic(contents, path)
+            n_bytes = _read_size(self._size_path) + size - old_size
+            if n_bytes > self.max_bytes:
+                n_bytes = self._collect()
+            _write_atomic(str(n_bytes), self._size_path)
+
+    def _collect(self):
+        """Evict the least recently used entries, and return the new total
+        size of the cache. The lock must be held."""
+        entries = []
+        for path in self._iter_entries():
+            try:
+                stat = os.stat(path)
+            except OSError:  # pragma: no cover
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        n_bytes = sum(size for _, size, _ in entries)
+        target = self.max_bytes * _GC_RATIO
+        for _, size, path in entries:
+            if n_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # pragma: no cover
+                continue
+            n_bytes -= size
+            logger.debug("Evict %s from the conversion cache.", path)
+        return n_bytes
+
+    def clear(self):
+        with self._locked():
+            for path in list(self._iter_entries()):
+                try:
+                    os.remove(path)
+                except OSError:  # pragma: no cover
+                    pass
+            _write_atomic('0', self._size_path)
@@ -8,12 +8,14 @@
 #------------------------------------------------------------------------------
 
 import logging
+import os.path as op
 import sys
 import textwrap
 
 import click
 
 from podoc import __version__, Podoc
+from podoc.cache import DiskCache
 from podoc.utils import _shorten_string
 
 logger = logging.getLogger(__name__)
@@ -57,10 +59,23 @@ def get_podoc_docstring():
                              _wrap(l1, 'pandoc formats: '))
 
 
-PODOC_HELP = get_podoc_docstring()
+class PodocCommand(click.Command):
+    """Command whose help string is only generated when the help is shown,
+    since listing the languages requires loading all plugins and looking for
+    pandoc."""
+    def format_help_text(self, ctx, formatter):
+        self.help = get_podoc_docstring()
+        return super(PodocCommand, self).format_help_text(ctx, formatter)
 
 
-@click.command(help=PODOC_HELP)
+def _output_path(podoc, output, lang):
+    """Return the output path of a language when there are several target
+    languages."""
+    file_ext = podoc.get_file_ext(lang) or '.' + lang
+    return op.splitext(output)[0] + file_ext
+
+
+@click.command(cls=PodocCommand)
 @click.argument('files',
                 # TODO: nargs=-1 for multiple files concat
                 required=False,
@@ -68,14 +83,21 @@ PODOC_HELP = get_podoc_docstring()
                                 dir_okay=True, resolve_path=True))
 @click.option('-f', '-r', '--from', '--read', default='markdown',
               help='Source format.')
-@click.option('-t', '-w', '--to', '--write', default='ast',
-              help='Target format.')
+@click.option('-t', '-w', '--to', '--write', default=['ast'], multiple=True,
+              help='Target format. Can be repeated to convert the input '
+                   'to several formats at once.')
 @click.option('-o', '--output',
-              help='Output path.')
+              help='Output path. With several target formats, the file '
+                   'extension is replaced by the extension of each format.')
 @click.option('--data-dir',
               help='Output directory.')
 @click.option('--no-pandoc', default=False, is_flag=True,
               help='Disable pandoc formats.')
+@click.option('--parallel', default=False, is_flag=True,
+              help='With several target formats, run the conversions to '
+                   'the different formats concurrently.')
+@click.option('--cache', default=False, is_flag=True,
+              help='Use the conversion cache on disk.')
 @click.version_option(__version__)
 @click.help_option()
 def podoc(files=None,
@@ -84,30 +106,46 @@ def podoc(files=None,
           output=None,
           data_dir=None,
           no_pandoc=False,
+          parallel=False,
+          cache=False,
           ):
     """Convert a file or a string from one format to another."""
     # Create the Podoc instance.
-    podoc = Podoc(with_pandoc=not(no_pandoc))
+    podoc = Podoc(with_pandoc=not(no_pandoc),
+                  cache=DiskCache() if cache else None)
     # If no files are provided, read from the standard input (like pandoc).
     if not files:
         logger.debug("Reading contents from stdin...")
         contents_s = ''.join(sys.stdin.readlines())
         # From string to object.
-        contents = podoc.loads(contents_s, read)
+        obj = podoc.loads(contents_s, read)
         logger.debug("Converting `%s` from %s to %s (file: `%s`).",
                      _shorten_string(contents_s),
-                     read, write, output,
+                     read, ', '.join(write), output,
                      )
-        out = podoc.convert(contents, source=read, target=write,
-                            output=output)
     else:
         # TODO: multiple files
+        obj = files
         logger.debug("Converting file `%s` from %s to %s in %s.",
-                     files, read, write, output)
-        out = podoc.convert(files, source=read, target=write, output=output)
-    if output is None:
-        click.echo(podoc.dumps(out, write))
+                     files, read, ', '.join(write), output)
+    if len(write) == 1:
+        write = write[0]
+        out = podoc.convert(obj, source=read, target=write, output=output)
+        if output is None:
+            click.echo(podoc.dumps(out, write))
         return
+    # Several targets: the input is only converted once to the intermediate
+    # languages shared by the targets.
+    # NOTE: 'json' is an alias for 'ast', which is the key used by
+    # `convert_multi()` in the returned dictionary.
+    write = [lang if lang != 'json' else 'ast' for lang in write]
+    outputs = ({lang: _output_path(podoc, output, lang) for lang in write}
+               if output else None)
+    outs = podoc.convert_multi(obj, source=read, targets=write,
+                               outputs=outputs, parallel=parallel)
+    if output is None:
+        for lang in write:
+            click.echo(podoc.dumps(outs[lang], lang))
 
 
 if __name__ == '__main__':  # pragma: no cover
@@ -22,6 +22,12 @@ logging.getLogger().setLevel(logging.DEBUG)
 add_default_handler('DEBUG')
 
 
+def pytest_addoption(parser):
+    parser.addoption('--scaling', action='store_true', default=False,
+                     help='Check the scaling exponents of the readers and '
+                          'writers.')
+
+
 @yield_fixture
 def tempdir():
     with TemporaryDirectory() as tempdir:
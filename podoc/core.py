@@ -8,15 +8,39 @@
 #------------------------------------------------------------------------------
 
 from collections import defaultdict
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping  # Python 2
+from functools import partial
 import glob
+from heapq import heappush, heappop
 import inspect
 import logging
 import os.path as op
+import threading
+from timeit import default_timer
+from traceback import format_exc
+
+try:
+    from types import MappingProxyType as _frozen_dict
+except ImportError:  # pragma: no cover
+    _frozen_dict = dict  # Python 2
+
+try:
+    from inspect import signature
+except ImportError:  # pragma: no cover
+    signature = None  # Python 2
 
 from six import string_types
 
-from .utils import Bunch, load_text, dump_text, assert_equal
-from .plugin import get_plugins
+from .cache import (MemoryCache, DiskCache, cache_key, _copy,
+                    DEFAULT_MEMORY_CACHE_SIZE)
+from .utils import (Bunch, load_text, dump_text, dump_text_stream,
+                    assert_equal)
+from .plugin import get_plugins, LazyFunction
+from .profiling import Timer, emit, get_size
+from .tree import BaseNode
 
 logger = logging.getLogger(__name__)
 
@@ -25,60 +49,363 @@ logger = logging.getLogger(__name__)
 # Graph routines
 #------------------------------------------------------------------------------
 
+# Cost of a conversion function when none is declared.
+DEFAULT_COST = 1.
+
+# Weight of the last observed duration in the moving average of a
+# conversion cost.
+_COST_SMOOTHING = .2
+
+# The routes are recomputed when a learned cost changes by more than this
+# relative amount.
+_COST_TOLERANCE = .25
+
+
 def _graph_from_edges(edges):
-    """Return the adjacency list of a graph defined by a list of edges."""
-    g = defaultdict(set)
-    for a, b in edges:
-        g[a].add(b)
+    """Return the weighted adjacency list of a graph defined by a list of
+    edges.
+
+    An edge is either a pair `(a, b)`, with the default cost, or a triplet
+    `(a, b, cost)`.
+
+    """
+    g = defaultdict(dict)
+    for edge in edges:
+        a, b = edge[:2]
+        g[a][b] = edge[2] if len(edge) >= 3 else DEFAULT_COST
     return g
 
 
-def _bfs_paths(graph, start, target):
-    """Generate paths from start to target."""
-    # http://eddmann.com/posts/depth-first-search-and-breadth-first-search-in-python/  # noqa
-    queue = [(start, [start])]
-    while queue:
-        (vertex, path) = queue.pop(0)
-        for next in graph[vertex] - set(path):
-            if next == target:
-                yield path + [next]
-            else:
-                queue.append((next, path + [next]))
+class _Routes(Mapping):
+    """Read-only mapping `{vertex: [start, ..., vertex]}` of the paths of a
+    shortest-path tree.
+
+    Only the parent of every vertex is stored: a path is built the first
+    time it is accessed, so that building the routes of a deep graph is not
+    quadratic in its depth.
+
+    """
+    def __init__(self, parents):
+        self._parents = parents
+        self._paths = {}
 
+    def __getitem__(self, vertex):
+        path = self._paths.get(vertex, None)
+        if path is not None:
+            return path
+        parents = self._parents
+        if parents.get(vertex, None) is None:
+            raise KeyError(vertex)
+        path = [vertex]
+        while parents[path[-1]] is not None:
+            path.append(parents[path[-1]])
+        path = self._paths[vertex] = path[::-1]
+        return path
 
-def _bfs_component(graph, start):
-    visited, queue = set(), [start]
-    while queue:
-        vertex = queue.pop(0)
-        if vertex not in visited:
-            visited.add(vertex)
-            queue.extend(graph[vertex] - visited)
-    return visited
+    def __iter__(self):
+        return (v for v, parent in self._parents.items()
+                if parent is not None)
+
+    def __len__(self):
+        return len(self._parents) - 1
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def _shortest_routes(graph, start):
+    """Return a cheapest path from start to every reachable vertex.
+
+    This is Dijkstra's algorithm on the weighted adjacency list `graph`.
+    The output is a mapping `{vertex: [start, ..., vertex]}`. The paths are
+    only built when they are accessed, by following the parent of every
+    vertex in the shortest-path tree.
+
+    """
+    parents = {start: None}
+    costs = {start: 0}
+    done = set()
+    # NOTE: ties are broken on the vertex so that the routes are
+    # deterministic.
+    heap = [(0, start)]
+    while heap:
+        cost, vertex = heappop(heap)
+        if vertex in done:
+            continue
+        done.add(vertex)
+        for next, edge_cost in graph.get(vertex, {}).items():
+            next_cost = cost + edge_cost
+            if next not in costs or next_cost < costs[next]:
+                costs[next] = next_cost
+                parents[next] = vertex
+                heappush(heap, (next_cost, next))
+    return _Routes(parents)
 
 
 def _find_path(edges, start, target):
-    """Return a shortest path in a graph defined by a list of edges."""
-    graph = _graph_from_edges(edges)
-    try:
-        return next(_bfs_paths(graph, start, target))
-    except StopIteration:
-        return None
+    """Return a cheapest path in a graph defined by a list of edges."""
+    return _shortest_routes(_graph_from_edges(edges), start).get(target, None)
+
+
+def _common_prefix(paths):
+    """Return the longest common prefix of a list of paths."""
+    prefix = list(paths[0])
+    for path in paths[1:]:
+        n = 0
+        while n < min(len(prefix), len(path)) and prefix[n] == path[n]:
+            n += 1
+        prefix = prefix[:n]
+    return prefix
 
 
 def _connected_component(edges, start):
-    graph = _graph_from_edges(edges)
-    # We remove the start from the component.
-    return sorted(_bfs_component(graph, start) - set([start]))
+    # NOTE: the start is not in the component.
+    return sorted(_shortest_routes(_graph_from_edges(edges), start))
 
 
 #------------------------------------------------------------------------------
-# Main class
+# Pipeline
 #------------------------------------------------------------------------------
 
 def _get_annotation(func, name):
     return getattr(func, '__annotations__', {}).get(name, None)
 
 
+def _accepts_resources(func):
+    """Return whether a conversion function accepts a `resources` argument."""
+    if isinstance(func, LazyFunction):
+        # NOTE: lazy functions forward the resources when needed.
+        return True
+    if signature is None:  # pragma: no cover
+        return 'resources' in inspect.getargspec(func).args
+    try:
+        return 'resources' in signature(func).parameters
+    except (TypeError, ValueError):  # pragma: no cover
+        # Some builtin callables have no signature.
+        return False
+
+
+class Pipeline(object):
+    """A chain of conversion functions resolved once for a given route.
+
+    Pipelines are returned by `Podoc.compile()`. Calling a pipeline on an
+    object passes it through all conversion functions and filters of the
+    route.
+
+    """
+    def __init__(self, podoc, lang_list):
+        self._podoc = podoc
+        self.lang_list = tuple(lang_list)
+        self._steps = []
+        self._stream_steps = []
+        for t0, t1 in zip(lang_list, lang_list[1:]):
+            # Get the function registered for t0, t1.
+            fd = podoc._funcs.get((t0, t1), None)
+            if not fd:
+                raise ValueError("No function registered for `{}` => `{}`.".
+                                 format(t0, t1))
+            self._steps.append((t0, t1, fd.pre_filter, fd.func,
+                                fd.post_filter, _accepts_resources(fd.func)))
+            sf = fd.stream_func
+            self._stream_steps.append((t0, t1, sf,
+                                       sf and _accepts_resources(sf)))
+
+    @property
+    def source(self):
+        return self.lang_list[0]
+
+    @property
+    def target(self):
+        return self.lang_list[-1]
+
+    def __repr__(self):
+        return '<Pipeline {}>'.format(' -> '.join(self.lang_list))
+
+    @property
+    def can_stream(self):
+        """Whether all conversions of the route have a streaming function."""
+        return all(f for _, _, f, _ in self._stream_steps)
+
+    def __call__(self, obj, resources=None):
+        """Convert an object along the pipeline's route."""
+        resources = resources if resources is not None else {}
+        hooks = self._podoc.hooks
+        if hooks:
+            return self._call_instrumented(obj, resources, hooks)
+        learn_costs = self._podoc.learn_costs
+        for t0, t1, pre_filter, f, post_filter, with_resources in self._steps:
+            if pre_filter:
+                obj = pre_filter(obj)
+            if learn_costs:
+                # NOTE: the import of a plugin is not part of the cost of
+                # its functions.
+                if isinstance(f, LazyFunction):
+                    f.resolve()
+                t = default_timer()
+            # Pass the resources dictionary if the conversion function
+            # accepts it.
+            if with_resources:
+                obj = f(obj, resources=resources)
+            else:
+                obj = f(obj)
+            if learn_costs:
+                self._podoc._observe_cost(t0, t1, default_timer() - t)
+            if post_filter:
+                obj = post_filter(obj)
+        return obj
+
+    def _call_instrumented(self, obj, resources, hooks):
+        """Convert an object, passing the record of every stage to the
+        instrumentation hooks."""
+        learn_costs = self._podoc.learn_costs
+        for t0, t1, pre_filter, f, post_filter, with_resources in self._steps:
+            if pre_filter:
+                timer = Timer()
+                out = pre_filter(obj)
+                emit(hooks, 'pre_filter', t0, t1, timer, obj, out)
+                obj = out
+            # NOTE: the import of a plugin is not part of the cost of its
+            # functions.
+            if isinstance(f, LazyFunction):
+                f.resolve()
+            timer = Timer()
+            if with_resources:
+                out = f(obj, resources=resources)
+            else:
+                out = f(obj)
+            if learn_costs:
+                self._podoc._observe_cost(t0, t1, timer.wall_time)
+            emit(hooks, 'func', t0, t1, timer, obj, out)
+            obj = out
+            if post_filter:
+                timer = Timer()
+                out = post_filter(obj)
+                emit(hooks, 'post_filter', t0, t1, timer, obj, out)
+                obj = out
+        return obj
+
+    def stream(self, obj, resources=None):
+        """Convert a stream along the pipeline's route, with the streaming
+        functions of the conversions.
+
+        The input is the stream of the source language, and the output is a
+        lazy stream of the target language: nothing is converted before the
+        output stream is consumed.
+
+        """
+        resources = resources if resources is not None else {}
+        for t0, t1, f, with_resources in self._stream_steps:
+            if not f:
+                raise ValueError("No streaming function registered for "
+                                 "`{}` => `{}`.".format(t0, t1))
+            if with_resources:
+                obj = f(obj, resources=resources)
+            else:
+                obj = f(obj)
+        return obj
+
+
+#------------------------------------------------------------------------------
+# Batch conversion
+#------------------------------------------------------------------------------
+
+# Podoc instances unpickled in the current process, mapping
+# `constructor arguments => Podoc`.
+_unpickled_podocs = {}
+
+
+def _unpickle_podoc(*init_args):
+    """Rebuild a pickled Podoc instance.
+
+    The instance is built once per process and constructor arguments, so
+    that sending a Podoc instance to a worker process repeatedly (for
+    example to a process pool executor) only loads the plugins once.
+
+    """
+    podoc = _unpickled_podocs.get(init_args, None)
+    if podoc is None:
+        podoc = _unpickled_podocs[init_args] = Podoc(*init_args)
+    return podoc
+
+
+class ConversionError(Exception):
+    """Error raised by the conversion of one item in a batch conversion.
+
+    The failed conversion is identified by its index in the list of inputs.
+    The original traceback is kept as a string, since it cannot be sent
+    across processes.
+
+    """
+    def __init__(self, message, index=None, traceback=None):
+        super(ConversionError, self).__init__(message, index, traceback)
+        self.message = message
+        self.index = index
+        self.traceback = traceback
+
+    def __str__(self):
+        return 'Conversion of item #{} failed: {}'.format(self.index,
+                                                          self.message)
+
+
+# The Podoc instance of a worker process, created by `_init_worker()`.
+_worker_podoc = None
+
+
+def _init_worker(podoc):
+    global _worker_podoc
+    _worker_podoc = podoc
+
+
+def _convert_item(podoc, index, obj, kwargs):
+    try:
+        return podoc.convert(obj, **kwargs)
+    except Exception as e:
+        logger.debug("Conversion of item #%d failed: %s.", index, e)
+        return ConversionError('{}: {}'.format(e.__class__.__name__, e),
+                               index=index, traceback=format_exc())
+
+
+def _convert_item_in_worker(args):
+    return _convert_item(_worker_podoc, *args)
+
+
+def _convert_tree_in_worker(args):
+    return _worker_podoc._convert_tree(*args)
+
+
+def _default_chunksize(n_items, jobs):
+    # Same heuristic as `multiprocessing.Pool.map()`: about four chunks per
+    # process.
+    chunksize, extra = divmod(n_items, jobs * 4)
+    return chunksize + 1 if extra else max(chunksize, 1)
+
+
+#------------------------------------------------------------------------------
+# Main class
+#------------------------------------------------------------------------------
+
+_MISSING = object()
+
+# Approximate memory taken by a conversion per byte of the input document.
+# The AST of a Markdown document takes up to about 250 times the size of
+# the document, less with long code blocks.
+MEMORY_PER_BYTE = 250
+
+
+def _is_path(obj):
+    """Return whether an object is the path of an existing file."""
+    return (isinstance(obj, string_types) and
+            # NOTE: this is to avoid passing huge strings to op.exists(),
+            # which crashes sometimes.
+            len(obj) <= 1024 and
+            op.exists(obj))
+
+
+def _podoc_version():
+    from podoc import __version__
+    return __version__
+
+
 class Podoc(object):
     """Conversion pipeline for markup documents.
 
@@ -91,14 +418,69 @@ class Podoc(object):
         List of plugins to load. By default, load all plugins found.
     with_pandoc : bool (True)
         Whether to load all pandoc conversion paths.
+    learn_costs : bool (False)
+        Whether to replace the declared cost of every conversion function by
+        a moving average of its observed duration, in seconds. The declared
+        costs of the functions that have not run yet are converted to
+        seconds with the ratio of the observed durations to the declared
+        costs. The routes then follow the fastest available chain of
+        conversions.
+    executor : concurrent.futures.Executor (None)
+        Executor running the conversions of `aconvert()`. By default, the
+        default executor of the event loop is used.
+    cache : MemoryCache, DiskCache, bool or str (None)
+        Conversion cache used by `convert()`, keyed by a hash of the input,
+        the route, the resources and the versions of the plugins. With
+        True, a `MemoryCache` of at most `DEFAULT_MEMORY_CACHE_SIZE` bytes
+        (64 MB) is used. With a path, a `DiskCache` in that directory is
+        used, which is shared by all processes using the same directory.
 
     """
 
-    def __init__(self, plugins=None, with_pandoc=True):
+    def __init__(self, plugins=None, with_pandoc=True, learn_costs=False,
+                 executor=None, cache=None):
         self._funcs = {}  # mapping `(lang0, lang1) => func`
         self._langs = {}  # mapping `lang: Bunch()`
+        self._file_exts = {}  # mapping `file_ext => lang`
+        # Set by `freeze()`.
+        self.frozen = False
+        # Instrumentation hooks, see `add_hook()`.
+        self.hooks = []
+        self.learn_costs = learn_costs
+        # Default executor of the coroutine methods.
+        self.executor = executor
+        if cache is True:
+            cache = MemoryCache(max_bytes=DEFAULT_MEMORY_CACHE_SIZE)
+        elif isinstance(cache, string_types):
+            cache = DiskCache(cache)
+        self.cache = cache
+        # Versions of podoc and of the plugins, used in the cache keys.
+        self.plugin_versions = {'podoc': _podoc_version()}
+        # Keep the constructor arguments to rebuild the instance in another
+        # process.
+        self._init_args = (tuple(plugins) if plugins is not None else None,
+                           with_pandoc, learn_costs)
+        # Weighted conversion graph, updated by `register_func()`.
+        self._graph = defaultdict(dict)  # mapping `lang0 => {lang1: cost}`
+        # Route table, filled lazily and reset when the graph changes.
+        self._routes = {}  # mapping `lang0 => {lang1: [lang0, ..., lang1]}`
+        self._targets = {}  # mapping `lang0 => sorted list of targets`
+        self._pipelines = {}  # mapping `(lang0, ..., lang1) => Pipeline`
+        # Learned costs, see `_observe_cost()`: total learned cost and total
+        # declared cost of the observed functions, and the seconds per unit
+        # of declared cost in the graph.
+        self._cost_lock = threading.Lock()
+        self._observed_cost = 0.
+        self._observed_declared_cost = 0.
+        self._cost_scale = None
         self._load_plugins(plugins, with_pandoc)
 
+    def __reduce__(self):
+        # NOTE: a Podoc instance is pickled as its constructor arguments:
+        # it is rebuilt from its plugins in the unpickling process. Functions
+        # and languages registered manually are not transferred.
+        return (_unpickle_podoc, self._init_args)
+
     def _load_plugins(self, plugins=None, with_pandoc=True):
         """Load plugins. By default (None), all plugins found are loaded."""
         # Load plugins.
@@ -107,18 +489,40 @@ class Podoc(object):
             # Skip pandoc plugin.
             if not with_pandoc and p.__name__ == 'PandocPlugin':
                 continue
-            p().attach(self)
+            # NOTE: lazy plugin descriptors are instances, not classes.
+            plugin = p() if isinstance(p, type) else p
+            plugin.attach(self)
+            self.plugin_versions[p.__name__] = getattr(plugin, 'version',
+                                                       None)
 
     # Main methods
     # -------------------------------------------------------------------------
 
     def register_func(self, func=None, source=None, target=None,
                       pre_filter=None, post_filter=None,
+                      cost=None, stream_func=None,
                       ):
-        """Register a conversion function between two languages."""
+        """Register a conversion function between two languages.
+
+        The cost is used to choose the cheapest route between two languages.
+        It is `DEFAULT_COST` by default, so that the route with the fewest
+        conversions is chosen when no cost is declared.
+
+        The optional streaming function converts a stream of the source
+        language into a lazy stream of the target language, and is used by
+        `convert(stream=True)`. The stream of the `ast` language is the
+        sequence of its top-level blocks.
+
+        """
+        self._check_not_frozen()
         if func is None:
             return lambda _: self.register_func(_, source=source,
-                                                target=target)
+                                                target=target,
+                                                pre_filter=pre_filter,
+                                                post_filter=post_filter,
+                                                cost=cost,
+                                                stream_func=stream_func,
+                                                )
         assert func
         source = source or _get_annotation(func, 'source')
         target = target or _get_annotation(func, 'target')
@@ -129,18 +533,162 @@ class Podoc(object):
                          source, target)
             return
         logger.log(5, "Register conversion `%s -> %s`.", source, target)
+        cost = cost if cost is not None else DEFAULT_COST
+        assert cost >= 0
         self._funcs[(source, target)] = Bunch(func=func,
                                               pre_filter=pre_filter,
                                               post_filter=post_filter,
+                                              cost=cost,
+                                              declared_cost=cost,
+                                              n_observed=0,
+                                              stream_func=stream_func,
                                               )
+        with self._cost_lock:
+            scale = self._cost_scale
+            self._graph[source][target] = (cost * scale if scale is not None
+                                           else cost)
+        # A new edge may create new routes or shorten existing ones.
+        self._clear_routes()
+
+    # Instrumentation
+    # -------------------------------------------------------------------------
+
+    def add_hook(self, hook):
+        """Add an instrumentation hook, called after every stage of the
+        conversions: `load`, `pre_filter`, `func`, `post_filter` and `dump`.
+
+        The hook is called with a record having the following fields:
+        `stage`, `source`, `target`, `wall_time`, `cpu_time`, `input_size`
+        and `output_size`. The sizes of trees are only measured if a hook
+        has a true `measure_sizes` attribute. A `ConversionStats` instance
+        can be used as a hook. Without hooks, the conversions are not
+        instrumented at all.
+
+        The streaming conversions and the conversions found in the cache
+        are not instrumented.
+
+        """
+        # NOTE: the list is replaced, so that it can be read by other
+        # threads without a lock.
+        self.hooks = self.hooks + [hook]
+        return hook
+
+    def remove_hook(self, hook):
+        self.hooks = [h for h in self.hooks if h is not hook]
+
+    def _check_not_frozen(self):
+        if self.frozen:
+            raise RuntimeError("This Podoc instance is frozen: languages and "
+                               "functions can no longer be registered.")
+
+    def freeze(self):
+        """Make the registry of languages and conversion functions immutable,
+        and return the instance.
+
+        The routes and target languages of all languages are computed, and
+        the pipelines of all routes and of all conversion pairs are compiled.
+        After that, the conversion methods only read immutable data, so that
+        a frozen instance can be shared by several threads without locks.
+
+        Registering a language or a function on a frozen instance raises a
+        `RuntimeError`. The costs are no longer learned, since the routes
+        cannot change.
+
+        """
+        if self.frozen:
+            return self
+        self.learn_costs = False
+        langs = set(self._langs) | set(self._graph)
+        routes = {lang: self._get_routes(lang) for lang in langs}
+        targets = {lang: tuple(self.get_target_languages(lang))
+                   for lang in langs}
+        for lang_lists in routes.values():
+            for lang_list in lang_lists.values():
+                self.compile(lang_list=lang_list)
+        for pair in self._funcs:
+            self.compile(lang_list=pair)
+        self._funcs = _frozen_dict(self._funcs)
+        self._langs = _frozen_dict(self._langs)
+        self._file_exts = _frozen_dict(self._file_exts)
+        self._routes = _frozen_dict(routes)
+        self._targets = _frozen_dict(targets)
+        self._pipelines = _frozen_dict(self._pipelines)
+        self.frozen = True
+        return self
+
+    def _clear_routes(self):
+        self._routes.clear()
+        self._targets.clear()
+
+    def _observe_cost(self, source, target, duration):
+        """Update the learned cost of a conversion function with an observed
+        duration.
+
+        The costs of the graph are all in seconds: the declared costs of the
+        functions that have not been observed yet are scaled by the ratio of
+        the total learned cost to the total declared cost of the observed
+        functions.
+
+        """
+        with self._cost_lock:
+            fd = self._funcs[(source, target)]
+            old = fd.cost if fd.n_observed else 0.
+            if fd.n_observed == 0:
+                # The first observation replaces the declared cost.
+                fd.cost = duration
+                self._observed_declared_cost += fd.declared_cost
+            else:
+                fd.cost += _COST_SMOOTHING * (duration - fd.cost)
+            fd.n_observed += 1
+            self._observed_cost += fd.cost - old
+            changed = self._update_cost_scale()
+            # Only update the route table when the cost has significantly
+            # changed since the last time the routes were computed.
+            old = self._graph[source][target]
+            if changed or abs(fd.cost - old) > _COST_TOLERANCE * old:
+                logger.log(5, "Cost of `%s -> %s` updated to %.3g.",
+                           source, target, fd.cost)
+                self._graph[source][target] = fd.cost
+                self._clear_routes()
+
+    def _update_cost_scale(self):
+        """Rescale the costs of the functions that have not been observed,
+        and return whether they have significantly changed."""
+        if self._observed_declared_cost <= 0:
+            return False
+        scale = self._observed_cost / self._observed_declared_cost
+        old = self._cost_scale
+        if old is not None and abs(scale - old) <= _COST_TOLERANCE * old:
+            return False
+        self._cost_scale = scale
+        for (source, target), fd in self._funcs.items():
+            if not fd.n_observed:
+                self._graph[source][target] = fd.declared_cost * scale
+        return True
 
     def register_lang(self, name, file_ext=None,
                       load_func=None, dump_func=None,
                       loads_func=None, dumps_func=None,
                       assert_equal_func=None,
+                      load_stream_func=None, dump_stream_func=None,
+                      split_func=None, join_func=None,
                       **kwargs):
         """Register a language with a file extension and load/dump
-        functions."""
+        functions.
+
+        The streaming functions are used by `convert(stream=True)`:
+
+        * `load_stream_func(path)` loads a file as a stream. By default, the
+          file is loaded with `load_func()`.
+        * `dump_stream_func(stream, path)` writes a stream to a file. By
+          default, the stream is written as a sequence of strings.
+        * `split_func(obj)` turns an object into a stream. By default, the
+          object itself is passed to the streaming functions.
+        * `join_func(stream)` builds an object from a stream. By default, the
+          stream is joined as a sequence of strings.
+
+        """
+        self._check_not_frozen()
         if file_ext:
             assert file_ext.startswith('.')
         if name in self._langs:
@@ -153,19 +701,36 @@ class Podoc(object):
         dump_func = dump_func or dump_text
         loads_func = loads_func or (lambda _: _)
         dumps_func = dumps_func or (lambda _: _)
+        dump_stream_func = dump_stream_func or dump_text_stream
+        join_func = join_func or ''.join
+        if file_ext:
+            # NOTE: the first language registered with a file extension
+            # wins.
+            self._file_exts.setdefault(file_ext, name)
         self._langs[name] = Bunch(file_ext=file_ext,
                                   load_func=load_func,
                                   dump_func=dump_func,
                                   loads_func=loads_func,
                                   dumps_func=dumps_func,
                                   assert_equal_func=assert_equal_func,
+                                  load_stream_func=load_stream_func,
+                                  dump_stream_func=dump_stream_func,
+                                  split_func=split_func,
+                                  join_func=join_func,
                                   **kwargs)
 
     def convert(self, obj_or_path, source=None, target=None,
-                lang_list=None, output=None, resources=None):
+                lang_list=None, output=None, resources=None, stream=False):
         """Convert an object by passing it through a chain of conversion
-        functions."""
-        resources = resources or {}
+        functions.
+
+        With `stream=True`, the document goes through the streaming functions
+        of the conversions, one top-level block at a time, so that the whole
+        document is never held in memory in intermediate languages. When an
+        output path is given, the output is also written block by block and
+        `None` is returned.
+
+        """
         obj = obj_or_path
         # NOTE: 'json' is an alias for 'ast', to match with pandoc's
         # terminology.
@@ -175,12 +740,9 @@ class Podoc(object):
         # from the file extension.
         if target is None and output is not None:
             target = self.get_lang_for_file_ext(op.splitext(output)[1])
+        path = None
         # NOTE: decide whether the object is a path or contents string.
-        if (isinstance(obj_or_path, string_types) and
-                len(obj_or_path) <= 1024 and  # this is to avoid passing huge
-                                              # strings to op.exists(), which
-                                              # crashes sometimes.
-                op.exists(obj_or_path)):
+        if _is_path(obj_or_path):
             # Convert a file to a target format.
             path = obj_or_path
             assert target
@@ -189,40 +751,383 @@ class Podoc(object):
                 source = self.get_lang_for_file_ext(op.splitext(path)[1])
             assert source
             # Load the object.
-            obj = self.load(path, source)
+            if not stream:
+                obj = self._load_stage(path, source)
         # At this point, we should have a non-empty object.
+        pipeline = self.compile(source, target, lang_list=lang_list)
+        if stream:
+            return self._convert_stream(pipeline, obj, path=path,
+                                        output=output, resources=resources)
+        obj = self._run_pipeline(pipeline, obj, resources=resources)
+        if output:
+            self._dump_stage(obj, output, target)
+        return obj
+
+    def _load_stage(self, path, lang):
+        if not self.hooks:
+            return self.load(path, lang)
+        timer = Timer()
+        obj = self.load(path, lang)
+        emit(self.hooks, 'load', lang, None, timer, output=obj,
+             input_size=op.getsize(path))
+        return obj
+
+    def _dump_stage(self, obj, path, lang):
+        if not self.hooks:
+            return self.dump(obj, path, lang=lang)
+        timer = Timer()
+        self.dump(obj, path, lang=lang)
+        emit(self.hooks, 'dump', None, lang, timer, input=obj,
+             output_size=op.getsize(path))
+
+    def convert_multi(self, obj_or_path, source=None, targets=None,
+                      outputs=None, resources=None, parallel=False):
+        """Convert an object to several target languages at once.
+
+        The cheapest routes from the source language to all targets form a
+        tree: every conversion in that tree runs once, so that, for example,
+        the source is parsed into the AST only once and the AST is then
+        passed to each writer.
+
+        Parameters
+        ----------
+
+        targets : list
+            List of target languages.
+        outputs : dict (None)
+            Mapping `target => path` of the targets to write to a file.
+        parallel : bool (False)
+            Whether to run the independent branches of the tree
+            concurrently, once the route prefix shared by all targets has
+            been converted. Branches going through pandoc run in threads,
+            since they wait on pandoc, and the other branches run in worker
+            processes.
+
+        Returns
+        -------
+
+        objs : dict
+            Mapping `target => converted object`.
+
+        Notes
+        -----
+
+        With `parallel=True`, the worker processes build their own Podoc
+        instance with the same constructor arguments, as with
+        `convert_many()`.
+
+        """
+        assert targets
+        outputs = outputs or {}
+        source = source if source != 'json' else 'ast'
+        targets = [t if t != 'json' else 'ast' for t in targets]
+        obj = obj_or_path
+        if _is_path(obj_or_path):
+            path = obj_or_path
+            if source is None:
+                source = self.get_lang_for_file_ext(op.splitext(path)[1])
+            obj = self._load_stage(path, source)
+        assert source
+        if parallel:
+            out = self._convert_tree_parallel(obj, source, targets,
+                                              resources=resources)
+        else:
+            out = self._convert_tree(obj, source, targets,
+                                     resources=resources)
+        for target, output in outputs.items():
+            self._dump_stage(out[target], output, target)
+        return out
+
+    def _get_routes_to(self, source, targets):
+        """Return the cheapest routes from a language to several targets."""
+        routes = self._get_routes(source)
+        lang_list = {}
+        for target in targets:
+            lang_list[target] = routes.get(target, None) or [source]
+            if target != source and target not in routes:
+                raise ValueError("No path found from `{}` to `{}`.".format(
+                                 source, target))
+        return lang_list
+
+    def _convert_tree(self, obj, source, targets, resources=None):
+        """Convert an object along the tree of the routes to several
+        targets, running every conversion once."""
+        lang_list = self._get_routes_to(source, targets)
+        # Number of times the object of every language is used: once per
+        # outgoing conversion and once if it is a target. Objects used
+        # several times are copied, so that the conversion functions
+        # cannot modify them.
+        uses = defaultdict(int)
+        edges = set()
+        for target in targets:
+            uses[target] += 1
+            route = lang_list[target]
+            edges.update(zip(route, route[1:]))
+        for t0, t1 in edges:
+            uses[t0] += 1
+        objs = {source: obj}
+
+        def _take(lang):
+            uses[lang] -= 1
+            return objs[lang] if uses[lang] == 0 else _copy(objs[lang])
+
+        # NOTE: the routes are the branches of a shortest-path tree, so the
+        # objects are converted in the order of their depth in the tree.
+        routes = self._get_routes(source)
+        for t0, t1 in sorted(edges, key=lambda e: len(routes[e[1]])):
+            pipeline = self.compile(lang_list=(t0, t1))
+            objs[t1] = pipeline(_take(t0), resources=resources)
+        return {target: _take(target) for target in targets}
+
+    def _convert_tree_parallel(self, obj, source, targets, resources=None):
+        """Convert an object to several targets, running the branches of the
+        tree of routes concurrently."""
+        lang_list = self._get_routes_to(source, targets)
+        # Convert the route prefix shared by all targets in this thread.
+        prefix = _common_prefix(list(lang_list.values()))
+        if len(prefix) > 1:
+            obj = self.compile(lang_list=prefix)(obj, resources=resources)
+        fork = prefix[-1]
+        # Group the targets by branch, i.e. by the first language after the
+        # fork on their routes.
+        branches = defaultdict(list)
+        for target in targets:
+            route = lang_list[target]
+            branch = route[len(prefix)] if len(route) > len(prefix) else fork
+            branches[branch].append(target)
+        # Branches going through pandoc wait on a subprocess: they run in
+        # threads. The other branches need their own process, except when
+        # there is a single one.
+        io_bound = {branch: any(self._langs[lang].get('pandoc', False)
+                                for target in branch_targets
+                                for lang in lang_list[target])
+                    for branch, branch_targets in branches.items()}
+        cpu_branches = [b for b in branches if not io_bound[b]]
+        if len(cpu_branches) <= 1:
+            cpu_branches = []
+        thread_branches = [b for b in branches if b not in cpu_branches]
+        logger.debug("Converting %d branches from `%s` with %d threads and "
+                     "%d processes.", len(branches), fork,
+                     len(thread_branches), len(cpu_branches))
+        # NOTE: multiprocessing is imported here to keep the import of podoc
+        # fast.
+        from multiprocessing import cpu_count, Pool
+        from multiprocessing.pool import ThreadPool
+        results = {}
+        thread_pool = process_pool = None
+        if thread_branches:
+            thread_pool = ThreadPool(len(thread_branches))
+        if cpu_branches:
+            process_pool = Pool(min(len(cpu_branches), cpu_count()),
+                                initializer=_init_worker, initargs=(self,))
+        try:
+            # NOTE: the branches running in threads get a copy of the object
+            # at the fork, except the last one when the object is not sent
+            # to worker processes, since it is pickled asynchronously.
+            for i, branch in enumerate(thread_branches):
+                shared = (not cpu_branches and
+                          i == len(thread_branches) - 1)
+                obj_branch = obj if shared else _copy(obj)
+                results[branch] = thread_pool.apply_async(
+                    self._convert_tree,
+                    (obj_branch, fork, branches[branch], resources))
+            for branch in cpu_branches:
+                results[branch] = process_pool.apply_async(
+                    _convert_tree_in_worker,
+                    ((obj, fork, branches[branch], resources),))
+            out = {}
+            for branch in branches:
+                out.update(results[branch].get())
+            return out
+        finally:
+            for pool in (thread_pool, process_pool):
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+
+    def _run_pipeline(self, pipeline, obj, resources=None):
+        """Run a pipeline, through the conversion cache if there is one."""
+        if self.cache is None:
+            return pipeline(obj, resources=resources)
+        key = cache_key(obj, pipeline.lang_list,
+                        versions=self.plugin_versions.items(),
+                        resources=resources)
+        out = self.cache.get(key, _MISSING)
+        if out is _MISSING:
+            out = pipeline(obj, resources=resources)
+            self.cache.put(key, out)
+        return out
+
+    def _convert_stream(self, pipeline, obj, path=None, output=None,
+                        resources=None):
+        source = self._langs[pipeline.source]
+        target = self._langs[pipeline.target]
+        # Get the stream of the source language.
+        if path and source.load_stream_func:
+            obj = source.load_stream_func(path)
+        elif path:
+            obj = source.load_func(path)
+            obj = source.split_func(obj) if source.split_func else obj
+        elif source.split_func:
+            obj = source.split_func(obj)
+        stream = pipeline.stream(obj, resources=resources)
+        if output:
+            target.dump_stream_func(stream, output)
+            return
+        return target.join_func(stream)
+
+    def convert_many(self, inputs, source=None, target=None, lang_list=None,
+                     resources=None, jobs=None, chunksize=None):
+        """Convert a list of objects or paths, possibly in parallel.
+
+        Parameters
+        ----------
+
+        inputs : list
+            List of objects or paths to convert.
+        jobs : int (None)
+            Number of worker processes. By default, use all CPUs. With
+            `jobs=1`, the conversions run in the current process.
+        chunksize : int (None)
+            Number of items sent at once to a worker process. By default,
+            the items are split in about four chunks per process.
+
+        Returns
+        -------
+
+        outputs : list
+            List of converted objects, in the same order as the inputs. The
+            output of a failed conversion is a `ConversionError` instance.
+
+        Notes
+        -----
+
+        Every worker process builds its own Podoc instance with the same
+        constructor arguments. Functions and languages registered manually
+        on this instance are not available in the worker processes.
+
+        """
+        inputs = list(inputs)
+        kwargs = dict(source=source, target=target, lang_list=lang_list,
+                      resources=resources)
+        # Check that the route exists before starting the workers.
+        if lang_list is not None or (source is not None and
+                                     target is not None):
+            self.compile(source, target, lang_list=lang_list)
+        from multiprocessing import cpu_count, Pool
+        jobs = jobs or cpu_count()
+        jobs = min(jobs, len(inputs))
+        if jobs <= 1:
+            return [_convert_item(self, index, obj, kwargs)
+                    for index, obj in enumerate(inputs)]
+        chunksize = chunksize or _default_chunksize(len(inputs), jobs)
+        items = [(index, obj, kwargs) for index, obj in enumerate(inputs)]
+        logger.debug("Converting %d items with %d processes.",
+                     len(items), jobs)
+        pool = Pool(jobs, initializer=_init_worker, initargs=(self,))
+        try:
+            return pool.map(_convert_item_in_worker, items, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+
+    # Coroutine methods
+    # -------------------------------------------------------------------------
+
+    def _run_in_executor(self, executor, func):
+        # NOTE: asyncio is imported here since it is not available on
+        # Python 2.
+        import asyncio
+        try:
+            loop = asyncio.get_running_loop()
+        except (AttributeError, RuntimeError):
+            # NOTE: `get_running_loop()` is only available on Python 3.7+,
+            # and the coroutine methods may be called outside of a running
+            # event loop, like in `loop.run_until_complete(p.aload(path))`.
+            loop = asyncio.get_event_loop()
+        return loop.run_in_executor(executor or self.executor, func)
+
+    def aconvert(self, obj_or_path, source=None, target=None,
+                 lang_list=None, output=None, resources=None, executor=None):
+        """Asynchronous version of `convert()`, returning an awaitable.
+
+        The whole conversion, including loading the input file and dumping
+        the output file, runs in `executor` (by default, `self.executor`),
+        so that the event loop is never blocked. With a process pool
+        executor, the Podoc instance is rebuilt once in every worker
+        process.
+
+        """
+        return self._run_in_executor(executor, partial(
+            self.convert, obj_or_path, source=source, target=target,
+            lang_list=lang_list, output=output, resources=resources))
+
+    def aload(self, path, lang=None, executor=None):
+        """Asynchronous version of `load()`, returning an awaitable.
+
+        The file is read in `executor`, by default `self.executor`.
+
+        """
+        return self._run_in_executor(executor, partial(self.load, path,
+                                                       lang=lang))
+
+    def adump(self, contents, path, lang=None, executor=None):
+        """Asynchronous version of `dump()`, returning an awaitable.
+
+        The file is written in `executor`, by default `self.executor`.
+
+        """
+        return self._run_in_executor(executor, partial(self.dump, contents,
+                                                       path, lang=lang))
+
+    # Pipelines
+    # -------------------------------------------------------------------------
+
+    def compile(self, source=None, target=None, lang_list=None):
+        """Return a reusable pipeline converting objects from a source
+        language to a target language.
+
+        The route, the conversion functions, and their filters are resolved
+        once, so that calling the pipeline involves no graph search or
+        introspection.
+
+        """
+        source = source if source != 'json' else 'ast'
+        target = target if target != 'json' else 'ast'
         if lang_list is None:
-            # Find the shortest path from source to target in the conversion
+            # Find the cheapest path from source to target in the conversion
             # graph.
             assert source and target
-            lang_list = _find_path(self.conversion_pairs,
-                                   source, target)
+            lang_list = self._get_routes(source).get(target, None)
             if not lang_list:
                 raise ValueError("No path found from `{}` to `{}`.".format(
                                  source, target))
         assert isinstance(lang_list, (tuple, list))
-        # Iterate over all successive pairs.
-        for t0, t1 in zip(lang_list, lang_list[1:]):
-            # Get the function registered for t0, t1.
-            fd = self._funcs.get((t0, t1), None)
-            if not fd:
-                raise ValueError("No function registered for `{}` => `{}`.".
-                                 format(t0, t1))
-            kwargs = {}
-            f = fd.func
-            # Pre-filter.
-            obj = fd.pre_filter(obj) if fd.pre_filter else obj
-            # Add the resources dictionary if the conversion function accepts
-            # it.
-            if 'resources' in inspect.getargspec(f).args:
-                kwargs['resources'] = resources
-            # Perform the conversion.
-            obj = f(obj, **kwargs)
-            # Post-filter.
-            obj = fd.post_filter(obj) if fd.post_filter else obj
-        if output:
-            self.dump(obj, output, lang=target)
-        return obj
+        lang_list = tuple(lang_list)
+        pipeline = self._pipelines.get(lang_list, None)
+        if pipeline is None:
+            pipeline = Pipeline(self, lang_list)
+            # NOTE: a frozen instance has the pipelines of all cheapest
+            # routes, other routes are compiled again at every call.
+            if not self.frozen:
+                self._pipelines[lang_list] = pipeline
+        return pipeline
+
+    def estimate_memory(self, obj_or_path):
+        """Return the approximate memory needed to convert a document or a
+        file, in bytes.
+
+        The memory retained by a tree is measured. For other documents, it is
+        estimated from their size with `MEMORY_PER_BYTE`.
+
+        """
+        if isinstance(obj_or_path, BaseNode):
+            return obj_or_path.size_info().memory
+        if _is_path(obj_or_path):
+            size = op.getsize(obj_or_path)
+        else:
+            size = get_size(obj_or_path) or 0
+        return size * MEMORY_PER_BYTE
 
     def pre_filter(self, obj, source, target):
         fd = self._funcs.get((source, target), None)
@@ -242,8 +1147,7 @@ class Podoc(object):
     @property
     def file_extensions(self):
         """List of all registered file extensions."""
-        return sorted(set(lang.file_ext for lang in self._langs.values()
-                          if lang.file_ext))
+        return sorted(self._file_exts)
 
     @property
     def conversion_pairs(self):
@@ -253,9 +1157,32 @@ class Podoc(object):
     # File-related methods
     # -------------------------------------------------------------------------
 
+    def _get_routes(self, source):
+        """Return the cheapest routes from a language to all languages
+        reachable from it.
+
+        The routes are computed once per source language, and cached until
+        a new conversion function is registered or a learned cost changes
+        significantly.
+
+        """
+        routes = self._routes.get(source, None)
+        if routes is None:
+            # NOTE: a frozen instance has the routes of all languages.
+            if self.frozen:
+                return {}
+            routes = _shortest_routes(self._graph, source)
+            self._routes[source] = routes
+        return routes
+
     def get_target_languages(self, lang):
         """List of languages to which a given language can be converted to."""
-        return _connected_component(self.conversion_pairs, lang)
+        targets = self._targets.get(lang, None)
+        if targets is None:
+            if self.frozen:
+                return []
+            targets = self._targets[lang] = sorted(self._get_routes(lang))
+        return list(targets)
 
     def get_files_in_dir(self, path, lang=None):
         """Return the list of files of a given language in a directory."""
@@ -270,9 +1197,9 @@ class Podoc(object):
 
     def get_lang_for_file_ext(self, file_ext):
         """Get the language registered with a given file extension."""
-        for name, b in self._langs.items():
-            if b.file_ext == file_ext:
-                return name
+        lang = self._file_exts.get(file_ext, None)
+        if lang is not None:
+            return lang
         raise ValueError(("The file extension `{}` hasn't been "
                           "registered.").format(file_ext))
 
@@ -15,8 +15,8 @@ from six import string_types
 
 from podoc.ast import ASTNode
 from podoc.markdown.renderer import MarkdownRenderer
-from podoc.plugin import IPlugin
-from podoc.tree import TreeTransformer
+from podoc.plugin import IPlugin, markdown_plugin
+from podoc.tree import TreeTransformer, build_tree
 from podoc.utils import _merge_str
 
 logger = logging.getLogger(__name__)
@@ -34,6 +34,11 @@ def _iter_child(cm):
 
 
 class CommonMarkPostProcessor(TreeTransformer):
+    # NOTE: with the iterative engine, the children of a ListItem are
+    # processed before being renamed, which is fine since Para and Plain
+    # have the same handler.
+    iterative = True
+
     def transform_ListItem(self, node):
         """Replace Para by Plain among the ListItem children."""
         for child in node.children:
@@ -49,6 +54,8 @@ class CommonMarkPostProcessor(TreeTransformer):
 
 
 class CommonMarkToAST(TreeTransformer):
+    iterative = True
+
     _name_mapping = {
         'Paragraph': 'Para',
         'Heading': 'Header',
@@ -66,15 +73,31 @@ class CommonMarkToAST(TreeTransformer):
 
     def transform_main(self, cm):
         # TODO: should be def transform() for consistency with the other way
-        children = [self.transform(block)
-                    for block in self.get_node_children(cm)]
-        out = ASTNode('root', children=children)
-        out = CommonMarkPostProcessor().transform(out)
-        return out
-
-    def transform(self, obj):
+        return ASTNode('root', children=list(self.iter_blocks(cm)))
+
+    def iter_blocks(self, cm):
+        """Yield the top-level blocks of a CommonMark document one by one.
+
+        NOTE: every CommonMark block is detached from the document once it
+        has been converted, so that it can be garbage-collected.
+
+        """
+        post = CommonMarkPostProcessor()
+        while cm.first_child is not None:
+            block = cm.first_child
+            cm.first_child = block.nxt
+            if block.nxt is not None:
+                block.nxt.prv = None
+            block.nxt = block.parent = None
+            yield post.transform(self.transform(block))
+        cm.last_child = None
+
+    def _expand(self, obj):
+        """Create the node of a CommonMark node, and return it with the list
+        of its non-processed children, or with None if the output is
+        complete."""
         if isinstance(obj, string_types):
-            return obj
+            return obj, None
         # obj is a CommonMark.Node instance.
         name = self.get_node_name(obj)
 
@@ -86,26 +109,28 @@ class CommonMarkToAST(TreeTransformer):
             # in list_data['type']
             # The name is BulletList or OrderedList.
             name = obj.list_data['type'] + 'List'
-            func = (self.transform_BulletList
-                    if obj.list_data['type'] == 'Bullet'
-                    else self.transform_OrderedList)
-        else:
-            func = getattr(self, 'transform_%s' % name, self.transform_Node)
+        func = self.get_handler(name)
 
         node = ASTNode(name)
         out = func(obj, node)
         # NOTE: if the function returns a node, we directly return it
         # instead of assuming the output is a list of children.
         if isinstance(out, ASTNode):
-            return out
+            return out, None
         # We directly return a string output.
         elif isinstance(out, string_types):
-            return out
+            return out, None
         # Otherwise, the output is a list of non-processed children.
-        children = out
-        assert isinstance(children, list)
-        # Recursively transform all children and assign them to the node.
-        node.children = [self.transform(child) for child in children]
+        assert isinstance(out, list)
+        return node, out
+
+    def transform(self, obj):
+        if self.iterative:
+            return build_tree(obj, self._expand)
+        node, children = self._expand(obj)
+        if children is not None:
+            # Recursively transform all children and assign them to the node.
+            node.children = [self.transform(child) for child in children]
         return node
 
     def transform_Node(self, obj, node):
@@ -176,26 +201,40 @@ class CommonMarkToAST(TreeTransformer):
 
 class ASTToMarkdown(TreeTransformer):
     """Read an AST and render a Markdown string."""
+    iterative = True
 
     def __init__(self):
         self.renderer = MarkdownRenderer()
         # Nested lists.
         self._lists = []
 
-    def get_inner_contents(self, node):
-        delim = ''
+    def get_delimiter(self, child):
+        """Return the delimiter between a child and its next siblings."""
         # What is the delimiter between children? If the children are
         # blocks, we should insert a new line between consecutive blocks.
         # Otherwise we just concatenate the children.
-        if node.children:
-            child = node.children[0]
-            # TODO: improve this.
-            if (isinstance(child, ASTNode) and
-                (child.is_block() or
-                 child.get('_visit_meta', {}).get('is_block', None))):
-                delim = '\n\n'
+        # TODO: improve this.
+        if (isinstance(child, ASTNode) and
+            (child.is_block() or
+             child.get('_visit_meta', {}).get('is_block', None))):
+            return '\n\n'
+        return ''
+
+    def get_inner_contents(self, node):
+        delim = self.get_delimiter(node.children[0]) if node.children else ''
         return delim.join(self.transform_children(node))
 
+    def iter_blocks(self, blocks):
+        """Render a stream of top-level blocks into a stream of Markdown
+        strings, which concatenate into the rendered document."""
+        delim = None
+        for block in blocks:
+            if delim is None:
+                delim = self.get_delimiter(block)
+                yield self.transform(block)
+            else:
+                yield delim + self.transform(block)
+
     def transform_str(self, text):
         return text
 
@@ -323,20 +362,37 @@ def _parse_math(contents):
 
 class MarkdownPlugin(IPlugin):
     def attach(self, podoc):
-        podoc.register_lang('markdown', file_ext='.md')
-        podoc.register_func(source='markdown', target='ast',
-                            func=self.read)
-        podoc.register_func(source='ast', target='markdown',
-                            func=self.write)
+        markdown_plugin.attach(podoc, plugin=self)
 
-    def read(self, contents):
+    def _parse(self, contents):
         assert isinstance(contents, string_types)
         parser = Parser()
         contents = _parse_math(contents)
-        cm = parser.parse(contents)
+        return parser.parse(contents)
+
+    def read(self, contents):
+        cm = self._parse(contents)
         ast = CommonMarkToAST().transform_main(cm)
         return ast
 
+    def read_blocks(self, contents):
+        """Parse a Markdown document and yield its top-level AST blocks one
+        by one.
+
+        The contents is either a string or a stream of strings.
+
+        """
+        if not isinstance(contents, string_types):
+            contents = ''.join(contents)
+        cm = self._parse(contents)
+        del contents
+        return CommonMarkToAST().iter_blocks(cm)
+
     def write(self, ast):
         assert isinstance(ast, (ASTNode, string_types))
         return ASTToMarkdown().transform(ast)
+
+    def write_blocks(self, blocks):
+        """Render a stream of top-level AST blocks into a stream of
+        Markdown strings."""
+        return ASTToMarkdown().iter_blocks(blocks)
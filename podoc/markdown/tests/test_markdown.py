@@ -8,6 +8,7 @@
 #------------------------------------------------------------------------------
 
 import json
+import sys
 
 from pytest import fixture
 from CommonMark import Parser
@@ -227,3 +228,38 @@ def test_markdown_math_block():
     _test_renderer(r'$$\int_a^b f_0(x) dx$$', 'MathBlock')
     _test_renderer(r'$$\begin{eqnarray}\nx &= y\n\end{eqnarray}$$',
                    'MathBlock')
+
+
+#------------------------------------------------------------------------------
+# Test deep documents
+#------------------------------------------------------------------------------
+
+def _block_quotes(depth):
+    node = ASTNode('Para', children=['hello'])
+    for _ in range(depth):
+        node = ASTNode('BlockQuote', children=[node])
+    return ASTNode('root', children=[node])
+
+
+def test_markdown_iterative():
+    md = '> * a *b*\n>\n>   1. `c`\n\nd [e](f)'
+    reader = CommonMarkToAST()
+    reader.iterative = False
+    ast = reader.transform_main(Parser().parse(md))
+    assert CommonMarkToAST().transform_main(Parser().parse(md)) == ast
+
+    writer = ASTToMarkdown()
+    writer.iterative = False
+    assert ASTToMarkdown().transform(ast) == writer.transform(ast)
+
+
+def test_markdown_deep():
+    depth = 2 * sys.getrecursionlimit()
+    md = ASTToMarkdown().transform(_block_quotes(depth))
+    assert md == '> ' * depth + 'hello'
+
+    # The AST is a chain of nested nodes.
+    node = MarkdownPlugin().read(md)
+    for _ in range(depth + 1):
+        assert len(node.children) == 1
+        node = node.children[0]
@@ -49,7 +49,7 @@ from nbformat.v4 import (new_notebook,
 
 from podoc.markdown import MarkdownPlugin
 from podoc.ast import ASTNode  # , TreeTransformer
-from podoc.plugin import IPlugin
+from podoc.plugin import IPlugin, notebook_plugin
 from podoc.utils import _get_file, assert_equal
 
 logger = logging.getLogger(__name__)
@@ -126,8 +126,13 @@ def open_notebook(path):
 
 class NotebookReader(object):
     def read(self, notebook):
-        assert isinstance(notebook, nbformat.NotebookNode)
         self.tree = ASTNode('root')
+        self.tree.children.extend(self.iter_blocks(notebook))
+        return self.tree
+
+    def iter_blocks(self, notebook):
+        """Yield the top-level AST blocks of a notebook, one per cell."""
+        assert isinstance(notebook, nbformat.NotebookNode)
         self.resources = {}  # Dictionary {filename: data}.
         # Language of the notebook.
         m = notebook.metadata
@@ -135,14 +140,16 @@ class NotebookReader(object):
         # by default.
         self.language = m.get('language_info', {}).get('name', 'python')
         for cell_index, cell in enumerate(notebook.cells):
-            getattr(self, 'read_{}'.format(cell.cell_type))(cell, cell_index)
-        return self.tree
+            block = getattr(self, 'read_{}'.format(cell.cell_type))(
+                cell, cell_index)
+            if block is not None:
+                yield block
 
     def read_markdown(self, cell, cell_index=None):
         contents = cell.source
         ast = MarkdownPlugin().read(contents)
         assert len(ast.children) == 1
-        self.tree.children.append(ast.children[0])
+        return ast.children[0]
 
     def read_code(self, cell, cell_index=None):
         node = ASTNode('CodeCell')
@@ -179,9 +186,9 @@ class NotebookReader(object):
                     img_child = ASTNode('Image', url=fn, children=[text])
                     child = ASTNode('Para', children=[img_child])
             node.add_child(child)
-        self.tree.children.append(node)
+        return node
 
-    def read_raw(self, cell):
+    def read_raw(self, cell, cell_index=None):
         # TODO
         pass
 
@@ -189,22 +196,25 @@ class NotebookReader(object):
 class CodeCellWrapper(object):
     def wrap(self, ast):
         self.ast = ast.copy()
-        self.ast.children = []
+        self.ast.children = list(self.iter_wrap(ast.children))
+        return self.ast
+
+    def iter_wrap(self, nodes):
+        """Wrap a stream of top-level blocks within CodeCells."""
         self._code_cell = None
-        for i, node in enumerate(ast.children):
+        for node in nodes:
             if self._code_cell:
                 if self.is_output(node) or self.is_image(node):
                     self.add_output(node)
-                else:
-                    self.end_code_cell()
-            if not self._code_cell:
-                if self.is_source(node):
-                    self.start_code_cell(node)
-                else:
-                    self.append(node)
-        # Ensure the last cell is appended.
-        self.end_code_cell()
-        return self.ast
+                    continue
+                yield self.end_code_cell()
+            if self.is_source(node):
+                self.start_code_cell(node)
+            else:
+                yield node
+        # Ensure the last cell is yielded.
+        if self._code_cell:
+            yield self.end_code_cell()
 
     def is_output(self, node):
         return ((node.name == 'CodeBlock') and
@@ -230,12 +240,8 @@ class CodeCellWrapper(object):
         self._code_cell.add_child(node)
 
     def end_code_cell(self):
-        if self._code_cell:
-            self.append(self._code_cell)
-            self._code_cell = None
-
-    def append(self, node):
-        self.ast.add_child(node)
+        code_cell, self._code_cell = self._code_cell, None
+        return code_cell
 
 
 def wrap_code_cells(ast):
@@ -247,30 +253,37 @@ def _append_newlines(s):
     return '\n'.join(s.rstrip().split('\n')) + '\n'
 
 
+def notebook_from_cells(cells):
+    """Create a notebook from a stream of cells."""
+    nb = new_notebook()
+    nb.cells.extend(cells)
+    nbformat.validate(nb)
+    return nb
+
+
 class NotebookWriter(object):
     def write(self, ast, resources=None):
+        return notebook_from_cells(self.iter_cells(ast.children,
+                                                   resources=resources))
+
+    def iter_cells(self, blocks, resources=None):
+        """Yield the notebook cells of a stream of top-level AST blocks."""
         # Mapping {filename: data}.
         self.resources = resources or {}
         self.execution_count = 1
         self._md = MarkdownPlugin()
         # Add code cells in the AST.
-        ast = wrap_code_cells(ast)
-        # Create the notebook.
-        # new_output, new_code_cell, new_markdown_cell
-        nb = new_notebook()
+        blocks = CodeCellWrapper().iter_wrap(blocks)
         # Go through all top-level blocks.
-        for index, node in enumerate(ast.children):
+        for index, node in enumerate(blocks):
             # Determine the block type.
             if node.name == 'CodeCell':
                 node_type = 'code'
             else:
                 node_type = 'markdown'
             # Create the notebook cell.
-            cell = getattr(self, 'new_{}_cell'.format(node_type))(node, index)
-            # Add it to the notebook.
-            nb.cells.append(cell)
-        nbformat.validate(nb)
-        return nb
+            # new_output, new_code_cell, new_markdown_cell
+            yield getattr(self, 'new_{}_cell'.format(node_type))(node, index)
 
     def new_markdown_cell(self, node, index=None):
         return new_markdown_cell(self._md.write(node))
@@ -352,21 +365,7 @@ class NotebookWriter(object):
 
 class NotebookPlugin(IPlugin):
     def attach(self, podoc):
-        podoc.register_lang('notebook',
-                            file_ext='.ipynb',
-                            load_func=self.load,
-                            dump_func=self.dump,
-                            loads_func=self.loads,
-                            dumps_func=self.dumps,
-                            assert_equal_func=self.assert_equal,
-                            )
-        podoc.register_func(source='notebook', target='ast',
-                            func=self.read,
-                            )
-        podoc.register_func(source='ast', target='notebook',
-                            func=self.write,
-                            pre_filter=wrap_code_cells,
-                            )
+        notebook_plugin.attach(podoc, plugin=self)
 
     def load(self, file_or_path):
         with _get_file(file_or_path, 'r') as f:
@@ -382,6 +381,10 @@ class NotebookPlugin(IPlugin):
     def dumps(self, nb):
         return nbformat.writes(nb, _NBFORMAT_VERSION)
 
+    def dump_cells(self, cells, file_or_path):
+        # NOTE: nbformat can only write whole notebooks.
+        return self.dump(notebook_from_cells(cells), file_or_path)
+
     def assert_equal(self, nb0, nb1):
         return assert_equal(nb0, nb1,
                             to_remove=('metadata', 'kernel_spec'))
@@ -391,3 +394,9 @@ class NotebookPlugin(IPlugin):
 
     def write(self, ast, resources=None):
         return NotebookWriter().write(ast, resources=resources)
+
+    def read_blocks(self, nb):
+        return NotebookReader().iter_blocks(nb)
+
+    def write_blocks(self, blocks, resources=None):
+        return NotebookWriter().iter_cells(blocks, resources=resources)
@@ -12,10 +12,11 @@ import os.path as op
 
 from tornado import web
 import nbformat
-from traitlets import Unicode, Bool
+from traitlets import Unicode, Bool, Integer
 from traitlets.config import Configurable
 from notebook.services.contents.filemanager import FileContentsManager
 
+from podoc.cache import DiskCache, DEFAULT_DISK_CACHE_SIZE
 from podoc.core import Podoc
 from ._notebook import new_notebook
 
@@ -40,10 +41,28 @@ class PodocContentsManager(FileContentsManager, Configurable):
     # This will be passed to the FormatManager, overwriting any config there.
     verbose_metadata = Bool(False, config=True)
 
+    # Cache the conversions on disk, sharing them with the other processes
+    # using the same cache directory.
+    use_cache = Bool(False, config=True)
+    # Cache directory. By default, the podoc cache directory is used.
+    cache_dir = Unicode(config=True)
+    # Maximum size of the cache, in bytes.
+    cache_max_bytes = Integer(DEFAULT_DISK_CACHE_SIZE, config=True)
+
+    # Maximum estimated memory of a conversion, in bytes, or 0 for no limit.
+    # Larger documents are converted block by block when the route supports
+    # it, and refused otherwise.
+    max_conversion_memory = Integer(0, config=True)
+
     def __init__(self, *args, **kwargs):
         super(PodocContentsManager, self).__init__(*args, **kwargs)
 
-        self._podoc = Podoc()
+        cache = (DiskCache(self.cache_dir or None,
+                           max_bytes=self.cache_max_bytes)
+                 if self.use_cache else None)
+        # NOTE: the Podoc instance is frozen since it is shared by all
+        # requests.
+        self._podoc = Podoc(cache=cache).freeze()
 
     def _do_use_podoc(self, file_ext):
         """Determine whether podoc can convert a file extension to a
@@ -110,24 +129,49 @@ class PodocContentsManager(FileContentsManager, Configurable):
             model = self._file_model(path, content=content, format=format)
         return model
 
+    def _use_stream(self, os_path, lang):
+        """Return whether a file must be converted block by block to stay
+        within the memory budget, and raise an error if it cannot be
+        converted within the budget."""
+        budget = self.max_conversion_memory
+        if not budget:
+            return False
+        memory = self._podoc.estimate_memory(os_path)
+        if memory <= budget:
+            return False
+        if not self._podoc.compile(lang, 'notebook').can_stream:
+            raise web.HTTPError(
+                413,
+                u"%s is too large to be converted (about %d MB needed)" %
+                (os_path, memory // 2 ** 20),
+            )
+        logger.debug("Convert %s block by block, about %d MB needed.",
+                     os_path, memory // 2 ** 20)
+        return True
+
     def _read_notebook(self, os_path, as_version=4):
         """Read a notebook from an os path."""
+        file_ext = _file_extension(os_path)
         with self.open(os_path, 'r', encoding='utf-8') as f:
             try:
 
-                file_ext = _file_extension(os_path)
-
                 if file_ext == '.ipynb':
                     return nbformat.read(f, as_version=as_version)
                 else:
-                    # TODO: static resources (images)
                     lang = self._podoc.get_lang_for_file_ext(file_ext)
+                    stream = self._use_stream(os_path, lang)
+                    # TODO: static resources (images)
                     return self._podoc.convert(os_path,
                                                source=lang,
                                                target='notebook',
                                                resources=None,  # TODO
+                                               stream=stream,
                                                )
 
+            except web.HTTPError:
+                # NOTE: files too large to be converted are reported as
+                # such (413).
+                raise
             except Exception as e:  # pragma: no cover
                 logger.exception(e)
                 raise web.HTTPError(
@@ -11,6 +11,7 @@ Taken from https://github.com/jupyter/notebook/blob/master/notebook/services/con
 #------------------------------------------------------------------------------
 
 from itertools import combinations
+import os.path as op
 
 from tornado.web import HTTPError
 import notebook.services.contents.tests.test_manager as tm
@@ -91,6 +92,26 @@ class TestPodocContentsManager(tm.TestContentsManager):
             model2['path'],
             '{0}/{1}'.format(sub_dir.strip('/'), model['name']))
 
+    def test_max_conversion_memory(self):
+        cm = self.contents_manager
+        with open(op.join(self.td, 'big.md'), 'w') as f:
+            f.write('hello *world*\n\n' * 100)
+        # The file is converted block by block when it exceeds the budget.
+        cm.max_conversion_memory = 1
+        assert cm._use_stream(op.join(self.td, 'big.md'), 'markdown')
+        model = cm.get('big.md')
+        self.assertEqual(model['type'], 'notebook')
+
+    def test_read_notebook_errors(self):
+        cm = self.contents_manager
+        path = op.join(self.td, 'file.unknown')
+        with open(path, 'w') as f:
+            f.write('hello')
+        # Unsupported extensions are reported as unreadable notebooks.
+        with self.assertRaises(HTTPError) as e:
+            cm._read_notebook(path)
+        self.assertEqual(e.exception.status_code, 400)
+
     def test_update_md(self):
         cm = self.contents_manager
         # Create a notebook
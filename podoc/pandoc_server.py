@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+"""Pool of long-lived pandoc server processes.
+
+pandoc can run as an HTTP server (`pandoc server`), which converts the
+documents POSTed as JSON objects `{"text": ..., "from": ..., "to": ...}`.
+Sending the conversions of the pandoc plugin to a pool of such servers avoids
+starting a new pandoc process for every document.
+
+"""
+
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+
+import atexit
+import base64
+import json
+import logging
+import math
+from multiprocessing import cpu_count
+import os
+import socket
+import subprocess
+import threading
+import time
+
+from six import text_type
+from six.moves.queue import Queue, Empty
+from six.moves.urllib.error import HTTPError, URLError
+from six.moves.urllib.request import Request, urlopen
+
+from .utils import pandoc, _find_pandoc
+
+logger = logging.getLogger(__name__)
+
+
+#------------------------------------------------------------------------------
+# Utility functions
+#------------------------------------------------------------------------------
+
+class PandocServerError(RuntimeError):
+    """Raised when a pandoc server cannot be started."""
+    pass
+
+
+class PandocConversionError(RuntimeError):
+    """Raised when a pandoc server fails to convert a document."""
+    pass
+
+
+# Timeout of the conversions of `pandoc server` when the pool has none, in
+# seconds: `pandoc server` stops every conversion after 2 seconds by
+# default.
+_MAX_SERVER_TIMEOUT = 365 * 24 * 3600
+
+
+def _free_port():
+    """Return a TCP port that is free on the local host."""
+    s = socket.socket()
+    try:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+    finally:
+        s.close()
+
+
+def _wait_for_server(process, port, timeout):
+    """Wait until a server process accepts connections on a port."""
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        if process.poll() is not None:
+            raise PandocServerError("The pandoc server exited with code "
+                                    "{}.".format(process.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except (IOError, OSError):
+            time.sleep(.01)
+    process.kill()
+    raise PandocServerError("The pandoc server did not start within "
+                            "{} seconds.".format(timeout))
+
+
+#------------------------------------------------------------------------------
+# Pandoc server pool
+#------------------------------------------------------------------------------
+
+class PandocServerPool(object):
+    """Pool of pandoc server processes.
+
+    Servers are started lazily, the first time all running servers are busy.
+    There are never more than `size` concurrent conversions, and thus never
+    more than `size` servers.
+
+    Parameters
+    ----------
+
+    command : list (None)
+        Command starting a server, where `{port}` is replaced by the port
+        of the server, and `{timeout}` by the timeout of the conversions in
+        seconds. By default,
+        `pandoc server --port {port} --timeout {timeout}`.
+    size : int (None)
+        Maximum number of servers. By default, the number of CPUs.
+    timeout : float (None)
+        Timeout of every conversion, in seconds. By default, there is no
+        limit, like with new pandoc processes.
+    startup_timeout : float (10.)
+        Timeout of the server startup, in seconds.
+
+    """
+    def __init__(self, command=None, size=None, timeout=None,
+                 startup_timeout=10.):
+        self.command = command or [_find_pandoc() or 'pandoc',
+                                   'server', '--port', '{port}',
+                                   '--timeout', '{timeout}']
+        self.size = size or cpu_count()
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.pid = os.getpid()
+        self._processes = {}  # mapping `url => process`
+        self._idle = Queue()  # URLs of the idle servers
+        self._semaphore = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+
+    @property
+    def n_servers(self):
+        """Number of running servers."""
+        return len(self._processes)
+
+    def _start_server(self):
+        port = _free_port()
+        timeout = (int(math.ceil(self.timeout)) if self.timeout is not None
+                   else _MAX_SERVER_TIMEOUT)
+        command = [arg.format(port=port, timeout=timeout)
+                   for arg in self.command]
+        logger.debug("Start pandoc server `%s`.", ' '.join(command))
+        try:
+            with open(os.devnull, 'w') as devnull:
+                process = subprocess.Popen(command, stdout=devnull,
+                                           stderr=devnull)
+        except OSError as e:
+            raise PandocServerError(str(e))
+        _wait_for_server(process, port, self.startup_timeout)
+        url = 'http://127.0.0.1:{}/'.format(port)
+        self._processes[url] = process
+        return url
+
+    def _acquire(self):
+        """Return the URL of an idle server, starting one if needed."""
+        self._semaphore.acquire()
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+        try:
+            with self._lock:
+                return self._start_server()
+        except Exception:
+            self._semaphore.release()
+            raise
+
+    def _release(self, url):
+        self._idle.put(url)
+        self._semaphore.release()
+
+    def _post(self, url, data):
+        request = Request(url, data=json.dumps(data).encode('utf-8'),
+                          headers={'Content-Type': 'application/json',
+                                   'Accept': 'application/json'})
+        try:
+            response = urlopen(request, timeout=self.timeout)
+        except HTTPError as e:
+            raise PandocConversionError("pandoc error: {}".format(
+                                        e.read().decode('utf-8', 'replace')))
+        try:
+            return json.loads(response.read().decode('utf-8'))
+        finally:
+            response.close()
+
+    def convert(self, text, to, format):
+        """Convert a string with one of the servers of the pool.
+
+        Binary formats are returned as bytes.
+
+        """
+        if not isinstance(text, text_type):
+            text = text.decode('utf-8')
+        url = self._acquire()
+        try:
+            out = self._post(url, {'text': text, 'from': format, 'to': to})
+        except (URLError, socket.error):
+            # NOTE: an unreachable server is removed from the pool.
+            with self._lock:
+                process = self._processes.pop(url, None)
+            if process is not None:
+                process.kill()
+            self._semaphore.release()
+            raise
+        except Exception:
+            self._release(url)
+            raise
+        self._release(url)
+        for message in out.get('messages', []):
+            logger.debug("pandoc: %s", message)
+        if out.get('base64', False):
+            return base64.b64decode(out['output'])
+        return out['output']
+
+    def close(self):
+        """Stop all servers."""
+        while self._processes:
+            _, process = self._processes.popitem()
+            if process.poll() is None:
+                process.terminate()
+                process.wait()
+        self._idle = Queue()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _set_pool(pool):
+    global _pool
+    if _pool and _pool.pid == os.getpid():
+        _pool.close()
+    _pool = pool if pool is not None else False
+
+
+def get_pandoc_pool():
+    """Return the pandoc server pool of the current process, creating it if
+    needed.
+
+    Return None if the pool has been disabled with `set_pandoc_pool(None)`.
+
+    """
+    with _pool_lock:
+        # NOTE: a pool inherited from a parent process is not usable.
+        inherited = _pool and _pool.pid != os.getpid()
+        if _pool is None or inherited:
+            _set_pool(PandocServerPool())
+        return _pool or None
+
+
+def set_pandoc_pool(pool):
+    """Set the pandoc server pool of the current process.
+
+    With None, the conversions are made by new pandoc processes.
+
+    """
+    with _pool_lock:
+        _set_pool(pool)
+
+
+@atexit.register
+def _close_pool():
+    with _pool_lock:
+        if _pool and _pool.pid == os.getpid():
+            _pool.close()
+
+
+def pandoc_convert(text, to, format):
+    """Convert a string with the pandoc server pool.
+
+    If no pandoc server can be started, for example with versions of pandoc
+    without a server mode, the pool is disabled and every conversion starts
+    a new pandoc process. If a server fails or dies during a conversion, the
+    conversion is made by a new pandoc process.
+
+    """
+    pool = get_pandoc_pool()
+    if pool is not None:
+        try:
+            return pool.convert(text, to, format=format)
+        except PandocServerError as e:
+            logger.debug("Disable the pandoc server pool: %s", e)
+            set_pandoc_pool(None)
+        except (PandocConversionError, URLError, socket.error) as e:
+            # NOTE: a dead server has been removed from the pool, which
+            # starts a new one for the next conversions.
+            logger.debug("The pandoc server failed: %s", e)
+    return pandoc(text, to, format=format)
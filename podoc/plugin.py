@@ -12,11 +12,13 @@ Code from http://eli.thegreenplace.net/2012/08/07/fundamental-concepts-of-plugin
 #------------------------------------------------------------------------------
 
 import imp
+from importlib import import_module
 import logging
 import os
 import os.path as op
+import threading
 
-from six import with_metaclass
+from six import string_types, with_metaclass
 
 logger = logging.getLogger(__name__)
 
@@ -25,36 +27,233 @@ logger = logging.getLogger(__name__)
 # IPlugin interface
 #------------------------------------------------------------------------------
 
+# Lock of the plugin registry and of the imports of the lazy plugins.
+_lock = threading.RLock()
+
+
 class IPluginRegistry(type):
+    # NOTE: the list of plugins is never modified in place: registering a
+    # plugin replaces it by a new list, so that it can be read from any
+    # thread without a lock.
     plugins = []
 
     def __init__(cls, name, bases, attrs):
         if name != 'IPlugin':
             logger.debug("Register plugin %s.", name)
-            if cls not in IPluginRegistry.plugins:
-                IPluginRegistry.plugins.append(cls)
+            with _lock:
+                if cls not in IPluginRegistry.plugins:
+                    IPluginRegistry.plugins = IPluginRegistry.plugins + [cls]
 
 
 class IPlugin(with_metaclass(IPluginRegistry)):
+    # Version of the plugin, used in the keys of the conversion caches.
+    version = None
+
     def attach(self, podoc):
         pass
 
 
 def get_plugin(name):
-    """Get a plugin class from its name."""
+    """Get a plugin class from its name.
+
+    A built-in plugin that has not been imported yet is returned as a
+    `LazyPlugin` descriptor.
+
+    """
     name = name.lower()
-    for plugin in IPluginRegistry.plugins:
+    for plugin in IPluginRegistry.plugins + _BUILTIN_PLUGINS:
         if name in plugin.__name__.lower():
             return plugin
     raise ValueError("The plugin %s cannot be found." % name)
 
 
 def get_plugins():
-    plugins = list(IPluginRegistry.plugins)
-    from .ast import PandocPlugin
-    plugins.remove(PandocPlugin)
-    plugins = plugins + [PandocPlugin]
-    return plugins
+    """Return the list of plugins to load by default.
+
+    Built-in plugins that have not been imported yet are returned as
+    `LazyPlugin` descriptors. The pandoc plugin always comes last.
+
+    """
+    plugins = IPluginRegistry.plugins
+    registered = {p.__name__: p for p in plugins}
+    builtins = [registered.pop(p.__name__, p) for p in _BUILTIN_PLUGINS]
+    others = [p for p in plugins if p.__name__ in registered]
+    return builtins[:-1] + others + builtins[-1:]
+
+
+#------------------------------------------------------------------------------
+# Lazy plugins
+#------------------------------------------------------------------------------
+
+def _is_func_arg(name):
+    return name == 'func' or name.endswith(('_func', '_filter'))
+
+
+def _get_plugin_func(plugin, name):
+    """Return a method of a plugin, or a function of its module."""
+    func = getattr(plugin, name, None)
+    if func is None:
+        func = getattr(import_module(plugin.__class__.__module__), name)
+    return func
+
+
+class LazyFunction(object):
+    """Proxy of a plugin function, which imports the plugin the first time
+    it is called."""
+    def __init__(self, plugin, name):
+        self.plugin = plugin
+        self.name = name
+        self._func = None
+        self._with_resources = False
+
+    def resolve(self):
+        """Import the plugin and return the actual function."""
+        if self._func is None:
+            from .core import _accepts_resources
+            with _lock:
+                if self._func is None:
+                    func = self.plugin.resolve(self.name)
+                    self._with_resources = _accepts_resources(func)
+                    self._func = func
+        return self._func
+
+    def __call__(self, *args, **kwargs):
+        func = self.resolve()
+        # NOTE: the proxy always accepts resources, and only passes them
+        # to the function if it accepts them.
+        if not self._with_resources:
+            kwargs.pop('resources', None)
+        return func(*args, **kwargs)
+
+    def __repr__(self):
+        return '<LazyFunction {}.{}>'.format(self.plugin.__name__, self.name)
+
+
+class LazyPlugin(object):
+    """Lightweight descriptor of a plugin.
+
+    The languages and conversion functions of the plugin are declared with
+    `register_lang()` and `register_func()`, which accept the same arguments
+    as the `Podoc` methods, except that functions are given by the names of
+    the plugin's methods (or of functions of the plugin's module).
+
+    Attaching the descriptor to a `Podoc` instance registers proxy functions:
+    the plugin's module and its dependencies are only imported the first time
+    one of them is called. A descriptor without declarations imports and
+    attaches the plugin right away.
+
+    """
+    def __init__(self, module, name, version=None):
+        self.module = module
+        self.__name__ = name
+        self.version = version
+        self._langs = []
+        self._funcs = []
+        self._plugin = None
+
+    def __repr__(self):
+        return '<LazyPlugin {}.{}>'.format(self.module, self.__name__)
+
+    def __getstate__(self):
+        # NOTE: the plugin instance is imported again after unpickling.
+        state = self.__dict__.copy()
+        state['_plugin'] = None
+        return state
+
+    def register_lang(self, name, **kwargs):
+        self._langs.append(dict(name=name, **kwargs))
+
+    def register_func(self, **kwargs):
+        self._funcs.append(kwargs)
+
+    @property
+    def plugin_class(self):
+        """Import the plugin's module and return the plugin class."""
+        return getattr(import_module(self.module), self.__name__)
+
+    def resolve(self, name):
+        """Import the plugin and return one of its functions."""
+        if self._plugin is None:
+            with _lock:
+                if self._plugin is None:
+                    logger.debug("Import plugin %s.", self.__name__)
+                    self._plugin = self.plugin_class()
+        return _get_plugin_func(self._plugin, name)
+
+    def attach(self, podoc, plugin=None):
+        """Register the plugin's languages and functions.
+
+        If a plugin instance is given, its functions are registered directly
+        instead of lazy proxies.
+
+        """
+        if not self._langs and not self._funcs:
+            plugin = plugin or self.plugin_class()
+            self.version = plugin.version
+            return plugin.attach(podoc)
+
+        def _bind(kwargs):
+            return {k: ((_get_plugin_func(plugin, v) if plugin
+                         else LazyFunction(self, v))
+                        if _is_func_arg(k) and isinstance(v, string_types)
+                        else v)
+                    for k, v in kwargs.items()}
+
+        for kwargs in self._langs:
+            podoc.register_lang(**_bind(kwargs))
+        for kwargs in self._funcs:
+            podoc.register_func(**_bind(kwargs))
+
+
+#------------------------------------------------------------------------------
+# Built-in plugins
+#------------------------------------------------------------------------------
+
+ast_plugin = LazyPlugin('podoc.ast._ast', 'ASTPlugin')
+# An object in the language 'ast' is an instance of AST.
+ast_plugin.register_lang('ast', file_ext='.json',
+                         load_func='load', dump_func='dump',
+                         loads_func='loads', dumps_func='dumps',
+                         assert_equal_func='assert_equal',
+                         load_stream_func='load_blocks',
+                         dump_stream_func='dump_blocks',
+                         split_func='iter_blocks',
+                         join_func='join_blocks',
+                         )
+
+
+markdown_plugin = LazyPlugin('podoc.markdown._markdown', 'MarkdownPlugin')
+markdown_plugin.register_lang('markdown', file_ext='.md')
+markdown_plugin.register_func(source='markdown', target='ast',
+                              func='read', stream_func='read_blocks')
+markdown_plugin.register_func(source='ast', target='markdown',
+                              func='write', stream_func='write_blocks')
+
+
+notebook_plugin = LazyPlugin('podoc.notebook._notebook', 'NotebookPlugin')
+notebook_plugin.register_lang('notebook', file_ext='.ipynb',
+                              load_func='load', dump_func='dump',
+                              loads_func='loads', dumps_func='dumps',
+                              assert_equal_func='assert_equal',
+                              dump_stream_func='dump_cells',
+                              join_func='notebook_from_cells',
+                              )
+notebook_plugin.register_func(source='notebook', target='ast',
+                              func='read', stream_func='read_blocks',
+                              )
+notebook_plugin.register_func(source='ast', target='notebook',
+                              func='write', pre_filter='wrap_code_cells',
+                              stream_func='write_blocks',
+                              )
+
+
+# NOTE: the pandoc formats are only known once pandoc has been called, so
+# this plugin is attached eagerly.
+pandoc_plugin = LazyPlugin('podoc.ast._ast', 'PandocPlugin')
+
+
+_BUILTIN_PLUGINS = [ast_plugin, markdown_plugin, notebook_plugin,
+                    pandoc_plugin]
 
 
 #------------------------------------------------------------------------------
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+"""Conversion instrumentation."""
+
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import logging
+import threading
+import time
+from timeit import default_timer
+
+from six import string_types, binary_type
+
+from .tree import TreeTransformer
+from .utils import Bunch
+
+logger = logging.getLogger(__name__)
+
+try:
+    _cpu_time = time.process_time
+except AttributeError:  # pragma: no cover
+    _cpu_time = time.clock  # Python 2
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None  # Python 2
+
+
+#------------------------------------------------------------------------------
+# Stage records
+#------------------------------------------------------------------------------
+
+# Stages of a conversion, in the order in which they run.
+STAGES = ('load', 'pre_filter', 'func', 'post_filter', 'dump')
+
+
+def get_size(obj):
+    """Return the size of a document: the number of characters or bytes of
+    a string, or the length of the JSON serialization of a tree."""
+    if isinstance(obj, (string_types, binary_type)):
+        return len(obj)
+    from .cache import _serialize
+    try:
+        return len(_serialize(obj))
+    except (TypeError, ValueError):  # pragma: no cover
+        return None
+
+
+def _get_string_size(obj):
+    """Return the size of a string, or None for other objects."""
+    if isinstance(obj, (string_types, binary_type)):
+        return len(obj)
+
+
+def _is_tracing():
+    return tracemalloc is not None and tracemalloc.is_tracing()
+
+
+# Highest peak of the traced memory erased by `_reset_peak()`, so that the
+# measurements of the stages do not hide the peak of `track_memory()`.
+_erased_peak = [0]
+
+
+def _reset_peak():
+    """Reset the peak of the traced memory, and return the current traced
+    memory."""
+    current, peak = tracemalloc.get_traced_memory()
+    # NOTE: without `reset_peak()` (Python < 3.9), the peak is the peak
+    # since tracemalloc was started.
+    if hasattr(tracemalloc, 'reset_peak'):
+        _erased_peak[0] = max(_erased_peak[0], peak)
+        tracemalloc.reset_peak()
+    return current
+
+
+class Timer(object):
+    """Measure the wall time and CPU time elapsed since its creation, and
+    the peak memory allocated since then if tracemalloc is tracing."""
+    def __init__(self):
+        self._memory = _reset_peak() if _is_tracing() else None
+        self._wall = default_timer()
+        self._cpu = _cpu_time()
+
+    @property
+    def wall_time(self):
+        return default_timer() - self._wall
+
+    @property
+    def cpu_time(self):
+        return _cpu_time() - self._cpu
+
+    @property
+    def peak_memory(self):
+        if self._memory is None or not _is_tracing():
+            return None
+        return max(0, tracemalloc.get_traced_memory()[1] - self._memory)
+
+
+def emit(hooks, stage, source, target, timer, input=None, output=None,
+         input_size=None, output_size=None):
+    """Pass the record of a stage to instrumentation hooks.
+
+    The record is a `Bunch` with the stage name, the source and target
+    languages of the edge, the wall time and CPU time in seconds, the sizes
+    of the input and of the output, and the peak memory allocated by the
+    stage in bytes, or None if tracemalloc is not tracing.
+
+    The size of a tree is None, unless a hook has a true `measure_sizes`
+    attribute: the tree is then serialized with `get_size()`, which may
+    take longer than the stage itself.
+
+    """
+    measure_sizes = any(getattr(hook, 'measure_sizes', False)
+                        for hook in hooks)
+    size = get_size if measure_sizes else _get_string_size
+    record = Bunch(stage=stage,
+                   source=source,
+                   target=target,
+                   wall_time=timer.wall_time,
+                   cpu_time=timer.cpu_time,
+                   peak_memory=timer.peak_memory,
+                   input_size=(input_size if input_size is not None
+                               else size(input)),
+                   output_size=(output_size if output_size is not None
+                                else size(output)),
+                   )
+    for hook in hooks:
+        hook(record)
+
+
+@contextmanager
+def track_memory():
+    """Track the memory allocated within a `with` block with tracemalloc.
+
+    Yield a `Bunch` whose `peak` and `allocated` fields are set at the end
+    of the block to the peak memory and the memory still allocated, in
+    bytes, relative to the start of the block.
+
+    """
+    assert tracemalloc is not None
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    base = _reset_peak()
+    erased, _erased_peak[0] = _erased_peak[0], 0
+    info = Bunch(peak=None, allocated=None)
+    try:
+        yield info
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, _erased_peak[0])
+        # The peak of this block is also a peak of the enclosing blocks.
+        _erased_peak[0] = max(erased, peak)
+        info.peak = max(0, peak - base)
+        info.allocated = current - base
+        if started:
+            tracemalloc.stop()
+
+
+#------------------------------------------------------------------------------
+# Conversion stats
+#------------------------------------------------------------------------------
+
+class ConversionStats(object):
+    """Instrumentation hook keeping the records of all conversion stages.
+
+    An instance is passed to `Podoc.add_hook()`. The CPU time is the CPU
+    time of the whole process, so it includes the other threads.
+
+    Parameters
+    ----------
+
+    measure_sizes : bool (False)
+        Whether to measure the size of the trees, and not only the size of
+        the strings, at the cost of a JSON serialization of every tree.
+
+    """
+    def __init__(self, measure_sizes=False):
+        self.measure_sizes = measure_sizes
+        self.records = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def summary(self):
+        """Return the total time and sizes per stage and per edge.
+
+        The output is an ordered dictionary `{(stage, source, target):
+        Bunch(count, wall_time, cpu_time, input_size, output_size)}`, sorted
+        by decreasing wall time.
+
+        """
+        totals = {}
+        for r in self.records:
+            key = (r.stage, r.source, r.target)
+            t = totals.get(key, None)
+            if t is None:
+                t = totals[key] = Bunch(count=0, wall_time=0., cpu_time=0.,
+                                        input_size=0, output_size=0)
+            t.count += 1
+            t.wall_time += r.wall_time
+            t.cpu_time += r.cpu_time
+            t.input_size += r.input_size or 0
+            t.output_size += r.output_size or 0
+        return OrderedDict(sorted(totals.items(),
+                                  key=lambda item: -item[1].wall_time))
+
+    def __str__(self):
+        lines = ['{:<12} {:<24} {:>6} {:>10} {:>10} {:>10} {:>10}'.format(
+                 'stage', 'edge', 'count', 'wall (ms)', 'cpu (ms)',
+                 'in', 'out')]
+        for (stage, source, target), t in self.summary().items():
+            edge = ' -> '.join(_ for _ in (source, target) if _)
+            lines.append('{:<12} {:<24} {:>6d} {:>10.2f} {:>10.2f} '
+                         '{:>10d} {:>10d}'.format(
+                             stage, edge, t.count,
+                             t.wall_time * 1000, t.cpu_time * 1000,
+                             t.input_size, t.output_size))
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+
+#------------------------------------------------------------------------------
+# Handler profiling
+#------------------------------------------------------------------------------
+
+class HandlerProfiler(object):
+    """Count the calls and measure the time of the transformation methods of
+    tree transformers, like `ASTToMarkdown.transform_BulletList`.
+
+    The total time of a method includes the methods it calls, and its own
+    time excludes the other transformation methods it calls. The total time
+    of a recursive method is only counted once. With the iterative engine of
+    `TreeTransformer`, the methods do not call each other, and both times
+    are equal.
+
+    """
+    def __init__(self):
+        self.stats = {}  # mapping `Class.transform_name => Bunch()`
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _state(self):
+        local = self._local
+        if not hasattr(local, 'stack'):
+            # Time spent in nested methods, for every running method.
+            local.stack = []
+            # Number of running calls of every method.
+            local.active = {}
+        return local
+
+    def wrap(self, transformer, handler):
+        """Return a profiled version of a transformation method."""
+        key = '{}.{}'.format(transformer.__class__.__name__,
+                             getattr(handler, '__name__', repr(handler)))
+
+        def profiled(*args, **kwargs):
+            state = self._state()
+            state.stack.append(0.)
+            state.active[key] = state.active.get(key, 0) + 1
+            t = default_timer()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                elapsed = default_timer() - t
+                nested = state.stack.pop()
+                if state.stack:
+                    state.stack[-1] += elapsed
+                state.active[key] -= 1
+                outermost = state.active[key] == 0
+                self._record(key, elapsed if outermost else 0.,
+                             elapsed - nested)
+        return profiled
+
+    def _record(self, key, total_time, self_time):
+        with self._lock:
+            b = self.stats.get(key, None)
+            if b is None:
+                b = self.stats[key] = Bunch(count=0, total_time=0.,
+                                            self_time=0.)
+            b.count += 1
+            b.total_time += total_time
+            b.self_time += self_time
+
+    def summary(self):
+        """Return the stats of the methods, sorted by decreasing own
+        time."""
+        return OrderedDict(sorted(self.stats.items(),
+                                  key=lambda item: -item[1].self_time))
+
+    def __str__(self):
+        lines = ['{:<48} {:>8} {:>10} {:>10}'.format(
+                 'handler', 'count', 'self (ms)', 'total (ms)')]
+        for key, b in self.summary().items():
+            lines.append('{:<48} {:>8d} {:>10.2f} {:>10.2f}'.format(
+                         key, b.count, b.self_time * 1000,
+                         b.total_time * 1000))
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self.stats = {}
+
+
+@contextmanager
+def profile_handlers(profiler=None):
+    """Profile the transformation methods of all tree transformers within a
+    `with` block, and yield the `HandlerProfiler`.
+
+    Printing the profiler after the block shows the number of calls and the
+    time spent in every method.
+
+    """
+    profiler = profiler or HandlerProfiler()
+    previous = TreeTransformer._profiler
+    TreeTransformer._profiler = profiler
+    try:
+        yield profiler
+    finally:
+        TreeTransformer._profiler = previous
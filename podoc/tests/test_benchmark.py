@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""Test benchmarks."""
+
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+
+import os.path as op
+
+from click.testing import CliRunner
+from pytest import skip
+
+from ..benchmark import (SHAPES, generate_markdown, generate_corpus,
+                         benchmark_edges, format_results, save_baseline,
+                         load_baseline, find_regressions, fit_exponent,
+                         measure_scaling, check_scaling, find_superlinear,
+                         format_scalings, measure_startup, benchmark)
+from ..core import Podoc
+
+
+#------------------------------------------------------------------------------
+# Tests
+#------------------------------------------------------------------------------
+
+def test_generate_markdown():
+    md = generate_markdown(n_sections=2)
+    assert md == generate_markdown(n_sections=2)
+    assert md != generate_markdown(n_sections=2, seed=1)
+    assert md.count('## Section') == 2
+    assert '```python' in md
+    assert '![Figure 0]' in md
+    assert '$$' in md
+    # No image right after a code block: it would be a code cell output.
+    assert '```\n\n![' not in md
+
+    md = generate_markdown(n_sections=1, **SHAPES['lists'])
+    assert '```' not in md
+    # Deepest list level.
+    assert '\n' + ' ' * 15 + '1. ' in md
+
+
+def test_benchmark_edges(tempdir):
+    p = Podoc(with_pandoc=False)
+    corpus = generate_corpus(p, size=1)
+    assert 'ast' in corpus
+    assert 'notebook' in corpus
+
+    pairs = [('markdown', 'ast'), ('ast', 'markdown'), ('unknown', 'ast')]
+    results = benchmark_edges(p, corpus, repeat=1, pairs=pairs)
+    assert sorted(results) == ['ast->markdown', 'markdown->ast']
+    r = results['markdown->ast']
+    assert r.size == len(corpus['markdown'])
+    assert r.blocks == len(corpus['ast'].children)
+    assert r.mb_per_s > 0
+    assert 'markdown->ast' in format_results(results)
+
+    path = op.join(tempdir, 'baseline.json')
+    save_baseline(results, path)
+    baseline = load_baseline(path)
+    assert baseline['markdown->ast'].time == r.time
+    assert '+0%' in format_results(results, baseline)
+    assert load_baseline(op.join(tempdir, 'unknown.json')) is None
+
+    assert not find_regressions(results, baseline)
+    baseline['markdown->ast'].time /= 2
+    assert list(find_regressions(results, baseline)) == ['markdown->ast']
+
+
+def test_generate_corpus_failing_target():
+    p = Podoc(with_pandoc=False)
+
+    def fail(ast):
+        raise ValueError("broken")
+
+    p.register_func(source='ast', target='broken', func=fail)
+    corpus = generate_corpus(p, size=1)
+    assert 'broken' not in corpus
+    assert 'markdown' in corpus
+
+
+def test_benchmark_cli(tempdir):
+    path = op.join(tempdir, 'baseline.json')
+    runner = CliRunner()
+    result = runner.invoke(benchmark, ['--repeat', '1', '--baseline', path,
+                                       '--save'])
+    assert result.exit_code == 0
+    assert 'markdown->ast' in result.output
+    assert op.exists(path)
+
+
+def test_fit_exponent():
+    sizes = [1, 2, 4, 8]
+    assert round(fit_exponent(sizes, [3. * n for n in sizes]), 6) == 1
+    assert round(fit_exponent(sizes, [3. * n * n for n in sizes]), 6) == 2
+
+
+def test_measure_scaling():
+    def quadratic(n):
+        return sum(1 for i in range(n) for j in range(n))
+
+    ns = [200, 400, 800]
+    s = measure_scaling(quadratic, ns, repeat=3, sizes=ns)
+    assert s.sizes == ns
+    assert len(s.times) == 3
+    assert s.exponent > 1.5
+    assert find_superlinear({'quadratic': s}) == {'quadratic': s.exponent}
+    assert find_superlinear({'quadratic': s}, known=('quadratic',)) == {}
+    assert 'quadratic' in format_scalings({'quadratic': s})
+
+    # By default, the size is the size of the input.
+    s = measure_scaling(lambda x: x * 2, ['a' * 1000, 'a' * 2000], repeat=1)
+    assert s.sizes == [1000, 2000]
+
+
+def test_check_scaling():
+    scalings = check_scaling(sizes=(1, 2), depths=(2, 4), repeat=1)
+    assert 'markdown->ast (size)' in scalings
+    assert 'ast->markdown (depth)' in scalings
+    assert 'show_tree (size)' in scalings
+    assert '_merge_str' in scalings
+    assert '_shortest_routes' in scalings
+    for s in scalings.values():
+        assert len(s.sizes) == len(s.times) == 2
+    assert 'show_tree (size)' in format_scalings(scalings)
+
+
+def test_scaling(request):
+    """Check that all readers and writers scale linearly."""
+    if not request.config.getoption('--scaling'):
+        skip("Pass --scaling to check the scaling of the readers and "
+             "writers.")
+    scalings = check_scaling()
+    assert not find_superlinear(scalings), format_scalings(scalings)
+
+
+def test_startup():
+    s = measure_startup(repeat=1)
+    assert s.time > 0
+    assert s.heavy == []
+    assert not s.git
+
+    runner = CliRunner()
+    result = runner.invoke(benchmark, ['--startup', '--repeat', '1'])
+    assert result.exit_code == 0
+    assert 'Import time' in result.output
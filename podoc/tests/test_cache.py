@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""Test conversion caches."""
+
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+
+import json
+import os
+import os.path as op
+import sys
+
+from ..cache import (MemoryCache, DiskCache, cache_key,
+                     DEFAULT_MEMORY_CACHE_SIZE, _serialize, _copy)
+from ..core import Podoc
+from ..tree import Node, TreeTransformer
+from ..utils import _remove
+
+
+#------------------------------------------------------------------------------
+# Tests
+#------------------------------------------------------------------------------
+
+def test_cache_key():
+    key = cache_key('hello', ['a', 'b'])
+    assert key == cache_key(u'hello', ('a', 'b'))
+    assert key != cache_key('hello!', ['a', 'b'])
+    assert key != cache_key('hello', ['a', 'c', 'b'])
+    assert key != cache_key('hello', ['a', 'b'], versions=[('a', '1')])
+    assert key != cache_key('hello', ['a', 'b'], resources={'x': b'0'})
+    assert (cache_key({'a': [1, {'b': 2}]}, ['a']) ==
+            cache_key({'a': [1, {'b': 2}]}, ['a']))
+
+
+def test_cache_key_links():
+    root = Node('root', children=[Node('a'), Node('b')])
+    key = cache_key(root, ['a'])
+    # The transformers may link the siblings of the tree.
+    t = TreeTransformer()
+    t.link_siblings = True
+    t.transform_children(root)
+    assert root.children[0]._visit_meta['nxt'] is root.children[1]
+    assert cache_key(root, ['a']) == key
+
+
+def test_serialize_copy():
+    doc = {'b': [1, 'x', None, True, 1.5, (2, 3), {}], 'a': b'0', '_c': 1,
+           'd': Node('root', children=['x'])}
+    assert _serialize(doc) == json.dumps(_remove(doc), sort_keys=True,
+                                         default=repr).encode('utf-8')
+    copy = _copy(doc)
+    assert copy == doc
+    assert copy['b'] is not doc['b']
+    assert isinstance(copy['d'], Node)
+
+    # Circular links are preserved.
+    root = Node('root', children=[Node('a')])
+    root.children[0]._visit_meta['parent'] = root
+    copy = _copy(root)
+    assert copy.children[0]._visit_meta['parent'] is copy
+
+
+def test_deep_document():
+    depth = 2 * sys.getrecursionlimit()
+    root = node = Node('0')
+    for i in range(depth):
+        node = node.add_child(Node(str(i)))
+    assert cache_key(root, ['a']) == cache_key(_copy(root), ['a'])
+
+    cache = MemoryCache()
+    cache.put('key', root)
+    node = cache.get('key')
+    for _ in range(depth):
+        node = node.children[0]
+    assert node.name == str(depth - 1)
+
+
+def test_disk_cache_deep(tempdir):
+    depth = 10 * sys.getrecursionlimit()
+    root = node = Node('0')
+    for i in range(depth):
+        node = node.add_child(Node(str(i)))
+    cache = DiskCache(tempdir)
+    # Documents too deep to be pickled are not cached, without error.
+    cache.put('key', root)
+    obj = cache.get('key')
+    assert obj is None or obj.name == '0'
+
+
+def test_memory_cache():
+    c = MemoryCache(max_items=2)
+    assert c.get('a') is None
+    assert c.misses == 1
+
+    c.put('a', 'aa')
+    c.put('b', 'bb')
+    assert c.get('a') == 'aa'
+    assert c.hits == 1
+
+    # 'b' is the least recently used item.
+    c.put('c', 'cc')
+    assert len(c) == 2
+    assert 'b' not in c
+    assert 'a' in c
+
+    # Cached objects are copies.
+    c.put('d', {'x': [1]})
+    d = c.get('d')
+    d['x'].append(2)
+    assert c.get('d') == {'x': [1]}
+
+    c.clear()
+    assert len(c) == 0
+    assert c.n_bytes == 0
+
+
+def test_memory_cache_bytes():
+    c = MemoryCache(max_bytes=10)
+    c.put('a', 'x' * 4)
+    c.put('b', 'y' * 4)
+    assert c.n_bytes == 8
+    c.put('c', 'z' * 4)
+    assert c.n_bytes == 8
+    assert 'a' not in c
+    # Too large items are not cached.
+    c.put('d', 'w' * 20)
+    assert 'd' not in c
+    assert len(c) == 2
+
+
+def test_disk_cache(tempdir):
+    c = DiskCache(tempdir, max_bytes=200)
+    assert c.get('aaaa') is None
+    assert c.misses == 1
+
+    c.put('aaaa', 'x' * 50)
+    c.put('bbbb', {'x': [1]})
+    assert c.get('aaaa') == 'x' * 50
+    assert c.get('bbbb') == {'x': [1]}
+    assert c.hits == 2
+    assert len(c) == 2
+    assert 0 < c.n_bytes < 200
+
+    # The cache is shared by all instances using the same directory.
+    c2 = DiskCache(tempdir, max_bytes=200)
+    assert 'aaaa' in c2
+    assert c2.get('bbbb') == {'x': [1]}
+
+    # Too large items are not cached.
+    c.put('cccc', 'y' * 300)
+    assert 'cccc' not in c
+
+    c.clear()
+    assert len(c) == 0
+    assert c.n_bytes == 0
+
+
+def test_disk_cache_gc(tempdir):
+    c = DiskCache(tempdir, max_bytes=200)
+    for i, key in enumerate(('aaaa', 'bbbb', 'cccc')):
+        c.put(key, 'x' * 50)
+        # NOTE: set the access times explicitly, as the resolution of the
+        # file modification times may be coarse.
+        path = c._entry_path(key)
+        os.utime(path, (i, i))
+    # The least recently used items are evicted until the cache is below
+    # 75% of its size cap.
+    c.put('dddd', 'x' * 50)
+    assert 'aaaa' not in c
+    assert 'bbbb' not in c
+    assert 'cccc' in c
+    assert 'dddd' in c
+    assert c.n_bytes <= 150
+    assert c.n_bytes == sum(op.getsize(c._entry_path(key))
+                            for key in ('cccc', 'dddd'))
+
+
+def test_podoc_disk_cache(tempdir):
+    def _podoc():
+        p = Podoc(plugins=[], with_pandoc=False, cache=tempdir)
+        p.register_lang('a')
+        p.register_lang('b')
+        return p
+
+    p = _podoc()
+    assert isinstance(p.cache, DiskCache)
+    calls = []
+
+    @p.register_func(source='a', target='b')
+    def a_to_b(x):
+        calls.append(x)
+        return x.upper()
+
+    assert p.convert('hello', source='a', target='b') == 'HELLO'
+    assert calls == ['hello']
+
+    # Another instance, for example in another process, reuses the result.
+    p2 = _podoc()
+
+    @p2.register_func(source='a', target='b')
+    def a_to_b_2(x):
+        calls.append(x)
+        return x.upper()
+
+    assert p2.convert('hello', source='a', target='b') == 'HELLO'
+    assert calls == ['hello']
+    assert p2.cache.hits == 1
+
+
+def test_podoc_cache():
+    p = Podoc(plugins=[], with_pandoc=False, cache=True)
+    p.register_lang('a')
+    p.register_lang('b')
+    calls = []
+
+    @p.register_func(source='a', target='b')
+    def a_to_b(x):
+        calls.append(x)
+        return x.upper()
+
+    assert p.convert('hello', source='a', target='b') == 'HELLO'
+    assert p.convert('hello', source='a', target='b') == 'HELLO'
+    assert calls == ['hello']
+    assert (p.cache.hits, p.cache.misses) == (1, 1)
+    # The default cache is bounded.
+    assert p.cache.max_bytes == DEFAULT_MEMORY_CACHE_SIZE
+
+    assert p.convert('hello', source='a', target='b',
+                     resources={'x': b'0'}) == 'HELLO'
+    assert len(calls) == 2
+    assert 'podoc' in p.plugin_versions
@@ -62,3 +62,29 @@ def test_cli_md_nb():
     nb = Podoc(with_pandoc=False).loads(nb_s, 'notebook')
     assert nb.cells[0].cell_type == 'markdown'
     assert nb.cells[0].source == 'hello *world*'
+
+
+def test_cli_multi(tempdir):
+    """From markdown to several formats at once."""
+    path = op.join(tempdir, 'hello.md')
+    dump_text('hello world', path)
+    _podoc('--no-pandoc -t ast -t notebook {} -o {}'.format(
+           path, op.join(tempdir, 'out.md')))
+    assert op.exists(op.join(tempdir, 'out.json'))
+    assert op.exists(op.join(tempdir, 'out.ipynb'))
+
+    out = _podoc('--no-pandoc -t ast -t markdown', stdin='hello world')
+    assert out.endswith('hello world\n')
+
+
+def test_cli_multi_json(tempdir):
+    """The json alias with several target formats."""
+    out = _podoc('--no-pandoc -t markdown -t json', stdin='hello world')
+    assert out.startswith('hello world\n')
+    assert '"unMeta"' in out
+
+    path = op.join(tempdir, 'hello.md')
+    dump_text('hello world', path)
+    _podoc('--no-pandoc -t markdown -t json {} -o {}'.format(
+           path, op.join(tempdir, 'out.md')))
+    assert op.exists(op.join(tempdir, 'out.json'))
@@ -8,12 +8,20 @@
 #------------------------------------------------------------------------------
 
 import logging
+from multiprocessing.pool import ThreadPool
 import os.path as op
+import pickle
+import time
 
-from pytest import raises
+from pytest import mark, raises
+from six import PY2
 
-from ..core import Podoc, _find_path, _get_annotation, _connected_component
-from ..utils import get_test_file_path, load_text, _test_file_resources
+from ..core import (Podoc, ConversionError, MEMORY_PER_BYTE, _find_path,
+                    _get_annotation, _common_prefix, _connected_component,
+                    _graph_from_edges, _shortest_routes)
+from ..plugin import LazyFunction
+from ..utils import (get_test_file_path, load_text, dump_text,
+                     _test_file_resources)
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +45,12 @@ def test_find_path():
     assert _find_path([(1, 2), (2, 3), (1, 4), (4, 5)], 1, 5) == [1, 4, 5]
 
 
+def test_common_prefix():
+    assert _common_prefix([['a', 'b', 'c'], ['a', 'b', 'd']]) == ['a', 'b']
+    assert _common_prefix([['a', 'b'], ['a']]) == ['a']
+    assert _common_prefix([['a', 'b']]) == ['a', 'b']
+
+
 def test_connected_component():
     assert _connected_component([(1, 2), (2, 3)], 1) == [2, 3]
     assert _connected_component([(1, 2), (2, 3)], 2) == [3]
@@ -48,6 +62,40 @@ def test_connected_component():
         [2, 3, 4, 5]
 
 
+def test_shortest_routes():
+    graph = _graph_from_edges([(1, 2), (2, 3), (1, 4), (4, 3), (3, 5)])
+    routes = _shortest_routes(graph, 1)
+    assert sorted(routes) == [2, 3, 4, 5]
+    assert routes[2] == [1, 2]
+    # Ties are broken deterministically.
+    assert routes[3] == [1, 2, 3]
+    assert routes[5] == [1, 2, 3, 5]
+    assert _shortest_routes(graph, 5) == {}
+    assert _shortest_routes(graph, 6) == {}
+
+
+def test_shortest_routes_deep():
+    n = 10000
+    graph = _graph_from_edges([(i, i + 1) for i in range(n)])
+    routes = _shortest_routes(graph, 0)
+    assert len(routes) == n
+    assert sorted(routes)[-1] == n
+    assert routes.get(0) is None
+    assert routes[3] == [0, 1, 2, 3]
+    assert routes[n] == list(range(n + 1))
+    assert routes[n] is routes[n]
+
+
+def test_shortest_routes_cost():
+    graph = _graph_from_edges([(1, 2, 1), (2, 3, 1), (1, 3, 3), (3, 4, 0)])
+    routes = _shortest_routes(graph, 1)
+    assert routes[3] == [1, 2, 3]
+    assert routes[4] == [1, 2, 3, 4]
+
+    graph = _graph_from_edges([(1, 2, 1), (2, 3, 1), (1, 3, 1.5)])
+    assert _shortest_routes(graph, 1)[3] == [1, 3]
+
+
 #------------------------------------------------------------------------------
 # Tests podoc
 #------------------------------------------------------------------------------
@@ -102,6 +150,383 @@ def test_podoc_convert_1(tempdir):
         assert f.read() == 'hello'
 
 
+def test_podoc_routes():
+    p = Podoc(plugins=[], with_pandoc=False)
+    for lang in 'abcd':
+        p.register_lang(lang)
+    p.register_func(source='a', target='b', func=lambda x: x + 'b')
+    p.register_func(source='b', target='c', func=lambda x: x + 'c')
+
+    assert p.get_target_languages('a') == ['b', 'c']
+    assert p.get_target_languages('c') == []
+    assert p.convert('', source='a', target='c') == 'bc'
+
+    # Registering a function updates the route table.
+    p.register_func(source='a', target='c', func=lambda x: x + 'C')
+    p.register_func(source='c', target='d', func=lambda x: x + 'd')
+    assert p.get_target_languages('a') == ['b', 'c', 'd']
+    assert p.convert('', source='a', target='c') == 'C'
+    assert p.convert('', source='a', target='d') == 'Cd'
+
+
+def test_podoc_cost():
+    p = Podoc(plugins=[], with_pandoc=False)
+    for lang in 'abc':
+        p.register_lang(lang)
+    p.register_func(source='a', target='b', func=lambda x: x + 'b')
+    p.register_func(source='b', target='c', func=lambda x: x + 'c')
+
+    # The direct conversion is more expensive than the two-step one.
+    @p.register_func(source='a', target='c', cost=3)
+    def a_to_c(x):
+        return x + 'C'
+
+    assert p.convert('', source='a', target='c') == 'bc'
+
+
+def test_podoc_learn_costs():
+    p = Podoc(plugins=[], with_pandoc=False, learn_costs=True)
+    for lang in 'abc':
+        p.register_lang(lang)
+    p.register_func(source='a', target='b', func=lambda x: x + 'b')
+    p.register_func(source='b', target='c', func=lambda x: x + 'c')
+
+    def slow(x):
+        time.sleep(.01)
+        return x + 'C'
+
+    # The direct conversion is chosen first, until it has been observed to be
+    # slower than the two-step one.
+    p.register_func(source='a', target='c', func=slow)
+    assert p.convert('', source='a', target='c') == 'C'
+    assert p._funcs[('a', 'c')].cost >= .01
+    assert p.convert('', lang_list=['a', 'b', 'c']) == 'bc'
+    assert p.convert('', source='a', target='c') == 'bc'
+
+
+def test_podoc_learn_costs_lazy():
+    class SlowPlugin(object):
+        __name__ = 'SlowPlugin'
+
+        def resolve(self, name):
+            # Slow import.
+            time.sleep(.05)
+            return lambda x: x + 'b'
+
+    p = Podoc(plugins=[], with_pandoc=False, learn_costs=True)
+    p.register_lang('a')
+    p.register_lang('b')
+    p.register_func(source='a', target='b',
+                    func=LazyFunction(SlowPlugin(), 'a_to_b'))
+    assert p.convert('', source='a', target='b') == 'b'
+    assert p._funcs[('a', 'b')].n_observed == 1
+    assert p._funcs[('a', 'b')].cost < .05
+
+
+def test_podoc_learn_costs_units():
+    p = Podoc(plugins=[], with_pandoc=False, learn_costs=True)
+    for lang in 'abcd':
+        p.register_lang(lang)
+
+    def slow(letter):
+        def f(x):
+            time.sleep(.005)
+            return x + letter
+        return f
+
+    for a, b in ('ab', 'bc', 'cd'):
+        p.register_func(source=a, target=b, func=slow(b))
+    p.register_func(source='a', target='d', func=lambda x: x + 'D', cost=2)
+    assert p.convert('', lang_list=['a', 'b', 'c', 'd']) == 'bcd'
+
+    # The declared cost of the direct conversion is scaled to seconds like
+    # the observed durations of the other ones: it is still cheaper.
+    g = p._graph
+    assert 0 < g['a']['d'] < g['a']['b'] + g['b']['c'] + g['c']['d']
+    assert p.convert('', source='a', target='d') == 'D'
+
+    # Concurrent observations.
+    ThreadPool(4).map(lambda _: p._observe_cost('a', 'b', .001), range(100))
+    assert p._funcs[('a', 'b')].n_observed == 101
+
+
+def test_podoc_compile():
+    p = Podoc(plugins=[], with_pandoc=False)
+    for lang in 'abc':
+        p.register_lang(lang)
+    p.register_func(source='a', target='b', func=lambda x: x + 'b',
+                    pre_filter=lambda x: x + '<',
+                    post_filter=lambda x: x + '>')
+
+    @p.register_func(source='b', target='c')
+    def b_to_c(x, resources=None):
+        return x + resources.get('suffix', 'c')
+
+    pipeline = p.compile('a', 'c')
+    assert pipeline.lang_list == ('a', 'b', 'c')
+    assert (pipeline.source, pipeline.target) == ('a', 'c')
+    assert 'a -> b -> c' in repr(pipeline)
+    assert pipeline('') == '<b>c'
+    assert pipeline('', resources={'suffix': '!'}) == '<b>!'
+
+    # Pipelines are compiled once per route.
+    assert p.compile('a', 'c') is pipeline
+    assert p.compile(lang_list=['a', 'b', 'c']) is pipeline
+
+    with raises(ValueError):
+        p.compile('c', 'a')
+    with raises(ValueError):
+        p.compile(lang_list=['a', 'c'])
+
+
+def test_podoc_stream():
+    p = Podoc(plugins=[], with_pandoc=False)
+    for lang in 'abc':
+        p.register_lang(lang, split_func=list)
+    p.register_func(source='a', target='b', func=lambda x: x.upper(),
+                    stream_func=lambda s: (c.upper() for c in s))
+    p.register_func(source='b', target='c', func=lambda x: x * 2)
+
+    assert p.convert('ab', source='a', target='b', stream=True) == 'AB'
+    # Nothing is converted before the stream is consumed.
+    stream = p.compile('a', 'b').stream(iter('ab'))
+    assert next(stream) == 'A'
+
+    with raises(ValueError):
+        p.convert('ab', source='a', target='c', stream=True)
+
+
+def test_podoc_convert_multi(tempdir):
+    p = Podoc(plugins=[], with_pandoc=False)
+    for lang in 'abcde':
+        p.register_lang(lang, file_ext='.' + lang)
+    calls = []
+
+    @p.register_func(source='a', target='b')
+    def a_to_b(x):
+        calls.append('a')
+        return x + ['b']
+
+    @p.register_func(source='b', target='c')
+    def b_to_c(x):
+        x.append('c')
+        return x
+
+    p.register_func(source='b', target='d', func=lambda x: x + ['d'])
+    p.register_func(source='d', target='e', func=lambda x: x + ['e'])
+
+    out = p.convert_multi([], source='a', targets=['c', 'b', 'e', 'a'])
+    assert out == {'a': [], 'b': ['b'], 'c': ['b', 'c'],
+                   'e': ['b', 'd', 'e']}
+    # The shared prefix of the routes is converted once.
+    assert calls == ['a']
+
+    path = op.join(tempdir, 'out.d')
+    p.register_lang('t', file_ext='.t', dump_func=dump_text)
+    p.register_func(source='a', target='t', func=lambda x: 't')
+    p.convert_multi([], source='a', targets=['t', 'b'],
+                    outputs={'t': path})
+    assert load_text(path) == 't'
+
+    with raises(ValueError):
+        p.convert_multi([], source='c', targets=['a'])
+
+
+def test_podoc_convert_multi_parallel():
+    p = Podoc(plugins=[], with_pandoc=False)
+    for lang in 'ab':
+        p.register_lang(lang)
+    # Languages converted by pandoc are converted in threads, so that
+    # manually registered functions are available.
+    for lang in 'cd':
+        p.register_lang(lang, pandoc=True)
+    p.register_func(source='a', target='b', func=lambda x: x + ['b'])
+    p.register_func(source='b', target='c', func=lambda x: x + ['c'])
+    p.register_func(source='b', target='d', func=lambda x: x + ['d'])
+
+    out = p.convert_multi([], source='a', targets=['c', 'd', 'b'],
+                          parallel=True)
+    assert out == {'b': ['b'], 'c': ['b', 'c'], 'd': ['b', 'd']}
+
+
+def test_podoc_convert_multi_processes():
+    p = Podoc(with_pandoc=False)
+    out = p.convert_multi('hello *world*', source='markdown',
+                          targets=['markdown', 'ast', 'notebook'],
+                          parallel=True)
+    assert out['markdown'] == 'hello *world*'
+    assert out['ast'] == p.convert('hello *world*', source='markdown',
+                                   target='ast')
+    nb = p.convert('hello *world*', source='markdown', target='notebook')
+    assert ([cell.source for cell in out['notebook'].cells] ==
+            [cell.source for cell in nb.cells])
+
+
+def test_podoc_freeze():
+    p = Podoc(plugins=[], with_pandoc=False)
+    for lang in 'abc':
+        p.register_lang(lang, file_ext='.' + lang)
+    p.register_func(source='a', target='b', func=lambda x: x + 'b')
+    p.register_func(source='b', target='c', func=lambda x: x + 'c')
+    pipeline = p.compile('a', 'c')
+
+    assert p.freeze() is p
+    assert p.frozen
+    assert p.freeze() is p
+    assert p.compile('a', 'c') is pipeline
+    assert p.compile(lang_list=['b', 'c']) is p.compile('b', 'c')
+    assert p.convert('', source='a', target='c') == 'bc'
+    assert p.get_target_languages('a') == ['b', 'c']
+    assert p.get_target_languages('unknown') == []
+    assert p.get_lang_for_file_ext('.b') == 'b'
+
+    with raises(RuntimeError):
+        p.register_lang('d')
+    with raises(RuntimeError):
+        p.register_func(source='c', target='a', func=lambda x: x)
+    with raises(TypeError):
+        p._funcs[('c', 'a')] = None
+    with raises(ValueError):
+        p.compile('c', 'a')
+
+
+def test_podoc_freeze_threads():
+    p = Podoc(with_pandoc=False).freeze()
+
+    def _convert(i):
+        return p.convert('hello {}'.format(i), source='markdown',
+                         target='ast')
+
+    pool = ThreadPool(4)
+    try:
+        outs = pool.map(_convert, range(20))
+    finally:
+        pool.close()
+        pool.join()
+    assert outs == [_convert(i) for i in range(20)]
+
+
+def test_podoc_estimate_memory(tempdir):
+    p = Podoc(with_pandoc=False)
+    path = op.join(tempdir, 'a.md')
+    dump_text('hello', path)
+    assert p.estimate_memory(path) == 5 * MEMORY_PER_BYTE
+    assert p.estimate_memory('hello world') == 11 * MEMORY_PER_BYTE
+    ast = p.convert('hello', source='markdown', target='ast')
+    assert p.estimate_memory(ast) == ast.size_info().memory
+
+    assert p.compile('markdown', 'notebook').can_stream
+
+
+def test_podoc_pickle():
+    p = Podoc(with_pandoc=False)
+    p2 = pickle.loads(pickle.dumps(p))
+    assert p2 is not p
+    assert p2.languages == p.languages
+    assert p2.conversion_pairs == p.conversion_pairs
+
+
+@mark.parametrize('jobs', [1, 2])
+def test_podoc_convert_many(tempdir, jobs):
+    p = Podoc(with_pandoc=False)
+    path = op.join(tempdir, 'test.md')
+    with open(path, 'w') as f:
+        f.write('*file*')
+    inputs = ['hello *world*', path, None] + ['item %d' % i for i in range(5)]
+
+    outputs = p.convert_many(inputs, source='markdown', target='ast',
+                             jobs=jobs, chunksize=2)
+    assert len(outputs) == len(inputs)
+    assert outputs[0] == p.convert('hello *world*', 'markdown', 'ast')
+    assert outputs[1] == p.convert('*file*', 'markdown', 'ast')
+    # Errors are reported per item.
+    assert isinstance(outputs[2], ConversionError)
+    assert outputs[2].index == 2
+    assert 'AssertionError' in str(outputs[2])
+    assert outputs[2].traceback
+    for i in range(5):
+        assert outputs[3 + i].children[0].children == ['item %d' % i]
+
+    with raises(ValueError):
+        p.convert_many(inputs, source='markdown', target='unknown')
+    assert p.convert_many([], source='markdown', target='ast') == []
+
+
+@mark.skipif(PY2, reason='asyncio is not available on Python 2')
+@mark.parametrize('executor', [None, 'thread', 'process'])
+def test_podoc_async(tempdir, executor):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+    if executor == 'thread':
+        executor = ThreadPoolExecutor(2)
+    elif executor == 'process':
+        executor = ProcessPoolExecutor(2)
+    p = Podoc(with_pandoc=False, executor=executor)
+    path = op.join(tempdir, 'test.md')
+    path_o = op.join(tempdir, 'test.json')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        # Concurrent conversions.
+        asts = loop.run_until_complete(asyncio.gather(*[
+            p.aconvert('item %d' % i, source='markdown', target='ast')
+            for i in range(4)]))
+        for i, ast in enumerate(asts):
+            assert ast.children[0].children == ['item %d' % i]
+
+        # File I/O.
+        loop.run_until_complete(p.adump('hello *world*', path))
+        assert loop.run_until_complete(p.aload(path)) == 'hello *world*'
+        ast = loop.run_until_complete(p.aconvert(path, target='ast',
+                                                 output=path_o))
+        assert ast == p.load(path_o)
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
+        if executor:
+            executor.shutdown()
+
+
+@mark.skipif(PY2, reason='asyncio is not available on Python 2')
+def test_podoc_async_executor(tempdir):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    class CountingExecutor(ThreadPoolExecutor):
+        n_calls = 0
+
+        def submit(self, *args, **kwargs):
+            self.n_calls += 1
+            return super(CountingExecutor, self).submit(*args, **kwargs)
+
+    executor = CountingExecutor(2)
+    p = Podoc(plugins=[], with_pandoc=False, executor=executor)
+    p.register_lang('a', file_ext='.a')
+    p.register_lang('b')
+    p.register_func(source='a', target='b', func=lambda x: x + 'b')
+    path = op.join(tempdir, 'test.a')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(p.adump('a', path))
+        assert loop.run_until_complete(p.aload(path)) == 'a'
+        assert loop.run_until_complete(p.aconvert(path, target='b')) == 'ab'
+        # All coroutine methods use the executor of the instance.
+        assert executor.n_calls == 3
+
+        # Call from the running event loop.
+        futures = []
+        loop.call_soon(lambda: futures.append(p.aload(path)))
+        loop.run_until_complete(asyncio.sleep(0))
+        assert loop.run_until_complete(futures[0]) == 'a'
+        assert executor.n_calls == 4
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
+        executor.shutdown()
+
+
 def test_podoc_file(tempdir):
     p = Podoc(plugins=[], with_pandoc=False)
 
@@ -189,3 +614,34 @@ def test_all_convert(tempdir, podoc, source_target, test_file):
     # expected.show()
 
     podoc.assert_equal(converted, expected, target)
+
+
+def test_all_convert_stream(tempdir, podoc, source_target, test_file):
+    """Check that streaming conversions match the regular ones."""
+    source, target = source_target
+    source_filename = test_file + podoc.get_file_ext(source)
+    source_path = get_test_file_path(source, source_filename)
+    resources = _test_file_resources()
+
+    expected = podoc.convert(source_path, target=target, resources=resources)
+
+    # Stream from a file.
+    converted = podoc.convert(source_path, target=target,
+                              resources=resources, stream=True)
+    podoc.assert_equal(converted, expected, target)
+
+    # Stream from an object.
+    obj = podoc.load(source_path)
+    converted = podoc.convert(obj, source=source, target=target,
+                              resources=resources, stream=True)
+    podoc.assert_equal(converted, expected, target)
+
+    # Stream to a file.
+    ext = podoc.get_file_ext(target)
+    expected_path = op.join(tempdir, 'expected' + ext)
+    podoc.convert(source_path, target=target, output=expected_path,
+                  resources=resources)
+    output = op.join(tempdir, 'output' + ext)
+    assert podoc.convert(source_path, target=target, output=output,
+                         resources=resources, stream=True) is None
+    assert load_text(output) == load_text(expected_path)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""Test pandoc server pool."""
+
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+
+import os.path as op
+import sys
+from multiprocessing.pool import ThreadPool
+
+from pytest import yield_fixture, raises
+
+from .. import pandoc_server
+from ..pandoc_server import (PandocServerPool, PandocServerError,
+                             PandocConversionError, get_pandoc_pool,
+                             set_pandoc_pool, pandoc_convert)
+from ..utils import dump_text
+
+
+#------------------------------------------------------------------------------
+# Fixtures
+#------------------------------------------------------------------------------
+
+# Stand-in for `pandoc server`, speaking the same protocol.
+_SERVER = '''
+import json
+import os
+import sys
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        n = int(self.headers['Content-Length'])
+        d = json.loads(self.rfile.read(n).decode('utf-8'))
+        if d['from'] == 'unknown':
+            self.send_response(500)
+            self.end_headers()
+            self.wfile.write(b'Unknown input format unknown')
+            return
+        out = '{}:{}:{}'.format(os.getpid(), d['to'], d['text'])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'output': out, 'base64': False,
+                                     'messages': []}).encode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+HTTPServer(('127.0.0.1', int(sys.argv[1])), Handler).serve_forever()
+'''
+
+
+@yield_fixture
+def server_command(tempdir, monkeypatch):
+    path = op.join(tempdir, 'server.py')
+    dump_text(_SERVER, path)
+    # Restore the pool of the process after the test.
+    monkeypatch.setattr(pandoc_server, '_pool', None)
+    yield [sys.executable, path, '{port}']
+
+
+#------------------------------------------------------------------------------
+# Tests
+#------------------------------------------------------------------------------
+
+def test_pandoc_server_pool(server_command):
+    pool = PandocServerPool(server_command, size=2)
+    try:
+        # Sequential conversions reuse the same server.
+        out = [pool.convert(u'hello', 'html', format='markdown')
+               for _ in range(3)]
+        assert pool.n_servers == 1
+        assert len(set(out)) == 1
+        assert out[0].endswith(':html:hello')
+
+        # Concurrent conversions.
+        texts = [str(i) for i in range(20)]
+        out = ThreadPool(4).map(
+            lambda t: pool.convert(t, 'html', format='markdown'), texts)
+        assert [o.split(':')[2] for o in out] == texts
+        assert pool.n_servers <= 2
+        assert len(set(o.split(':')[0] for o in out)) <= 2
+
+        # Conversion errors do not break the pool.
+        with raises(PandocConversionError):
+            pool.convert('hello', 'html', format='unknown')
+        assert pool.convert(b'hello', 'html', format='markdown')
+    finally:
+        pool.close()
+    assert pool.n_servers == 0
+
+
+def test_pandoc_server_timeout(server_command):
+    # `pandoc server` has a default timeout of 2 seconds.
+    assert PandocServerPool().command[-2:] == ['--timeout', '{timeout}']
+
+    pool = PandocServerPool(server_command + ['{timeout}'], timeout=1.5)
+    try:
+        assert pool.convert('hello', 'html', format='markdown')
+        process = list(pool._processes.values())[0]
+        assert process.args[-1] == '2'
+    finally:
+        pool.close()
+
+
+def test_pandoc_server_error(server_command):
+    pool = PandocServerPool([sys.executable, '-c', 'exit(1)'])
+    with raises(PandocServerError):
+        pool.convert('hello', 'html', format='markdown')
+    assert pool.n_servers == 0
+
+
+def test_pandoc_convert(server_command, monkeypatch):
+    set_pandoc_pool(PandocServerPool(server_command, size=1))
+    assert pandoc_convert('hello', 'html', 'markdown').endswith('html:hello')
+    assert get_pandoc_pool().n_servers == 1
+
+    # Fallback to new pandoc processes if no server can be started.
+    monkeypatch.setattr(pandoc_server, 'pandoc',
+                        lambda text, to, format=None: 'pandoc:' + text)
+    set_pandoc_pool(PandocServerPool([sys.executable, '-c', 'exit(1)']))
+    assert pandoc_convert('hello', 'html', 'markdown') == 'pandoc:hello'
+    assert get_pandoc_pool() is None
+
+
+def test_pandoc_convert_server_died(server_command, monkeypatch):
+    pool = PandocServerPool(server_command, size=1)
+    assert pool.timeout is None
+    set_pandoc_pool(pool)
+    assert pandoc_convert('hello', 'html', 'markdown').endswith('html:hello')
+
+    # Fallback to a new pandoc process if the server dies.
+    monkeypatch.setattr(pandoc_server, 'pandoc',
+                        lambda text, to, format=None: 'pandoc:' + text)
+    for process in pool._processes.values():
+        process.kill()
+        process.wait()
+    assert pandoc_convert('hello', 'html', 'markdown') == 'pandoc:hello'
+    assert pool.n_servers == 0
+
+    # Fallback to a new pandoc process if the server fails.
+    assert pandoc_convert('hello', 'html', 'unknown') == 'pandoc:hello'
+    assert pool.n_servers == 1
+
+    # The next conversion starts a new server.
+    assert pandoc_convert('hello', 'html', 'markdown').endswith('html:hello')
+    assert get_pandoc_pool() is pool
+    set_pandoc_pool(None)
+
+
+def test_get_pandoc_pool_threads(server_command):
+    pools = ThreadPool(8).map(lambda _: get_pandoc_pool(), range(32))
+    assert len(set(map(id, pools))) == 1
+    set_pandoc_pool(None)
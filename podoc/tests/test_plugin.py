@@ -8,6 +8,8 @@
 #------------------------------------------------------------------------------
 
 import os.path as op
+import subprocess
+import sys
 
 from ..plugin import (IPluginRegistry, IPlugin, discover_plugins,
                       # _load_all_native_plugins,
@@ -46,6 +48,15 @@ def test_plugin_registration(no_native_plugins):
     assert IPluginRegistry.plugins == [MyPlugin]
     assert get_plugin('myplugin') == MyPlugin
 
+    # Registering a plugin does not modify the previous list of plugins.
+    plugins = IPluginRegistry.plugins
+
+    class MyPlugin2(IPlugin):
+        pass
+
+    assert plugins == [MyPlugin]
+    assert IPluginRegistry.plugins == [MyPlugin, MyPlugin2]
+
     with raises(ValueError):
         get_plugin('unknown')
 
@@ -57,3 +68,34 @@ def test_discover_plugins(tempdir, no_native_plugins):
     plugins = discover_plugins([tempdir])
     assert plugins
     assert plugins[0].__name__ == 'MyPlugin'
+
+
+def test_lazy_plugin():
+    from podoc import Podoc
+    from podoc.plugin import LazyPlugin, LazyFunction
+
+    plugin = LazyPlugin('podoc.markdown._markdown', 'MarkdownPlugin')
+    plugin.register_lang('md', file_ext='.md')
+    plugin.register_func(source='md', target='ast', func='read')
+    plugin.register_func(source='ast', target='md', func='write')
+
+    p = Podoc(plugins=[get_plugin('ast'), plugin], with_pandoc=False)
+    assert p.languages == ['ast', 'md']
+    func = p._funcs[('md', 'ast')].func
+    assert isinstance(func, LazyFunction)
+    assert 'read' in repr(func)
+    # The resources are only passed to functions that accept them.
+    assert p.convert('*a*', lang_list=['md', 'ast', 'md'],
+                     resources={}) == '*a*'
+
+
+def test_lazy_import():
+    """Check that the built-in plugins are only imported when needed."""
+    code = ('import sys; from podoc import Podoc; '
+            'p = Podoc(with_pandoc=False); '
+            'assert "notebook" in p.languages; '
+            'assert "CommonMark" not in sys.modules; '
+            'p.convert("*a*", source="markdown", target="ast"); '
+            'assert "CommonMark" in sys.modules; '
+            'assert "nbformat" not in sys.modules; ')
+    subprocess.check_call([sys.executable, '-c', code])
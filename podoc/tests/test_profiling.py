@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""Test conversion instrumentation."""
+
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+
+import os.path as op
+
+from ..core import Podoc
+from ..profiling import (ConversionStats, HandlerProfiler, Timer, get_size,
+                         profile_handlers, track_memory)
+from ..tree import Node, TreeTransformer
+from ..utils import dump_text
+
+
+#------------------------------------------------------------------------------
+# Tests
+#------------------------------------------------------------------------------
+
+def test_get_size():
+    assert get_size('abc') == 3
+    assert get_size(b'ab') == 2
+    assert get_size({'a': 1}) == len('{"a": 1}')
+
+
+def test_timer():
+    timer = Timer()
+    assert timer.wall_time >= 0
+    assert timer.cpu_time >= 0
+
+
+def test_track_memory():
+    with track_memory() as info:
+        x = [0] * 100000
+        del x
+        with track_memory() as inner:
+            y = [0] * 1000  # noqa
+    assert info.peak >= 800000
+    assert info.allocated < info.peak
+    assert 8000 <= inner.peak < info.peak
+
+
+def test_stage_memory(tempdir):
+    p = Podoc(plugins=[], with_pandoc=False)
+    p.register_lang('a')
+    p.register_lang('b')
+    p.register_func(source='a', target='b', func=lambda x: x * 100000)
+    stats = p.add_hook(ConversionStats())
+
+    p.convert('x', source='a', target='b')
+    assert stats.records[0].peak_memory is None
+
+    with track_memory():
+        p.convert('x', source='a', target='b')
+    assert stats.records[1].peak_memory >= 100000
+
+
+def test_conversion_stats(tempdir):
+    p = Podoc(plugins=[], with_pandoc=False)
+    p.register_lang('a', file_ext='.a')
+    p.register_lang('b', file_ext='.b')
+    p.register_func(source='a', target='b', func=lambda x: x * 2,
+                    pre_filter=lambda x: x.strip(),
+                    post_filter=lambda x: x + '!')
+    stats = p.add_hook(ConversionStats())
+    assert p.hooks == [stats]
+
+    path = op.join(tempdir, 'in.a')
+    dump_text(' ab ', path)
+    p.convert(path, target='b', output=op.join(tempdir, 'out.b'))
+
+    assert [(r.stage, r.source, r.target) for r in stats.records] == [
+        ('load', 'a', None),
+        ('pre_filter', 'a', 'b'),
+        ('func', 'a', 'b'),
+        ('post_filter', 'a', 'b'),
+        ('dump', None, 'b'),
+    ]
+    sizes = [(r.input_size, r.output_size) for r in stats.records]
+    assert sizes == [(4, 4), (4, 2), (2, 4), (4, 5), (5, 5)]
+    assert all(r.wall_time >= 0 for r in stats.records)
+
+    summary = stats.summary()
+    assert summary[('func', 'a', 'b')].count == 1
+    assert 'a -> b' in str(stats)
+
+    # Without hooks, nothing is recorded.
+    p.remove_hook(stats)
+    stats.clear()
+    p.convert('x', source='a', target='b')
+    assert len(stats) == 0
+
+
+def test_conversion_stats_sizes():
+    p = Podoc(plugins=[], with_pandoc=False)
+    p.register_lang('a')
+    p.register_lang('t')
+    p.register_func(source='a', target='t', func=lambda x: {'a': x})
+
+    # By default, trees are not serialized to get their size.
+    stats = p.add_hook(ConversionStats())
+    p.convert('ab', source='a', target='t')
+    assert [(r.input_size, r.output_size) for r in stats.records] == [
+        (2, None)]
+    assert 'a -> t' in str(stats)
+
+    p.remove_hook(stats)
+    stats = p.add_hook(ConversionStats(measure_sizes=True))
+    p.convert('ab', source='a', target='t')
+    assert [(r.input_size, r.output_size) for r in stats.records] == [
+        (2, len('{"a": "ab"}'))]
+
+
+def test_profile_handlers():
+    class Transformer(TreeTransformer):
+        def transform_Node(self, node):
+            return ''.join(self.transform_children(node))
+
+        def transform_Leaf(self, node):
+            return node.name
+
+    root = Node('root', children=[Node('Node', children=[Node('Leaf')]),
+                                  Node('Leaf'), 'a'])
+    t = Transformer()
+    assert t.get_handler('Leaf') == t.transform_Leaf
+
+    with profile_handlers() as profiler:
+        assert t.transform(root) == 'LeafLeafa'
+    assert isinstance(profiler, HandlerProfiler)
+    stats = profiler.summary()
+    assert stats['Transformer.transform_Node'].count == 2
+    assert stats['Transformer.transform_Leaf'].count == 2
+    assert stats['Transformer.transform_str'].count == 1
+    b = stats['Transformer.transform_Node']
+    assert 0 <= b.self_time <= b.total_time
+    assert 'transform_Leaf' in str(profiler)
+
+    # The profiling is disabled after the block.
+    profiler.clear()
+    t.transform(root)
+    assert not profiler.stats
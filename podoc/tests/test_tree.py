@@ -7,13 +7,17 @@
 # Imports
 #------------------------------------------------------------------------------
 
+from copy import deepcopy
+import pickle
+import sys
 from textwrap import dedent
 
 from six import u
-from pytest import fixture
+from pytest import fixture, raises
 
 from ..utils import captured_output
-from ..tree import Node, TreeTransformer, show_tree
+from ..tree import (Node, CompactNode, TreeTransformer, show_tree,
+                    build_tree)
 
 
 #------------------------------------------------------------------------------
@@ -69,6 +73,58 @@ def test_show_tree_3():
     assert '(...)' in show_tree(tree)
 
 
+def test_show_tree_last_subtree(root):
+    node = Node('1.2')
+    node.add_child('a\nb')
+    root.children[0].children[1] = node
+    expected = u('''
+        root
+        ├─ 1
+        │  ├─ 1.1
+        │  │  ├─ 1.1.1
+        │  │  └─ 1.1.2
+        │  └─ 1.2
+        │     └─ a\\nb
+        └─ 2
+        ''')
+    assert show_tree(root) == dedent(expected).strip()
+
+
+def test_show_tree_limits(root):
+    expected = u('''
+        root
+        ├─ 1
+        │  ├─ 1.1
+        │  │  └─ (...)
+        │  └─ 1.2
+        └─ 2
+        ''')
+    assert show_tree(root, max_depth=2) == dedent(expected).strip()
+
+    expected = u('''
+        root
+        ├─ 1
+        │  ├─ 1.1
+        │  │  ├─ (...)
+        ''')
+    assert show_tree(root, max_nodes=3) == dedent(expected).strip()
+    assert show_tree(root, max_depth=0) == u('root\n└─ (...)')
+
+    with captured_output() as (out, err):
+        root.show(max_depth=1)
+    assert out.getvalue() == u('root\n├─ 1\n│  └─ (...)\n└─ 2\n')
+
+
+def test_show_tree_deep():
+    depth = 2 * sys.getrecursionlimit()
+    tree = node = Node('0')
+    for i in range(1, depth):
+        node = node.add_child(Node(str(i)))
+    lines = show_tree(tree).splitlines()
+    assert len(lines) == depth
+    assert lines[-1] == u('   ') * (depth - 2) + u('└─ ') + str(depth - 1)
+
+
 def test_transform_1(root):
 
     class MyTreeTransformer(TreeTransformer):
@@ -99,3 +155,210 @@ def test_transform_2(root):
                                         'c': [{'t': '1.1',
                                                'c': ['1.1.1', '1.1.2']},
                                               '1.2']}, '2']}
+
+
+def test_size_info(root):
+    info = root.size_info()
+    assert info.n_nodes == 3
+    assert info.n_strings == 4
+    assert info.string_bytes == len('1.1.1' '1.1.2' '1.2' '2')
+    assert info.memory > info.string_bytes
+    # Strings are counted in bytes.
+    assert Node('a', children=[u('é')]).size_info().string_bytes == 2
+
+
+class DictTransformer(TreeTransformer):
+    def transform_Node(self, node):
+        return {'t': node.name, 'c': self.transform_children(node)}
+
+    def transform_skip(self, node):
+        # Unknown nodes are replaced by their children.
+        return self.transform_children(node)
+
+
+def _chain(depth):
+    node = Node('leaf', children=['x'])
+    for _ in range(depth):
+        node = Node('Node', children=[node, 'y'])
+    return node
+
+
+def test_transform_iterative(root):
+    root.add_child(Node('skip', children=['3', Node('4')]))
+    t = DictTransformer()
+    expected = t.transform(root)
+    t.iterative = True
+    assert t.transform(root) == expected
+    assert t._pending is None
+    assert t.transform('a') == 'a'
+
+
+def test_transform_links(root):
+    for iterative in (False, True):
+        t = DictTransformer()
+        t.iterative = iterative
+        # The siblings are only linked on demand.
+        t.transform(root)
+        assert root.children[0]._visit_meta == {}
+
+        t.link_siblings = True
+        t.transform(root)
+        assert root.children[0]._visit_meta['nxt'] == '2'
+        child = root.children[0].children[0]
+        assert child._visit_meta['nxt'] == '1.2'
+        assert 'prv' not in child._visit_meta
+        root.children[0]._visit_meta.clear()
+        child._visit_meta.clear()
+
+
+def test_transform_iterative_deep():
+    depth = 2 * sys.getrecursionlimit()
+    t = DictTransformer()
+    t.iterative = True
+    out = t.transform(_chain(depth))
+    for _ in range(depth):
+        assert out['c'][1] == 'y'
+        out = out['c'][0]
+    assert out == {'t': 'leaf', 'c': ['x']}
+
+
+def test_transform_iterative_leaves():
+    class LeafTransformer(DictTransformer):
+        iterative = True
+        leaves = ('leaf',)
+
+        def transform_str(self, text):
+            return text.upper()
+
+        def transform_leaf(self, node):
+            return node.children[0]
+
+    assert LeafTransformer().transform(_chain(2)) == {
+        't': 'Node', 'c': [{'t': 'Node', 'c': ['x', 'Y']}, 'Y']}
+
+
+def test_transform_dispatch(root):
+    class MyTransformer(DictTransformer):
+        def transform_str(self, text):
+            return text.upper()
+
+    t = DictTransformer()
+    assert t.get_handler('skip') == t.transform_skip
+    assert t.get_handler('unknown') == t.transform_Node
+    assert t.get_handler('skip') is t.get_handler('skip')
+    assert t.transform(root)['c'][1] == '2'
+
+    # The subclasses have their own dispatch table.
+    t = MyTransformer()
+    assert t.transform(Node('x', children=['a'])) == {'t': 'x', 'c': ['A']}
+    assert t.get_handler('skip') == t.transform_skip
+
+    # Handlers set on an instance.
+    t = DictTransformer()
+    t.transform_new = lambda node: 'new'
+    assert t.transform(Node('new')) == 'new'
+
+
+def test_build_tree():
+    def expand(d):
+        if not isinstance(d, dict):
+            return d, None
+        return Node(d['t']), d['c']
+
+    d = {'t': 'a', 'c': [{'t': 'b', 'c': ['1']}, '2']}
+    assert build_tree(d, expand) == Node('a', children=[
+        Node('b', children=['1']), '2'])
+    assert build_tree('1', expand) == '1'
+
+    depth = 2 * sys.getrecursionlimit()
+    for _ in range(depth):
+        d = {'t': 'a', 'c': [d]}
+    node = build_tree(d, expand)
+    for _ in range(depth):
+        node = node.children[0]
+    assert node.name == 'a'
+
+
+#------------------------------------------------------------------------------
+# Testing compact nodes
+#------------------------------------------------------------------------------
+
+class MyCompactNode(CompactNode):
+    _fields = ('level',)
+    __slots__ = _fields
+
+
+def test_compact_node_fields():
+    node = MyCompactNode('Header', children=['a'], level=2, extra=3)
+    assert node.level == 2
+    assert node['level'] == 2
+    assert node.extra == 3
+    assert node['extra'] == 3
+    assert sorted(node) == ['children', 'extra', 'level', 'name']
+    assert len(node) == 4
+    assert dict(node) == {'name': 'Header', 'children': ['a'], 'level': 2,
+                          'extra': 3}
+
+    # Unset fields are missing keys.
+    node = MyCompactNode('Para')
+    assert not hasattr(node, 'level')
+    assert 'level' not in node
+    assert node.get('level', 1) == 1
+    with raises(KeyError):
+        node['unknown']
+    with raises(AttributeError):
+        node.unknown
+
+    node['level'] = 3
+    node.other = 4
+    assert node.level == 3
+    assert node['other'] == 4
+    del node['level']
+    del node.other
+    assert sorted(node) == ['children', 'name']
+    with raises(KeyError):
+        del node['level']
+
+
+def test_compact_node_visit_meta():
+    root = MyCompactNode('root', children=[MyCompactNode('a'),
+                                           MyCompactNode('b')])
+    # The `_visit_meta` dictionary is only created when needed.
+    assert '_visit_meta' not in root
+    assert root.get('_visit_meta', {}) == {}
+    t = TreeTransformer()
+    t.transform_children(root)
+    assert '_visit_meta' not in root.children[0]
+    t.link_siblings = True
+    t.transform_children(root)
+    a, b = root.children
+    assert a._visit_meta['nxt'] is b
+    assert b['_visit_meta']['prv'] is a
+    assert '_visit_meta' in a
+
+    # The links are circular.
+    c = deepcopy(root)
+    assert c == root
+    assert c.children[0]._visit_meta['nxt'] is c.children[1]
+    c = pickle.loads(pickle.dumps(root, 2))
+    assert c == root
+    assert c.children[1]._visit_meta['prv'] is c.children[0]
+
+    assert '_visit_meta' not in a.copy()
+
+
+def test_compact_node_equal():
+    node = MyCompactNode('Header', children=['a'], level=2)
+    other = Node('Header', children=['a'], level=2)
+    assert node == other
+    assert other == node
+    assert node == {'name': 'Header', 'children': ['a'], 'level': 2}
+    assert node.copy() == node
+    assert node.copy() is not node
+    assert node != MyCompactNode('Header', children=['b'], level=2)
+    assert 'level' in repr(node)
+
+
+def test_compact_node_size():
+    assert MyCompactNode('a').size_info().memory < Node('a').size_info().memory
+    assert Node('a', children=['a'], level=1).size_info().memory > 0
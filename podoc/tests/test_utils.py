@@ -9,13 +9,19 @@
 
 import json
 import logging
+import os
 import os.path as op
+import pickle
+import sys
+import types
 
 from pytest import mark, raises
 
+from .. import utils
+from ..core import Podoc
 from ..utils import (Bunch, Path, load_text, dump_text, _get_file,
-                     assert_equal,
-                     pandoc, has_pandoc, get_pandoc_formats)
+                     assert_equal, get_cache_dir,
+                     pandoc, has_pandoc, get_pandoc_formats, get_pandoc_info)
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +33,25 @@ require_pandoc = mark.skipif(not(has_pandoc()),
 # Tests
 #------------------------------------------------------------------------------
 
+def test_version_git():
+    import podoc
+    version = podoc.get_version_git()
+    assert version.startswith(podoc.__version__)
+    assert podoc.__version_git__ == version
+
+
+def test_plugin_exports():
+    import podoc
+    from ..ast import ASTPlugin
+    from ..markdown import MarkdownPlugin
+    from ..notebook import NotebookPlugin
+    assert podoc.ASTPlugin is ASTPlugin
+    assert podoc.MarkdownPlugin is MarkdownPlugin
+    assert podoc.NotebookPlugin is NotebookPlugin
+    with raises(AttributeError):
+        podoc.UnknownPlugin
+
+
 def test_bunch():
     obj = Bunch()
     obj['a'] = 1
@@ -36,6 +61,14 @@ def test_bunch():
     assert obj.copy().a == 1
 
 
+def test_bunch_pickle():
+    obj = Bunch(a=1)
+    obj = pickle.loads(pickle.dumps(obj))
+    assert obj.a == 1
+    obj.b = 2
+    assert obj['b'] == 2
+
+
 def test_path():
     print(Path(__file__))
     assert Path(__file__).exists()
@@ -72,3 +105,77 @@ def test_pandoc():
     sl, tl = get_pandoc_formats()
     assert 'markdown' in sl
     assert 'markdown' in tl
+
+
+def test_pandoc_lookup_cache(tempdir, monkeypatch):
+    monkeypatch.setenv('PODOC_CACHE_DIR', op.join(tempdir, 'cache'))
+    monkeypatch.setenv('PYPANDOC_PANDOC', op.join(tempdir, 'nopandoc'))
+    monkeypatch.setattr(utils, 'which', lambda _: None)
+    monkeypatch.setattr(utils, '_pypandoc_lookup_key', lambda: 'pypandoc:1')
+
+    # Fake pypandoc module, which does not find pandoc.
+    probes = []
+
+    def get_pandoc_path():
+        probes.append(None)
+        raise OSError()
+
+    pypandoc = types.ModuleType('pypandoc')
+    pypandoc.get_pandoc_path = get_pandoc_path
+    monkeypatch.setitem(sys.modules, 'pypandoc', pypandoc)
+
+    # The negative lookup is cached.
+    assert utils._find_pandoc() is None
+    assert utils._find_pandoc() is None
+    assert len(probes) == 1
+
+    # A new key invalidates the cache.
+    monkeypatch.setattr(utils, '_pypandoc_lookup_key', lambda: 'pypandoc:2')
+    assert utils._find_pandoc() is None
+    assert len(probes) == 2
+
+
+def test_pandoc_info(tempdir, monkeypatch):
+    monkeypatch.setenv('PODOC_CACHE_DIR', op.join(tempdir, 'cache'))
+    assert get_cache_dir() == op.join(tempdir, 'cache')
+
+    # Fake pandoc binary.
+    path = op.join(tempdir, 'pandoc')
+    dump_text('', path)
+    monkeypatch.setenv('PYPANDOC_PANDOC', path)
+
+    queries = []
+
+    def _query_pandoc():
+        queries.append(None)
+        return Bunch(version='1.0', input_formats=['a', 'b'],
+                     output_formats=['c'])
+
+    monkeypatch.setattr(utils, '_query_pandoc', _query_pandoc)
+
+    info = get_pandoc_info()
+    assert info.version == '1.0'
+    assert info.input_formats == ['a', 'b']
+    assert len(queries) == 1
+
+    # The formats are loaded from the cache, without running pandoc.
+    p = Podoc()
+    assert set('abc') <= set(p.languages)
+    assert get_pandoc_info() == info
+    assert len(queries) == 1
+
+    # A new binary invalidates the cache.
+    os.utime(path, (0, 0))
+    assert get_pandoc_info() == info
+    assert len(queries) == 2
+
+    # pandoc found by pypandoc only.
+    monkeypatch.setenv('PYPANDOC_PANDOC', op.join(tempdir, 'nopandoc'))
+    monkeypatch.setattr(utils, 'which', lambda _: None)
+    monkeypatch.setattr(utils, '_pypandoc_pandoc_path', lambda: path)
+    assert get_pandoc_info() == info
+    assert len(queries) == 2
+
+    monkeypatch.setattr(utils, '_pypandoc_pandoc_path', lambda: None)
+    assert get_pandoc_info() is None
+    assert len(queries) == 2
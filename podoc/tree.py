@@ -8,9 +8,14 @@
 #------------------------------------------------------------------------------
 
 import logging
+import sys
 
-from six import string_types, u
-from six.moves import zip_longest
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import MutableMapping  # Python 2
+
+from six import string_types, u, StringIO
 
 from .utils import Bunch, _are_dict_equal, _shorten_string
 
@@ -21,6 +26,23 @@ logger = logging.getLogger(__name__)
 # Tree transformer
 #------------------------------------------------------------------------------
 
+def _handler_table(cls):
+    """Return the dispatch table of a transformer class: a dictionary
+    mapping node names to the names of the transformation methods.
+
+    The table is built once per class. A subclass gets its own table, with
+    the methods it adds.
+
+    """
+    table = cls.__dict__.get('_dispatch_table', None)
+    if table is None:
+        n = len('transform_')
+        table = {attr[n:]: attr for attr in dir(cls)
+                 if attr.startswith('transform_')}
+        cls._dispatch_table = table
+    return table
+
+
 class TreeTransformer(object):
     """Transform any kind of tree.
 
@@ -29,6 +51,28 @@ class TreeTransformer(object):
 
     """
 
+    # Profiler of the transformation methods of all transformers, set by
+    # `podoc.profiling.profile_handlers()`.
+    _profiler = None
+
+    # Whether `transform()` walks the tree with an explicit stack instead of
+    # recursion. The handlers must only transform the children of their own
+    # node, with `transform_children()`.
+    iterative = False
+
+    # Names of the nodes whose handler does not transform the children,
+    # which the iterative engine does not visit.
+    leaves = ()
+
+    # Whether the children of every node are linked with `set_next_child()`
+    # before being transformed. Only the transformers whose handlers need
+    # the siblings of a node should enable it.
+    link_siblings = False
+
+    # Node whose children have been transformed by the iterative engine,
+    # with the transformed children.
+    _pending = None
+
     # To override
     # -------------------------------------------------------------------------
 
@@ -55,15 +99,28 @@ class TreeTransformer(object):
         if next_child is not None and not isinstance(next_child, string_types):
             next_child._visit_meta['prv'] = child
 
+    def link_children(self, children):
+        """Link every child of a list to the next one with
+        `set_next_child()`."""
+        n = len(children)
+        for i, child in enumerate(children):
+            self.set_next_child(child, children[i + 1] if i + 1 < n else None)
+
     # Transformation methods
     # -------------------------------------------------------------------------
 
     def transform_children(self, node):
+        pending = self._pending
+        if pending is not None and pending[0] is node:
+            out = pending[1]
+            pending[0] = pending[1] = None
+            return out
         out = []
         children = self.get_node_children(node)
-        for child, next_child in zip_longest(children, children[1:]):
+        if self.link_siblings:
             # Double-linked list for children.
-            self.set_next_child(child, next_child)
+            self.link_children(children)
+        for child in children:
             transformed_children = self.transform(child)
             if isinstance(transformed_children, list):
                 out.extend(transformed_children)
@@ -77,36 +134,151 @@ class TreeTransformer(object):
     def transform_Node(self, node):
         return node  # pragma: no cover
 
+    def _bind_handler(self, name):
+        attr = _handler_table(self.__class__).get(name, None)
+        if attr is None and 'transform_' + name in self.__dict__:
+            # Handler set on the instance.
+            attr = 'transform_' + name
+        return getattr(self, attr) if attr else self.transform_Node
+
+    def get_handler(self, name):
+        """Return the transformation method of a node name.
+
+        The methods are bound once per transformer and per node name, from
+        the dispatch table of the class.
+
+        """
+        handlers = self.__dict__.get('_handlers', None)
+        if handlers is None:
+            handlers = self._handlers = {}
+        handler = handlers.get(name, None)
+        if handler is None:
+            handler = handlers[name] = self._bind_handler(name)
+        profiler = TreeTransformer._profiler
+        if profiler is not None:
+            handler = profiler.wrap(self, handler)
+        return handler
+
     def get_transform_func(self, node):
         assert node is not None
         name = ('str' if isinstance(node, string_types)
                 else self.get_node_name(node))
-        return getattr(self, 'transform_' + name, self.transform_Node)
+        return self.get_handler(name)
 
     def transform(self, node):
         """Transform a node and the tree below it."""
+        if self.iterative and self._pending is None:
+            return self._transform_iter(node)
         return self.get_transform_func(node)(node)
 
+    def _transform_iter(self, root):
+        """Transform a tree with an explicit stack instead of recursion.
+
+        The children of every node are transformed before the node, and
+        `transform_children()` returns them when the handler of the node
+        calls it. The output is the same as with the recursive engine, but
+        there is no limit on the depth of the tree.
+
+        """
+        get_name = self.get_node_name
+        get_children = self.get_node_children
+        get_handler = self.get_handler
+        link_children = self.link_children if self.link_siblings else None
+        leaves = self.leaves
+        if (isinstance(root, string_types) or
+                (leaves and get_name(root) in leaves)):
+            return self.get_transform_func(root)(root)
+        transform_str = get_handler('str')
+        # The node whose children have been transformed, and its transformed
+        # children.
+        self._pending = pending = [None, None]
+        try:
+            children = get_children(root)
+            if link_children:
+                link_children(children)
+            # Frames of the nodes being transformed: node, iterator over the
+            # children, transformed children.
+            stack = [(root, iter(children), [])]
+            while True:
+                node, it, out = stack[-1]
+                for child in it:
+                    if isinstance(child, string_types):
+                        transformed = transform_str(child)
+                    elif leaves and get_name(child) in leaves:
+                        transformed = get_handler(get_name(child))(child)
+                    else:
+                        children = get_children(child)
+                        if link_children:
+                            link_children(children)
+                        stack.append((child, iter(children), []))
+                        break
+                    if isinstance(transformed, list):
+                        out.extend(transformed)
+                    else:
+                        out.append(transformed)
+                else:
+                    stack.pop()
+                    pending[0], pending[1] = node, out
+                    transformed = get_handler(get_name(node))(node)
+                    pending[0] = pending[1] = None
+                    if not stack:
+                        return transformed
+                    out = stack[-1][2]
+                    if isinstance(transformed, list):
+                        out.extend(transformed)
+                    else:
+                        out.append(transformed)
+        finally:
+            self._pending = None
+
+
+def _set_children(node, children):
+    node.children = children
+
+
+def build_tree(obj, expand, finish=None):
+    """Build a tree from another tree, with an explicit stack instead of
+    recursion.
+
+    `expand(obj)` returns a pair `(out, children)`. If `children` is None,
+    `out` is the output for `obj`. Otherwise, `out` is a new node, and
+    `finish(out, outputs)` is called with the outputs of the children. By
+    default, it sets them as the children of the new node.
+
+    """
+    finish = finish or _set_children
+    root, children = expand(obj)
+    if children is None:
+        return root
+    stack = [(root, iter(children), [])]
+    while stack:
+        node, it, outputs = stack[-1]
+        for child in it:
+            out, children = expand(child)
+            if children is None:
+                outputs.append(out)
+            else:
+                stack.append((out, iter(children), []))
+                break
+        else:
+            stack.pop()
+            finish(node, outputs)
+            if stack:
+                stack[-1][2].append(node)
+    return root
+
 
 #------------------------------------------------------------------------------
 # Node
 #------------------------------------------------------------------------------
 
-class Node(Bunch):
-    """Generic node type, represents a tree."""
-    def __init__(self, name='Node', children=None, **kwargs):
-        super(Node, self).__init__(**kwargs)
-        self._visit_meta = {}
-        # Empty names are forbidden.
-        assert name
-        assert isinstance(name, string_types)
-        self.name = name
-        self.children = children or []
-        assert isinstance(self.children, list)
+class BaseNode(object):
+    """Methods shared by all node types."""
+    __slots__ = ()
 
     def add_child(self, child):
-        """A child is either a Node or a string."""
-        assert isinstance(child, (Node, string_types))
+        """A child is either a node or a string."""
+        assert isinstance(child, (BaseNode, string_types))
         self.children.append(child)
         return child
 
@@ -119,14 +291,212 @@ class Node(Bunch):
         the equality of two trees."""
         return _are_dict_equal(self, other)
 
+    __hash__ = None
+
+    def size_info(self):
+        """Return the number of nodes and strings in the tree, the total
+        size of the strings in bytes (UTF-8), and the approximate memory
+        retained by the tree in bytes."""
+        n_nodes = n_strings = string_bytes = memory = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, string_types):
+                n_strings += 1
+                string_bytes += len(node.encode('utf-8'))
+                memory += sys.getsizeof(node)
+                continue
+            n_nodes += 1
+            memory += sys.getsizeof(node) + sys.getsizeof(node.children)
+            memory += sum(sys.getsizeof(v) for k, v in node.items()
+                          if k != 'children')
+            stack.extend(node.children)
+        return Bunch(n_nodes=n_nodes,
+                     n_strings=n_strings,
+                     string_bytes=string_bytes,
+                     memory=memory,
+                     )
+
+    def show(self, max_depth=None, max_nodes=None):
+        show_tree(self, lambda node: node.name, lambda node: node.children,
+                  max_depth=max_depth, max_nodes=max_nodes, stream=sys.stdout)
+
+
+class Node(BaseNode, Bunch):
+    """Generic node type, represents a tree.
+
+    A node is a dictionary whose items are also attributes: the name, the
+    list of children, the `_visit_meta` dictionary used by the tree
+    transformers, and any other field.
+
+    """
+    def __init__(self, name='Node', children=None, **kwargs):
+        super(Node, self).__init__(**kwargs)
+        self._visit_meta = {}
+        # Empty names are forbidden.
+        assert name
+        assert isinstance(name, string_types)
+        self.name = name
+        self.children = children or []
+        assert isinstance(self.children, list)
+
     def copy(self):
         node = super(Node, self).copy()
         node = self.__class__(**node)
         return node
 
-    def show(self):
-        print(show_tree(self, lambda node: node.name,
-                        lambda node: node.children))
+
+# Attributes of all compact nodes, in addition to the fields of the class.
+_COMPACT_ATTRS = ('name', 'children', '_visit_meta')
+
+
+class CompactNode(BaseNode, MutableMapping):
+    """Node type storing its fields in slots instead of a dictionary.
+
+    The fields listed in the `_fields` class attribute have their own slot.
+    The other fields are kept in a dictionary that is only created when
+    such a field is set, and so is the `_visit_meta` dictionary. A compact
+    node is a mutable mapping with the same items as the equivalent `Node`:
+    unset fields are missing keys.
+
+    """
+    __slots__ = ('name', 'children', '_meta', '_extra')
+
+    # Fields stored in slots, to be declared in `__slots__` by subclasses.
+    _fields = ()
+
+    def __init__(self, name='Node', children=None, **kwargs):
+        object.__setattr__(self, '_meta', None)
+        object.__setattr__(self, '_extra', None)
+        # Empty names are forbidden.
+        assert name
+        assert isinstance(name, string_types)
+        self.name = name
+        self.children = children or []
+        assert isinstance(self.children, list)
+        for key, value in kwargs.items():
+            self[key] = value
+
+    @property
+    def _visit_meta(self):
+        meta = self._meta
+        if meta is None:
+            meta = {}
+            object.__setattr__(self, '_meta', meta)
+        return meta
+
+    @_visit_meta.setter
+    def _visit_meta(self, meta):
+        object.__setattr__(self, '_meta', meta)
+
+    @_visit_meta.deleter
+    def _visit_meta(self):
+        object.__setattr__(self, '_meta', None)
+
+    # Attributes
+    # -------------------------------------------------------------------------
+
+    def __getattr__(self, name):
+        # NOTE: this is only called when there is no slot, property or
+        # method with this name, or when the slot is not set.
+        try:
+            extra = object.__getattribute__(self, '_extra')
+        except AttributeError:
+            extra = None
+        if extra is not None and name in extra:
+            return extra[name]
+        raise AttributeError("{!r} node has no field {!r}".format(
+                             self.__class__.__name__, name))
+
+    def __setattr__(self, name, value):
+        if name in self._fields or name in _COMPACT_ATTRS:
+            object.__setattr__(self, name, value)
+            return
+        extra = self._extra
+        if extra is None:
+            extra = {}
+            object.__setattr__(self, '_extra', extra)
+        extra[name] = value
+
+    def __delattr__(self, name):
+        if name in self._fields or name in _COMPACT_ATTRS:
+            object.__delattr__(self, name)
+        elif self._extra is not None and name in self._extra:
+            del self._extra[name]
+        else:
+            raise AttributeError(name)
+
+    # Mapping interface
+    # -------------------------------------------------------------------------
+
+    def __getitem__(self, key):
+        if key == '_visit_meta':
+            if self._meta is None:
+                raise KeyError(key)
+            return self._meta
+        try:
+            if key in self._fields or key in _COMPACT_ATTRS:
+                return object.__getattribute__(self, key)
+            return self._extra[key]
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    __setitem__ = __setattr__
+
+    def __delitem__(self, key):
+        try:
+            self.__delattr__(key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        yield 'name'
+        yield 'children'
+        for field in self._fields:
+            if hasattr(self, field):
+                yield field
+        if self._extra:
+            for key in list(self._extra):
+                yield key
+        if self._meta is not None:
+            yield '_visit_meta'
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    # Other methods
+    # -------------------------------------------------------------------------
+
+    def copy(self):
+        """Return a shallow copy of the node, without the `_visit_meta`
+        links."""
+        node = self.__class__(self.name)
+        for key, value in self.items():
+            if key != '_visit_meta':
+                node[key] = value
+        return node
+
+    def __reduce__(self):
+        # NOTE: the items are restored after the node is created, since the
+        # `_visit_meta` links of the children are circular.
+        return (self.__class__, (self.name,), None, None, iter(self.items()))
+
+    def __sizeof__(self):
+        size = object.__sizeof__(self)
+        if self._extra is not None:
+            size += sys.getsizeof(self._extra)
+        return size
+
+    def __repr__(self):
+        fields = {k: v for k, v in self.items() if not k.startswith('_')}
+        return '{}({!r})'.format(self.__class__.__name__, fields)
 
 
 #------------------------------------------------------------------------------
@@ -134,13 +504,25 @@ class Node(Bunch):
 #------------------------------------------------------------------------------
 
 class TreePrinter(TreeTransformer):
+    """Print a tree, one line per node, with an explicit stack.
+
+    The lines are written directly to a stream, so that the printing time
+    is linear in the size of the output. The output can be truncated to
+    `max_depth` levels below the root, and to `max_nodes` nodes.
+
+    """
     prefix_t = u('├─ ')
     prefix_l = u('└─ ')
     prefix_d = u('│  ')
+    prefix_s = u('   ')
+    ellipsis = u('(...)')
 
-    def __init__(self, get_node_name=None, get_node_children=None):
+    def __init__(self, get_node_name=None, get_node_children=None,
+                 max_depth=None, max_nodes=None):
         self._get_node_name = get_node_name or (lambda n: n.name)
         self._get_node_children = get_node_children or (lambda n: n.children)
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
 
     def get_node_name(self, node):
         return self._get_node_name(node)
@@ -148,35 +530,75 @@ class TreePrinter(TreeTransformer):
     def get_node_children(self, node):
         return self._get_node_children(node)
 
-    def transform_str(self, contents):
-        # Escape new lines in strings.
-        return contents.replace('\n', '\\n')
-
-    def transform_Node(self, node):
-        pt, pl, pd = self.prefix_t, self.prefix_l, self.prefix_d
-        out = ''
-        l = '\n'.join(self.transform_children(node))
-        l = l.splitlines()
-        # Split long strings in the tree representation.
-        if len(l) == 1:
-            l = [_shorten_string(l[0])]
-        n = len(l)
-        for i, _ in enumerate(l):
-            # Choose the prefix.
-            prefix = pt if i < n - 1 else pl
-            prefix = (pd if (pt in _ or pl in _)
-                      else prefix)
-            out += prefix + _ + '\n'
-        out = out.strip()
-        if out:
-            out = '\n' + out
+    def get_line(self, node):
+        """Return the line of a node or of a string."""
+        if isinstance(node, string_types):
+            # Escape new lines and shorten long strings.
+            return _shorten_string(node.replace('\n', '\\n'))
         # NOTE: the print-friendly representation of a node is available
         # in node.display() if available, otherwise str(node).
         # Overriding __repr__() leads to hard-to-debug equality assertions
         # with py.test.
-        return getattr(node, 'display', lambda: str(node))() + out
+        return getattr(node, 'display', lambda: str(node))()
+
+    def write(self, node, stream):
+        """Write the representation of a tree to a stream, without a final
+        new line."""
+        pt, pl, pd, ps = (self.prefix_t, self.prefix_l, self.prefix_d,
+                          self.prefix_s)
+        max_depth, max_nodes = self.max_depth, self.max_nodes
+        write = stream.write
+        write(self.get_line(node))
+        n_nodes = 1
+        # Stack of the nodes to print: node, indentation, prefix, depth.
+        # NOTE: the indentation is shared by all children of a node, so
+        # that each line only costs its own length.
+        stack = []
+
+        def push(node, indent, depth):
+            if isinstance(node, string_types):
+                return
+            children = self.get_node_children(node)
+            if not children:
+                return
+            if max_depth is not None and depth >= max_depth:
+                stack.append((self.ellipsis, indent, pl, depth + 1))
+                return
+            n = len(children)
+            stack.append((children[-1], indent, pl, depth + 1))
+            for i in range(n - 2, -1, -1):
+                stack.append((children[i], indent, pt, depth + 1))
+
+        push(node, u(''), 0)
+        while stack:
+            node, indent, prefix, depth = stack.pop()
+            write(u('\n'))
+            write(indent)
+            write(prefix)
+            if max_nodes is not None and n_nodes >= max_nodes:
+                write(self.ellipsis)
+                break
+            write(self.get_line(node))
+            n_nodes += 1
+            push(node, indent + (ps if prefix == pl else pd), depth)
 
+    def transform(self, node):
+        out = StringIO()
+        self.write(node, out)
+        return out.getvalue()
+
+
+def show_tree(node, get_node_name=None, get_children_name=None,
+              max_depth=None, max_nodes=None, stream=None):
+    """Return the representation of a tree, or write it to a stream.
 
-def show_tree(node, get_node_name=None, get_children_name=None):
-    tp = TreePrinter(get_node_name, get_children_name)
-    return tp.transform(node)
+    The output is truncated to `max_depth` levels below the root, and to
+    `max_nodes` nodes.
+
+    """
+    tp = TreePrinter(get_node_name, get_children_name,
+                     max_depth=max_depth, max_nodes=max_nodes)
+    if stream is None:
+        return tp.transform(node)
+    tp.write(node, stream)
+    stream.write(u('\n'))
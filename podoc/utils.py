@@ -8,6 +8,17 @@ import logging
 import os
 import os.path as op
 import sys
+import tempfile
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping  # Python 2
+
+try:
+    from shutil import which
+except ImportError:  # pragma: no cover
+    from distutils.spawn import find_executable as which  # Python 2
 
 from six import string_types, StringIO, PY2
 
@@ -33,6 +44,12 @@ class Bunch(dict):
     def copy(self):
         return Bunch(super(Bunch, self).copy())
 
+    def __reduce__(self):
+        # NOTE: the default pickling of dict subclasses does not restore the
+        # `self.__dict__ = self` aliasing, so we rebuild the object with
+        # its constructor before restoring the items.
+        return (self.__class__, (), None, None, iter(self.items()))
+
 
 #------------------------------------------------------------------------------
 # File I/O
@@ -50,6 +67,49 @@ def dump_text(contents, path):
         return f.write(contents)
 
 
+def dump_text_stream(chunks, path):
+    """Write a sequence of strings to a file, one at a time."""
+    with _get_file(path, 'w') as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def _write_atomic(contents, path):
+    """Write a string or bytes to a file atomically, so that concurrent
+    readers never see a partially-written file."""
+    dirname = op.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+    mode = 'wb' if isinstance(contents, bytes) else 'w'
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(contents)
+        # NOTE: os.rename() does not overwrite files on Windows.
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+    except Exception:  # pragma: no cover
+        os.remove(tmp_path)
+        raise
+
+
+def get_cache_dir(*subdirs):
+    """Return the podoc cache directory, creating it if needed.
+
+    It is `~/.podoc` by default, and can be changed with the `PODOC_CACHE_DIR`
+    environment variable.
+
+    """
+    path = os.environ.get('PODOC_CACHE_DIR', None)
+    path = path or op.join(op.expanduser('~'), '.podoc')
+    path = op.join(path, *subdirs)
+    if not op.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:  # pragma: no cover
+            # The directory may have been created by another process.
+            if not op.isdir(path):
+                raise
+    return path
+
+
 def _get_file(file_or_path, mode=None):
     if isinstance(file_or_path, string_types):
         return open(file_or_path, mode)
@@ -134,8 +194,8 @@ def _are_dict_equal(t0, t1):
     elif isinstance(t0, (string_types, int)):
         assert isinstance(t1, (string_types, int))
         return t0 == t1
-    assert isinstance(t0, dict)
-    assert isinstance(t1, dict)
+    assert isinstance(t0, Mapping)
+    assert isinstance(t1, Mapping)
     k0 = {k for k in t0.keys() if not k.startswith('_')}
     k1 = {k for k in t1.keys() if not k.startswith('_')}
     assert k0 == k1
@@ -144,7 +204,7 @@ def _are_dict_equal(t0, t1):
 
 def _remove(d, to_remove=()):
     to_remove = to_remove or ('_',)
-    if isinstance(d, dict):
+    if isinstance(d, Mapping):
         return {k: _remove(v, to_remove)
                 for k, v in d.items()
                 if not k.startswith(to_remove)}
@@ -157,8 +217,8 @@ def assert_equal(p0, p1, to_remove=()):
     if isinstance(p0, string_types):
         assert isinstance(p1, string_types)
         assert p0.rstrip('\n') == p1.rstrip('\n')
-    elif isinstance(p0, dict):
-        assert isinstance(p1, dict)
+    elif isinstance(p0, Mapping):
+        assert isinstance(p1, Mapping)
         # p0.show()
         # p1.show()
         assert _remove(p0, to_remove) == _remove(p1, to_remove)
@@ -204,17 +264,136 @@ def get_pandoc_formats():
     return pypandoc.get_pandoc_formats()
 
 
-def has_pandoc():  # pragma: no cover
+def _load_pandoc_cache():
+    """Load the disk cache of the pandoc lookups and of the pandoc info."""
+    cache_path = op.join(get_cache_dir(), 'pandoc.json')
+    if op.exists(cache_path):
+        try:
+            return json.loads(load_text(cache_path))
+        except ValueError:  # pragma: no cover
+            logger.debug("Invalid pandoc cache file %s.", cache_path)
+    return {}
+
+
+def _save_pandoc_cache(cache):
+    cache_path = op.join(get_cache_dir(), 'pandoc.json')
+    _write_atomic(json.dumps(cache, sort_keys=True, indent=1), cache_path)
+
+
+def _pypandoc_lookup_key():
+    """Return the cache key of the lookup of pandoc by pypandoc, or None if
+    pypandoc is not installed.
+
+    The key changes with the PATH, and with the modification times of the
+    pypandoc package, which may bundle pandoc, and of `~/bin`, where
+    pypandoc downloads pandoc.
+
+    """
+    try:
+        from importlib.util import find_spec
+        spec = find_spec('pypandoc')
+        origin = op.dirname(spec.origin) if spec and spec.origin else None
+    except ImportError:  # pragma: no cover
+        # Python 2.
+        import imp
+        try:
+            origin = imp.find_module('pypandoc')[1]
+        except ImportError:
+            origin = None
+    if origin is None:
+        return
+    mtimes = [str(os.stat(d).st_mtime) if op.isdir(d) else ''
+              for d in (origin, op.expanduser('~/bin'))]
+    return ':'.join(['pypandoc', os.environ.get('PATH', '')] + mtimes)
+
+
+def _pypandoc_pandoc_path():
+    """Return the path of the pandoc binary found by pypandoc, or None.
+
+    pypandoc may run the candidate binaries, so the result of the lookup,
+    found or not, is cached on disk.
+
+    """
+    key = _pypandoc_lookup_key()
+    if key is None:
+        return
+    cache = _load_pandoc_cache()
+    if key in cache:
+        return cache[key]
     try:
         with captured_output():
             import pypandoc
-            pypandoc.get_pandoc_version()
-        return True
-    except (OSError, ImportError):
+            path = pypandoc.get_pandoc_path()
+        # NOTE: pypandoc returns `pandoc` when pandoc is in the PATH.
+        path = which(path) or path
+    except (ImportError, AttributeError, OSError):
+        path = None
+    cache[key] = path
+    _save_pandoc_cache(cache)
+    return path
+
+
+def _find_pandoc():
+    """Return the real path of the pandoc binary, or None if it is not
+    found.
+
+    pandoc is first looked up in `$PYPANDOC_PANDOC` and in the PATH,
+    without running it. Otherwise, pypandoc looks for the pandoc binary it
+    bundles or has downloaded, and the usual install locations.
+
+    """
+    path = os.environ.get('PYPANDOC_PANDOC', None) or which('pandoc')
+    if not (path and op.isfile(path)):
+        path = _pypandoc_pandoc_path()
+    if path and op.isfile(path):
+        return op.realpath(path)
+
+
+def _query_pandoc():
+    """Run pandoc to get its version and its formats."""
+    with captured_output():
+        import pypandoc
+        version = pypandoc.get_pandoc_version()
+        input_formats, output_formats = pypandoc.get_pandoc_formats()
+    return Bunch(version=version,
+                 input_formats=input_formats,
+                 output_formats=output_formats,
+                 )
+
+
+def get_pandoc_info():
+    """Return the version and the input and output formats of pandoc, or
+    None if pandoc is not available.
+
+    The information is cached on disk, keyed by the path and modification
+    time of the pandoc binary, so that pandoc only runs the first time a
+    given binary is found.
+
+    """
+    path = _find_pandoc()
+    if path is None:
+        logger.info("pandoc is not installed.")
+        return
+    key = '{}:{}'.format(path, os.stat(path).st_mtime)
+    cache = _load_pandoc_cache()
+    if key in cache:
+        return Bunch(cache[key])
+    try:
+        info = _query_pandoc()
+    except ImportError:
         logger.info("pypandoc is not installed.")
-    except FileNotFoundError:
+        return
+    except (OSError, FileNotFoundError):
         logger.info("pandoc is not installed.")
-    return False
+        return
+    # NOTE: entries of other pandoc binaries are kept.
+    cache[key] = info
+    _save_pandoc_cache(cache)
+    return info
+
+
+def has_pandoc():  # pragma: no cover
+    return get_pandoc_info() is not None
 
 
 def generate_json_test_files():  # pragma: no cover